@@ -11,14 +11,21 @@ echo "[entrypoint] NOTIFY_CHANNELS=${NOTIFY_CHANNELS:-<UNSET>}"
 echo "[entrypoint] DEBOUNCE_SECONDS=${DEBOUNCE_SECONDS:-<UNSET>}"
 echo "[entrypoint] RUN_ONCE=${RUN_ONCE:-<UNSET>}"
 
-# --- wymagane env: tylko tick, bez fallbacków ---
-if [[ -z "${PERIODIC_TICK_SEC:-}" ]]; then
-  echo "FATAL: missing env PERIODIC_TICK_SEC" >&2
-  exit 64
-fi
-if ! [[ "${PERIODIC_TICK_SEC}" =~ ^[0-9]+([.][0-9]+)?$ ]]; then
-  echo "FATAL: PERIODIC_TICK_SEC must be numeric seconds, got: '${PERIODIC_TICK_SEC}'" >&2
-  exit 64
+case "${RUN_ONCE:-}" in
+  1|true|TRUE|yes|on) run_once=1 ;;
+  *) run_once=0 ;;
+esac
+
+# --- wymagane env: tylko tick, bez fallbacków (RUN_ONCE: jeden przebieg, tick nieużywany) ---
+if [[ "${run_once}" -ne 1 ]]; then
+  if [[ -z "${PERIODIC_TICK_SEC:-}" ]]; then
+    echo "FATAL: missing env PERIODIC_TICK_SEC" >&2
+    exit 64
+  fi
+  if ! [[ "${PERIODIC_TICK_SEC}" =~ ^[0-9]+([.][0-9]+)?$ ]]; then
+    echo "FATAL: PERIODIC_TICK_SEC must be numeric seconds, got: '${PERIODIC_TICK_SEC}'" >&2
+    exit 64
+  fi
 fi
 
 # --- wymagane env DB (PG* lub DB_*) ---
@@ -38,25 +45,8 @@ case ":${PYTHONPATH}:" in
 esac
 echo "[entrypoint] PYTHONPATH=${PYTHONPATH}"
 
-# --- preflight import: pokaż pełny traceback, jeśli coś nie gra ---
-python - <<'PY'
-import os, sys, traceback
-print(f"[preflight] python={sys.version.split()[0]} cwd={os.getcwd()}")
-print(f"[preflight] sys.path[0:3]={sys.path[0:3]}")
-try:
-    import energy_calc.main as m
-    print("[preflight] import energy_calc.main OK")
-    # sprawdź, czy ma funkcję main
-    assert hasattr(m, "main"), "energy_calc.main missing function main()"
-except Exception:
-    print("[preflight] import FAILED — traceback below:", flush=True)
-    traceback.print_exc()
-    sys.exit(42)
-PY
-
-echo "[preflight] ok"
-
-# --- uruchom właściwy proces (wywołanie main()) ---
-# jeśli chcesz być niezależny od strażnika __name__ == '__main__':
-exec python -c "from energy_calc.main import main; main()"
-# alternatywa (gdy masz w pliku guard): exec python -m energy_calc.main
+# --- uruchom właściwy proces ---
+# Preflight (import pipeline z pełnym tracebackiem → kod 42, w RUN_ONCE także pierwsze zapytanie do bazy)
+# odbywa się w tym samym procesie — jeden start interpretera i jeden import pandas.
+# Kod wyjścia main(): 0 ok, 42 import, 64 konfiguracja, 69 baza niedostępna, 70 błąd przebiegu.
+exec python -c "import sys; from energy_calc.main import main; sys.exit(main())"
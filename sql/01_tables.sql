@@ -82,5 +82,186 @@ CREATE TABLE IF NOT EXISTS output.energy_broker_detail (
     alloc_ch_arbi_mw        numeric,
     alloc_dis_arbi_mw       numeric,
 
-    note                    text
+    note                    text,
+    constraint_mask         smallint                -- bity aktywnych ograniczeń (widok energy_constraint_codes)
 );
+
+-- Tabela: model N-torowy (params.tracks) — format długi, wiersz = (krok, tor)
+CREATE TABLE IF NOT EXISTS output.energy_tracks_detail (
+    track_id                    text NOT NULL,
+    kind                        text NOT NULL,             -- oze | arbi | reserve
+
+    ts_start                    timestamp without time zone NOT NULL,
+    ts_end                      timestamp without time zone NOT NULL,
+    step_hours                  numeric NOT NULL,
+
+    soc_start_mwh               numeric,
+    soc_end_mwh                 numeric,
+
+    p_ch_mw                     numeric,
+    p_dis_mw                    numeric,
+    e_ch_mwh                    numeric,
+    e_dis_mwh                   numeric,
+
+    loss_conv_mwh               numeric,
+    loss_idle_mwh               numeric,
+    loss_total_mwh              numeric,
+
+    spill_surplus_mwh           numeric,                   -- tylko oze
+    unmet_deficit_mwh           numeric,                   -- tylko oze
+    price_pln_mwh               numeric,                   -- tylko arbi
+    cost_pln                    numeric,                   -- tylko arbi
+    revenue_pln                 numeric,                   -- tylko arbi
+    net_value_pln               numeric,                   -- tylko arbi
+
+    alloc_ch_mw                 numeric,                   -- broker: przydział wg priorytetu
+    alloc_dis_mw                numeric,
+
+    soc_gap_to_min_start_mwh    numeric,
+    soc_gap_to_min_end_mwh      numeric,
+    time_below_min_h            numeric,
+
+    hit_part_cap_max            boolean,
+    hit_part_cap_min            boolean
+);
+
+-- Tabela: skróty bloków wierszy tabel *_detail (zapis różnicowy, detail_writer.py)
+CREATE TABLE IF NOT EXISTS output.energy_detail_blocks (
+    table_name              text NOT NULL,
+    block_no                integer NOT NULL,
+    ts_min                  timestamp without time zone NOT NULL,
+    ts_max                  timestamp without time zone NOT NULL,
+    n_rows                  integer NOT NULL,
+    block_hash              text NOT NULL,
+    PRIMARY KEY (table_name, block_no)
+);
+
+-- Indeksy po ts_start (zakresowe DELETE zapisu różnicowego, zapytania raportowe)
+CREATE INDEX IF NOT EXISTS energy_oze_detail_ts_start_idx    ON output.energy_oze_detail (ts_start);
+CREATE INDEX IF NOT EXISTS energy_arbi_detail_ts_start_idx   ON output.energy_arbi_detail (ts_start);
+CREATE INDEX IF NOT EXISTS energy_broker_detail_ts_start_idx ON output.energy_broker_detail (ts_start);
+CREATE INDEX IF NOT EXISTS energy_tracks_detail_ts_start_idx ON output.energy_tracks_detail (ts_start);
+CREATE INDEX IF NOT EXISTS energy_tracks_detail_track_idx    ON output.energy_tracks_detail (track_id, ts_start);
+
+-- Rozdzielczość kroku symulacji (SIM_RESOLUTION, resample.py): 15min | 1h | … | native
+-- oraz maska ograniczeń brokera (constraint_mask, engines/broker.py) w tabelach sprzed tych kolumn.
+-- ALTER tylko gdy kolumny brak: plik wykonywany jest przy każdym zapisie, w jego transakcji,
+-- a ALTER TABLE (także z IF NOT EXISTS) bierze blokadę wyłączną aż do commitu.
+DO $$
+DECLARE t text;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['energy_oze_detail', 'energy_arbi_detail', 'energy_broker_detail', 'energy_tracks_detail'] LOOP
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = 'output' AND table_name = t AND column_name = 'sim_resolution') THEN
+      EXECUTE format('ALTER TABLE output.%I ADD COLUMN sim_resolution text', t);
+    END IF;
+  END LOOP;
+  IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                 WHERE table_schema = 'output' AND table_name = 'energy_broker_detail'
+                   AND column_name = 'constraint_mask') THEN
+    ALTER TABLE output.energy_broker_detail ADD COLUMN constraint_mask smallint;
+  END IF;
+END $$;
+
+-- Tabela: punkty kontrolne przebiegów strumieniowych (wznawianie po awarii, checkpoint.py)
+CREATE TABLE IF NOT EXISTS output.energy_rebuild_checkpoint (
+    run_id                  text PRIMARY KEY,
+    status                  text NOT NULL,                 -- running | done | abandoned
+    params_hash             text NOT NULL,
+    last_ts                 timestamptz,                   -- ts ostatniego zapisanego kroku
+    chunks_done             integer NOT NULL DEFAULT 0,
+    rows_done               bigint  NOT NULL DEFAULT 0,
+    soc_oze_mwh             double precision,              -- SOC po last_ts (bez zaokrąglenia)
+    soc_arbi_mwh            double precision,
+    state                   jsonb NOT NULL DEFAULT '{}'::jsonb,  -- histogram Δt, sumy KPI
+    started_at              timestamptz NOT NULL DEFAULT now(),
+    updated_at              timestamptz NOT NULL DEFAULT now()
+);
+
+-- Tabela: agregaty godzinowe / dzienne / miesięczne torów (liczone przez silnik, rollups.py)
+CREATE TABLE IF NOT EXISTS output.energy_rollup (
+    resolution                  text NOT NULL,             -- hour | day | month
+    track                       text NOT NULL,             -- oze | arbi
+    bucket_start                timestamp without time zone NOT NULL,
+
+    n_steps                     integer NOT NULL,
+    hours                       numeric,
+
+    e_ch_mwh                    numeric,
+    e_dis_mwh                   numeric,
+    loss_conv_mwh               numeric,
+    loss_idle_mwh               numeric,
+    loss_total_mwh              numeric,
+    spill_surplus_mwh           numeric,                   -- tylko oze
+    unmet_deficit_mwh           numeric,                   -- tylko oze
+    cost_pln                    numeric,                   -- tylko arbi
+    revenue_pln                 numeric,                   -- tylko arbi
+    net_value_pln               numeric,                   -- tylko arbi
+
+    soc_start_mwh               numeric,                   -- SOC na początku pierwszego kroku
+    soc_min_mwh                 numeric,
+    soc_max_mwh                 numeric,
+    soc_end_mwh                 numeric,                   -- SOC na koniec ostatniego kroku
+    time_below_min_h            numeric,
+    hit_cap_max_n               integer,
+    hit_cap_min_n               integer,
+
+    PRIMARY KEY (resolution, track, bucket_start)         -- indeks dla zapytań raportowych
+);
+
+-- wyniki optymalizatora progów/wielkości magazynu (energy_calc.optimizer); jeden run_id = jedno uruchomienie
+CREATE TABLE IF NOT EXISTS output.energy_optimizer_result (
+    run_id                      text NOT NULL,
+    candidate_no                integer NOT NULL,          -- 0 = najlepszy wynik celu
+    created_at                  timestamptz NOT NULL DEFAULT now(),
+    objective                   text NOT NULL,             -- net | oze
+    round                       integer NOT NULL,          -- 0 = siatka zgrubna, dalej zagęszczanie
+
+    arbi_price_low              numeric,
+    arbi_price_high             numeric,
+    procent_arbitrazu           numeric,
+    emax                        numeric,
+
+    net_pln                     numeric,
+    spill_mwh                   numeric,
+    unmet_mwh                   numeric,
+    score                       numeric,
+    feasible                    boolean NOT NULL,
+    pareto                      boolean NOT NULL,          -- front net vs spill+unmet
+    is_best                     boolean NOT NULL,
+
+    PRIMARY KEY (run_id, candidate_no)
+);
+
+-- status przebiegów w pamięci (energy_calc.run_status): running → provisional → final | failed
+CREATE TABLE IF NOT EXISTS output.energy_run_status (
+    run_id                      text PRIMARY KEY,
+    phase                       text NOT NULL,             -- running | provisional | final | failed
+    resolution                  text,                      -- krok wyniku opublikowanego w tej fazie
+    stages                      text,                      -- przeliczane etapy (broker,oze,arbi,tracks)
+    error                       text,
+    started_at                  timestamptz NOT NULL DEFAULT now(),
+    provisional_at              timestamptz,
+    final_at                    timestamptz,
+    updated_at                  timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS energy_run_status_started_idx ON output.energy_run_status (started_at DESC);
+
+-- agregaty dokładne sprzed publikacji zgrubnej (run_status.publish_provisional); przywracane przy `failed`
+CREATE TABLE IF NOT EXISTS output.energy_rollup_prev (
+    run_id                      text NOT NULL,             -- przebieg, który opublikował wynik zgrubny
+    LIKE output.energy_rollup INCLUDING ALL
+);
+
+-- anomalie wejścia z ostatniego kondycjonowania (energy_calc.conditioning; zastępowane przy zmianie)
+CREATE TABLE IF NOT EXISTS output.energy_input_anomalies (
+    run_id                      text NOT NULL,
+    kind                        text NOT NULL,             -- null_ts | unsorted | duplicate_ts | dst_duplicate | gap | dst_gap
+    ts_start                    timestamp without time zone,  -- duplikat: ts; luka: ostatni ts przed luką
+    ts_end                      timestamp without time zone,  -- luka: pierwszy ts po luce
+    n_rows                      integer NOT NULL,          -- wiersze zdublowane / brakujące kroki / odrzucone
+    action                      text NOT NULL,             -- dropped | sorted | kept_last | kept_first | kept | filled
+    detail                      text,
+    detected_at                 timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS energy_input_anomalies_ts_idx ON output.energy_input_anomalies (ts_start);
@@ -62,3 +62,29 @@ SELECT
 FROM j
 CROSS JOIN p
 ORDER BY j.ts_start;
+
+-- Kody bitów output.energy_broker_detail.constraint_mask (engines/broker.py: CONSTRAINT_CODES)
+CREATE OR REPLACE VIEW output.energy_constraint_codes AS
+SELECT bit, (1 << bit)::smallint AS mask, code, description
+FROM (VALUES
+  (0,  'CONTRACT_CH',  'ładowanie obcięte mocą umowną'),
+  (1,  'CONTRACT_DIS', 'rozładowanie obcięte mocą umowną'),
+  (2,  'C_RATE_CH',    'ładowanie obcięte łączną mocą ładowania magazynu'),
+  (3,  'C_RATE_DIS',   'rozładowanie obcięte łączną mocą rozładowania magazynu'),
+  (4,  'OZE_CUT_CH',   'alokacja ładowania OZE mniejsza od żądania'),
+  (5,  'OZE_CUT_DIS',  'alokacja rozładowania OZE mniejsza od żądania'),
+  (6,  'ARBI_CUT_CH',  'alokacja ładowania ARBI mniejsza od żądania'),
+  (7,  'ARBI_CUT_DIS', 'alokacja rozładowania ARBI mniejsza od żądania'),
+  (8,  'OZE_SOC_MAX',  'tor OZE oparty o soc_max'),
+  (9,  'OZE_SOC_MIN',  'tor OZE oparty o soc_min'),
+  (10, 'ARBI_SOC_MAX', 'tor ARBI oparty o soc_max'),
+  (11, 'ARBI_SOC_MIN', 'tor ARBI oparty o soc_min'),
+  (12, 'OZE_C_RATE',   'tor OZE na własnym limicie mocy'),
+  (13, 'ARBI_C_RATE',  'tor ARBI na własnym limicie mocy')
+) AS c(bit, code, description);
+
+-- Kroki brokera rozpisane na aktywne ograniczenia (wiersz = krok × kod)
+CREATE OR REPLACE VIEW output.energy_broker_constraints AS
+SELECT b.ts_start, b.ts_end, c.code, c.bit
+FROM output.energy_broker_detail b
+JOIN output.energy_constraint_codes c ON (b.constraint_mask & c.mask) <> 0;
@@ -0,0 +1,337 @@
+# src/energy_calc/archive.py
+"""
+Archiwum opublikowanych przebiegów (lokalny wolumen) i porównanie dwóch przebiegów.
+
+  ARCHIVE_DIR=/var/lib/energy-calc/archive   → worker archiwizuje każdy przebieg w pamięci
+                                               (strumieniowy — pomijany, wynik tylko w bazie)
+  ARCHIVE_KEEP_RUNS=30                       → ile ostatnich przebiegów zostaje (0 = bez limitu)
+  ARCHIVE_KEEP_DAYS=0                        → usuń przebiegi starsze niż N dni (0 = bez limitu)
+  ARCHIVE_ROW_GROUP=65536                    → wiersze na grupę w plikach Parquet
+
+Przebieg = katalog `run_<run_id>/`: tabele wyniku (broker, oze, arbi, tracks) jako Parquet
+(zstd, kolumnowo — porównanie czyta tylko potrzebne kolumny) + meta.json (Params, KPI,
+rozdzielczość, odcisk wejścia). Katalog powstaje pod nazwą tymczasową i jest podmieniany
+atomowo (rename) — niedokończony zapis nie jest widoczny jako przebieg.
+
+  python -m energy_calc.archive list
+  python -m energy_calc.archive compare latest~1 latest [--tables oze,arbi] [--columns soc_end_mwh]
+
+`latest` / `latest~N` — kolejność wg `created_at` z meta.json.
+
+Porównanie: pierwszy rozbieżny ts_start per tabela i kolumna (|a − b| > --atol, NULL vs wartość),
+delty KPI i różnice parametrów; wynik JSON na stdout. Wymaga pyarrow (pip install .[arrow]).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT = "energy-calc-archive"
+ARCHIVE_VERSION = 1
+RUN_PREFIX = "run_"
+TABLES = ("broker", "oze", "arbi", "tracks")
+KEY = "ts_start"
+
+# KPI przebiegu: nazwa → (tabela, kolumna sumowana)
+KPI_COLS: Dict[str, Tuple[str, str]] = {
+    "oze_e_ch_mwh": ("oze", "e_ch_mwh"),
+    "oze_e_dis_mwh": ("oze", "e_dis_mwh"),
+    "oze_spill_mwh": ("oze", "spill_surplus_mwh"),
+    "oze_unmet_mwh": ("oze", "unmet_deficit_mwh"),
+    "oze_loss_mwh": ("oze", "loss_total_mwh"),
+    "arbi_e_ch_mwh": ("arbi", "e_ch_mwh"),
+    "arbi_e_dis_mwh": ("arbi", "e_dis_mwh"),
+    "arbi_loss_mwh": ("arbi", "loss_total_mwh"),
+    "arbi_net_pln": ("arbi", "net_value_pln"),
+}
+
+
+def _pyarrow_parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:  # pragma: no cover - zależność opcjonalna
+        raise ImportError("Archiwum przebiegów wymaga pyarrow (pip install .[arrow])") from e
+    return pa, pq
+
+
+def archive_dir_from_env() -> Optional[str]:
+    d = os.getenv("ARCHIVE_DIR", "").strip()
+    return d or None
+
+
+def run_path(archive_dir: str, run_id: str) -> str:
+    return os.path.join(archive_dir, f"{RUN_PREFIX}{run_id}")
+
+
+def list_runs(archive_dir: str) -> List[str]:
+    """
+    run_id zarchiwizowanych przebiegów, od najstarszego — wg `created_at` z meta.json
+    (run_id z tej samej sekundy różnią się tylko losowym sufiksem).
+    """
+    if not os.path.isdir(archive_dir):
+        return []
+    runs = []
+    for name in os.listdir(archive_dir):
+        meta_path = os.path.join(archive_dir, name, "meta.json")
+        if not name.startswith(RUN_PREFIX) or not os.path.isfile(meta_path):
+            continue
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                created = pd.Timestamp(json.load(f)["created_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            created = pd.Timestamp(os.path.getmtime(meta_path), unit="s", tz="UTC")
+        runs.append((created, name[len(RUN_PREFIX):]))
+    return [r for _, r in sorted(runs)]
+
+
+# ---------- zapis ----------
+
+def kpi(frames: Dict[str, pd.DataFrame]) -> Dict[str, float]:
+    out = {}
+    for name, (table, col) in KPI_COLS.items():
+        df = frames.get(table)
+        out[name] = float(df[col].sum()) if df is not None and col in df.columns and len(df) else 0.0
+    return out
+
+
+def save_run(archive_dir: str, result) -> str:
+    """Archiwizuje RebuildResult (ramki w pamięci); zwraca ścieżkę katalogu przebiegu."""
+    pa, pq = _pyarrow_parquet()
+    frames = {"broker": result.df_broker, "oze": result.df_oze, "arbi": result.df_arbi,
+              "tracks": result.df_tracks}
+    frames = {t: df for t, df in frames.items() if df is not None and len(df)}
+    final = run_path(archive_dir, result.run_id)
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    row_group = max(1024, int(os.getenv("ARCHIVE_ROW_GROUP", "65536") or 65536))
+    for table, df in frames.items():
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), os.path.join(tmp, f"{table}.parquet"),
+                       compression="zstd", row_group_size=row_group)
+    meta = {
+        "format": ARCHIVE_FORMAT,
+        "version": ARCHIVE_VERSION,
+        "run_id": result.run_id,
+        "created_at": pd.Timestamp.now(tz="UTC").isoformat(),
+        "resolution": result.resolution,
+        "input_fingerprint": result.input_fingerprint,
+        "rows": {t: int(len(df)) for t, df in frames.items()},
+        "kpi": kpi(frames),
+        "params": result.params.model_dump(mode="json"),
+        "timings": {k: float(v) for k, v in result.timings.items()},
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    size = sum(os.path.getsize(os.path.join(final, n)) for n in os.listdir(final))
+    log.info("Run archived: %s (%s, %.1f KiB)", final,
+             ", ".join(f"{t}={n}" for t, n in meta["rows"].items()), size / 1024.0)
+    prune(archive_dir)
+    return final
+
+
+def prune(archive_dir: str, keep_runs: Optional[int] = None, keep_days: Optional[float] = None) -> List[str]:
+    """Retencja: zostaje `keep_runs` najnowszych i nie starszych niż `keep_days`; zwraca usunięte run_id."""
+    keep_runs = int(os.getenv("ARCHIVE_KEEP_RUNS", "30") or 0) if keep_runs is None else keep_runs
+    keep_days = float(os.getenv("ARCHIVE_KEEP_DAYS", "0") or 0) if keep_days is None else keep_days
+    runs = list_runs(archive_dir)
+    drop = set(runs[:-keep_runs]) if keep_runs > 0 else set()
+    if keep_days > 0:
+        cutoff = time.time() - keep_days * 86400.0
+        drop |= {r for r in runs[:-1] if os.path.getmtime(os.path.join(run_path(archive_dir, r), "meta.json")) < cutoff}
+    for r in sorted(drop):
+        shutil.rmtree(run_path(archive_dir, r), ignore_errors=True)
+    if drop:
+        log.info("Archive retention: removed %d run(s), %d left", len(drop), len(runs) - len(drop))
+    return sorted(drop)
+
+
+# ---------- odczyt ----------
+
+def resolve_run(archive_dir: str, ref: str) -> str:
+    """run_id / ścieżka katalogu / `latest`, `latest~N` → katalog przebiegu."""
+    if os.path.isdir(ref):
+        return ref
+    runs = list_runs(archive_dir)
+    if ref == "latest" or ref.startswith("latest~"):
+        back = int(ref.split("~", 1)[1]) if "~" in ref else 0
+        if back >= len(runs):
+            raise ValueError(f"{ref}: w archiwum jest {len(runs)} przebiegów")
+        return run_path(archive_dir, runs[-1 - back])
+    path = run_path(archive_dir, ref)
+    if not os.path.isdir(path):
+        raise ValueError(f"Brak przebiegu {ref!r} w {archive_dir}")
+    return path
+
+
+def read_meta(run_dir: str) -> Dict[str, Any]:
+    with open(os.path.join(run_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != ARCHIVE_FORMAT:
+        raise ValueError(f"{run_dir}: to nie jest przebieg archiwum ({meta.get('format')!r})")
+    if int(meta.get("version", 0)) > ARCHIVE_VERSION:
+        raise ValueError(f"{run_dir}: wersja archiwum {meta.get('version')} nowsza niż obsługiwana ({ARCHIVE_VERSION})")
+    return meta
+
+
+def table_columns(run_dir: str, table: str) -> List[str]:
+    _, pq = _pyarrow_parquet()
+    path = os.path.join(run_dir, f"{table}.parquet")
+    return list(pq.read_schema(path).names) if os.path.isfile(path) else []
+
+
+def read_columns(run_dir: str, table: str, columns: List[str]) -> pd.DataFrame:
+    """Tylko wskazane kolumny tabeli przebiegu (odczyt kolumnowy)."""
+    _, pq = _pyarrow_parquet()
+    return pq.read_table(os.path.join(run_dir, f"{table}.parquet"), columns=columns).to_pandas()
+
+
+# ---------- porównanie ----------
+
+def _flatten(d: Any, prefix: str = "") -> Dict[str, Any]:
+    if isinstance(d, dict):
+        out: Dict[str, Any] = {}
+        for k, v in d.items():
+            out.update(_flatten(v, f"{prefix}{k}."))
+        return out
+    return {prefix[:-1]: d}
+
+
+def params_diff(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    fa, fb = _flatten(a), _flatten(b)
+    return {k: {"a": fa.get(k), "b": fb.get(k)} for k in sorted(set(fa) | set(fb)) if fa.get(k) != fb.get(k)}
+
+
+def _align(ka: np.ndarray, kb: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Indeksy wierszy o wspólnym kluczu (ts_start, ewentualnie track_id) w obu przebiegach."""
+    if len(ka) == len(kb) and np.array_equal(ka, kb):
+        idx = np.arange(len(ka))
+        return idx, idx
+    _, ia, ib = np.intersect1d(ka, kb, assume_unique=False, return_indices=True)
+    return ia, ib
+
+
+def _keys(df: pd.DataFrame) -> np.ndarray:
+    ts = pd.to_datetime(df[KEY]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    if "track_id" not in df.columns:
+        return ts
+    return (df["track_id"].astype(str) + "@" + pd.Series(ts).astype(str)).to_numpy()
+
+
+def compare_table(run_a: str, run_b: str, table: str, columns: Optional[List[str]] = None,
+                  atol: float = 1e-6) -> Dict[str, Any]:
+    """Rozbieżności kolumn tabeli: liczba wierszy, maks. |Δ|, pierwszy rozbieżny ts_start."""
+    cols_a, cols_b = table_columns(run_a, table), table_columns(run_b, table)
+    if not cols_a or not cols_b:
+        return {"error": "table missing in " + ("both runs" if not (cols_a or cols_b) else "a" if not cols_a else "b")}
+    common = [c for c in cols_a if c in set(cols_b)]
+    value_cols = [c for c in (columns or common) if c in common and c not in (KEY, "track_id", "ts_end")]
+    key_cols = [KEY] + (["track_id"] if "track_id" in common else [])
+    a = read_columns(run_a, table, key_cols + value_cols)
+    b = read_columns(run_b, table, key_cols + value_cols)
+    ia, ib = _align(_keys(a), _keys(b))
+    ts = pd.to_datetime(a[KEY]).to_numpy()[ia]
+
+    out_cols: Dict[str, Any] = {}
+    first = None
+    for c in value_cols:
+        va, vb = a[c].to_numpy()[ia], b[c].to_numpy()[ib]
+        if va.dtype.kind in "fiub" and vb.dtype.kind in "fiub":
+            fa, fb = va.astype(float), vb.astype(float)
+            na, nb = np.isnan(fa), np.isnan(fb)
+            with np.errstate(invalid="ignore"):
+                d = np.abs(fa - fb)
+            both = ~na & ~nb
+            bad = (na != nb) | (both & (d > atol))
+            max_abs = float(np.max(d[bad & both])) if (bad & both).any() else None
+        else:
+            sa, sb = pd.Series(va), pd.Series(vb)
+            bad = ~((sa == sb) | (sa.isna() & sb.isna())).to_numpy()
+            max_abs = None
+        n_bad = int(bad.sum())
+        if n_bad:
+            t = ts[bad].min()
+            first = t if first is None else min(first, t)
+            out_cols[c] = {"rows": n_bad, "max_abs_diff": max_abs, "first_ts": str(pd.Timestamp(t))}
+    return {
+        "rows_a": int(len(a)), "rows_b": int(len(b)),
+        "only_a": int(len(a) - len(ia)), "only_b": int(len(b) - len(ib)),
+        "first_divergent_ts": None if first is None else str(pd.Timestamp(first)),
+        "columns": out_cols,
+    }
+
+
+def compare_runs(archive_dir: str, ref_a: str, ref_b: str, tables: Optional[List[str]] = None,
+                 columns: Optional[List[str]] = None, atol: float = 1e-6) -> Dict[str, Any]:
+    run_a, run_b = resolve_run(archive_dir, ref_a), resolve_run(archive_dir, ref_b)
+    meta_a, meta_b = read_meta(run_a), read_meta(run_b)
+    ka, kb = meta_a.get("kpi") or {}, meta_b.get("kpi") or {}
+    diff_tables = {t: compare_table(run_a, run_b, t, columns, atol) for t in (tables or TABLES)
+                   if table_columns(run_a, t) or table_columns(run_b, t)}
+    firsts = [r["first_divergent_ts"] for r in diff_tables.values() if r.get("first_divergent_ts")]
+    return {
+        "a": {"run_id": meta_a["run_id"], "created_at": meta_a.get("created_at"), "resolution": meta_a.get("resolution")},
+        "b": {"run_id": meta_b["run_id"], "created_at": meta_b.get("created_at"), "resolution": meta_b.get("resolution")},
+        "same_input": meta_a.get("input_fingerprint") == meta_b.get("input_fingerprint"),
+        "first_divergent_ts": min(firsts) if firsts else None,
+        "kpi": {k: {"a": ka.get(k), "b": kb.get(k), "delta": (kb[k] - ka[k]) if k in ka and k in kb else None}
+                for k in sorted(set(ka) | set(kb))},
+        "params_diff": params_diff(meta_a.get("params") or {}, meta_b.get("params") or {}),
+        "tables": diff_tables,
+    }
+
+
+# ---------- CLI ----------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m energy_calc.archive", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--dir", default=archive_dir_from_env(), help="katalog archiwum (domyślnie ARCHIVE_DIR)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="zarchiwizowane przebiegi (run_id, KPI)")
+    c = sub.add_parser("compare", help="różnice dwóch przebiegów (run_id, latest, latest~N lub ścieżka)")
+    c.add_argument("a")
+    c.add_argument("b")
+    c.add_argument("--tables", default=None, help="np. oze,arbi (domyślnie wszystkie)")
+    c.add_argument("--columns", default=None, help="porównywane kolumny (domyślnie wszystkie wspólne)")
+    c.add_argument("--atol", type=float, default=1e-6)
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        stream=sys.stderr,
+    )
+    if not args.dir:
+        ap.error("brak katalogu archiwum (--dir lub ARCHIVE_DIR)")
+    t0 = time.perf_counter()
+    if args.cmd == "list":
+        runs = []
+        for r in list_runs(args.dir):
+            meta = read_meta(run_path(args.dir, r))
+            runs.append({"run_id": r, "created_at": meta.get("created_at"), "resolution": meta.get("resolution"),
+                         "rows": meta.get("rows"), "kpi": meta.get("kpi")})
+        print(json.dumps({"dir": args.dir, "runs": runs}, ensure_ascii=False))
+        return 0
+    split = lambda s: [x.strip() for x in s.split(",") if x.strip()] if s else None  # noqa: E731
+    report = compare_runs(args.dir, args.a, args.b, tables=split(args.tables), columns=split(args.columns),
+                          atol=args.atol)
+    report["elapsed_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    print(json.dumps(report, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
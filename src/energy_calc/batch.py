@@ -0,0 +1,267 @@
+# src/energy_calc/batch.py
+"""
+Silniki bez bazy: API `simulate(input, params)` i CLI wsadowe na plikach Parquet/CSV.
+
+Wejście: kolumny jak w output.delta_brutto (ts_utc, delta_brutto, price_pln_mwh; cena opcjonalna).
+Parametry: obiekt Params, słownik surowych kluczy params.* albo plik JSON/YAML — te same
+przeliczenia co `load_params` (params.loader.params_from_dict).
+Parquet czytany z mapowaniem pamięci i projekcją kolumn (pyarrow, `pip install .[arrow]`).
+
+Użycie:
+  python -m energy_calc.batch --input delta.parquet --params a.yaml [--params b.json …] --out wyniki/
+        [--resolution 1h [--fine-window-h 48]]
+    → wyniki/<scenariusz>/{broker,oze,arbi,rollup[,tracks]}.parquet + JSON z KPI na stdout
+
+  from energy_calc.batch import simulate
+  res = simulate("delta.parquet", {"emax": 10, …})
+  res.arbi["net_value_pln"].sum()
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from .engines.broker import constraint_counts
+from . import daymaps
+from . import resample
+from .models import Params
+from .params.loader import load_params_file, params_from_dict
+
+log = logging.getLogger(__name__)
+
+INPUT_COLS = ["ts_utc", "delta_brutto", "price_pln_mwh"]
+
+InputLike = Union[pd.DataFrame, str, "os.PathLike[str]"]
+ParamsLike = Union[Params, Mapping[str, Any], str, "os.PathLike[str]"]
+
+
+@dataclass
+class SimulationResult:
+    params: Params
+    broker: pd.DataFrame
+    oze: pd.DataFrame
+    arbi: pd.DataFrame
+    rollup: Optional[pd.DataFrame] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    tracks: Optional[pd.DataFrame] = None  # model N-torowy (params.tracks)
+    resolution: str = resample.NATIVE       # krok symulacji (resample.Resolution.label)
+    anomalies: Optional[pd.DataFrame] = None  # anomalie wejścia (conditioning.ANOMALY_COLS)
+
+    def kpi(self) -> Dict[str, float]:
+        def s(df: pd.DataFrame, c: str) -> float:
+            return float(df[c].sum()) if len(df) else 0.0
+        return {
+            "rows": len(self.oze),
+            "oze_e_ch_mwh": s(self.oze, "e_ch_mwh"),
+            "oze_e_dis_mwh": s(self.oze, "e_dis_mwh"),
+            "oze_spill_mwh": s(self.oze, "spill_surplus_mwh"),
+            "oze_unmet_mwh": s(self.oze, "unmet_deficit_mwh"),
+            "arbi_e_ch_mwh": s(self.arbi, "e_ch_mwh"),
+            "arbi_e_dis_mwh": s(self.arbi, "e_dis_mwh"),
+            "arbi_net_pln": s(self.arbi, "net_value_pln"),
+        }
+
+    def constraints(self) -> Dict[str, int]:
+        """Liczba kroków z aktywnym ograniczeniem brokera, per kod (constraint_mask)."""
+        if not len(self.broker):
+            return {}
+        return constraint_counts(self.broker["constraint_mask"])
+
+    def input_anomalies(self) -> Dict[str, int]:
+        """Rodzaj anomalii wejścia (duplikat, luka, …) → liczba zdarzeń (conditioning.py)."""
+        from .conditioning import anomaly_counts
+
+        return anomaly_counts(self.anomalies)
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        out = {"broker": self.broker, "oze": self.oze, "arbi": self.arbi}
+        if self.rollup is not None:
+            out["rollup"] = self.rollup
+        if self.tracks is not None and len(self.tracks):
+            out["tracks"] = self.tracks
+        return out
+
+
+# ---------- wejście ----------
+
+def _pyarrow_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:  # pragma: no cover - zależność opcjonalna
+        raise ImportError("Pliki Parquet wymagają pyarrow (pip install .[arrow])") from e
+    return pq
+
+
+def read_input(path: Union[str, "os.PathLike[str]"]) -> pd.DataFrame:
+    """Parquet/CSV → ramka wejściowa (tylko potrzebne kolumny, posortowana po ts_utc)."""
+    path = os.fspath(path)
+    low = path.lower()
+    if low.endswith((".parquet", ".pq")):
+        pq = _pyarrow_parquet()
+        names = set(pq.read_schema(path).names)
+        cols = [c for c in INPUT_COLS if c in names]
+        df = pq.read_table(path, columns=cols, memory_map=True).to_pandas()
+    elif low.endswith((".csv", ".csv.gz")):
+        head = pd.read_csv(path, nrows=0).columns
+        df = pd.read_csv(path, usecols=[c for c in INPUT_COLS if c in head],
+                         memory_map=not low.endswith(".gz"))
+    else:
+        raise ValueError(f"Nieobsługiwany format wejścia: {path} (oczekiwano .parquet lub .csv)")
+    return prepare_input(df, source=path)
+
+
+def _parse_ts(s: pd.Series) -> pd.Series:
+    if not pd.api.types.is_string_dtype(s):
+        return pd.to_datetime(s)
+    try:
+        return pd.to_datetime(s, format="ISO8601")
+    except ValueError:
+        # różne przesunięcia strefy w tekście (np. +01:00 / +02:00 przy zmianie czasu) → UTC
+        return pd.to_datetime(s, format="ISO8601", utc=True)
+
+
+def prepare_input(df: pd.DataFrame, source: str = "DataFrame") -> pd.DataFrame:
+    """Normalizacja jak po load_delta_brutto: typy, brakująca cena → NaN, kolejność po ts_utc."""
+    missing = [c for c in ("ts_utc", "delta_brutto") if c not in df.columns]
+    if missing:
+        raise ValueError(f"{source}: brak kolumn {missing}; wymagane: ts_utc, delta_brutto[, price_pln_mwh]")
+    out = pd.DataFrame({
+        "ts_utc": _parse_ts(df["ts_utc"]),
+        "delta_brutto": df["delta_brutto"].to_numpy(dtype=float, na_value=np.nan),
+        "price_pln_mwh": df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+        if "price_pln_mwh" in df.columns else np.nan,
+    })
+    if not out["ts_utc"].is_monotonic_increasing:
+        out = out.sort_values("ts_utc", kind="stable")
+    return out.reset_index(drop=True)
+
+
+def resolve_params(params: ParamsLike) -> Params:
+    if isinstance(params, Params):
+        return params
+    if isinstance(params, Mapping):
+        return params_from_dict(dict(params))
+    return load_params_file(os.fspath(params))
+
+
+# ---------- API ----------
+
+def simulate(input: InputLike, params: ParamsLike, rollups: bool = True,
+             resolution: Optional[str] = None, fine_window_h: float = 0.0) -> SimulationResult:
+    """
+    Broker + oba tory na danych z pamięci lub pliku, bez połączenia z bazą.
+    Backend silników jak w workerze: ENGINE_BACKEND (engines/registry.py).
+    `resolution` (np. "1h") przepróbkowuje wejście przed silnikami; `fine_window_h` — ostatnie
+    N godzin natywnie (resample.py).
+    """
+    from .pipeline import detail_tasks
+    from .rollups import compute_rollups
+    from .selective import input_fingerprint
+    from .util.dag import run_dag
+    from .util.timing import StageTimer
+    from . import conditioning
+
+    timer = StageTimer()
+    with timer.stage("read_input"):
+        df = prepare_input(input) if isinstance(input, pd.DataFrame) else read_input(input)
+    res = resample.Resolution(resample.parse_rule(resolution), max(0.0, fine_window_h))
+    cond = conditioning.prepare(df, res, timer)
+    df = cond.df
+    steps = conditioning.step_arrays(df, input_fingerprint(df))
+    p = resolve_params(params)
+    r = run_dag(detail_tasks(conditioning.with_steps(df, steps), p), timer=timer)
+    df_broker, df_oze, df_arbi = r["broker"], r["oze"], r["arbi"]
+    df_rollup = None
+    if rollups:
+        with timer.stage("rollups"):
+            df_rollup = compute_rollups({"oze": df_oze, "arbi": df_arbi}, calendar=steps.calendar)
+    return SimulationResult(p, df_broker, df_oze, df_arbi, df_rollup, dict(timer.timings), r["tracks"],
+                            res.label, cond.anomalies)
+
+
+def write_outputs(result: SimulationResult, out_dir: str, fmt: str = "parquet") -> Dict[str, str]:
+    """Zapis ramek wyniku do `out_dir/<tabela>.<fmt>`; zwraca ścieżki."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, df in result.frames().items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        if fmt == "parquet":
+            _pyarrow_parquet()
+            df.to_parquet(path, index=False)
+        else:
+            df.to_csv(path, index=False)
+        paths[name] = path
+    return paths
+
+
+# ---------- CLI ----------
+
+def _scenario_names(paths: List[str]) -> List[str]:
+    """Nazwy katalogów wyników: nazwa pliku bez ostatniego rozszerzenia, powtórki z sufiksem -2, -3…"""
+    names: List[str] = []
+    for path in paths:
+        base = os.path.splitext(os.path.basename(path))[0] or "scenario"
+        name, i = base, 1
+        while name in names:
+            i += 1
+            name = f"{base}-{i}"
+        names.append(name)
+    return names
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m energy_calc.batch", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--input", required=True, help="delta_brutto: .parquet lub .csv")
+    ap.add_argument("--params", required=True, action="append",
+                    help="plik parametrów JSON/YAML (można podać wiele — scenariusze)")
+    ap.add_argument("--out", required=True, help="katalog wyników")
+    ap.add_argument("--format", choices=("parquet", "csv"), default="parquet")
+    ap.add_argument("--no-rollups", action="store_true", help="bez agregatów godzina/dzień/miesiąc")
+    ap.add_argument("--resolution", default=os.getenv("SIM_RESOLUTION"),
+                    help="krok symulacji, np. 15min, 1h (domyślnie SIM_RESOLUTION / natywny)")
+    ap.add_argument("--fine-window-h", type=float, default=float(os.getenv("SIM_FINE_WINDOW_H", "0") or 0),
+                    help="ostatnie N godzin w rozdzielczości natywnej")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        stream=sys.stderr,
+    )
+    t0 = time.perf_counter()
+    df = read_input(args.input)
+    read_ms = (time.perf_counter() - t0) * 1000
+    log.info("Input %s: rows=%d (%.1f ms)", args.input, len(df), read_ms)
+
+    report = []
+    for ppath, name in zip(args.params, _scenario_names(args.params)):
+        daymaps.reset()  # czasy scenariusza bez dni zapamiętanych przez poprzednie
+        res = simulate(df, ppath, rollups=not args.no_rollups,
+                       resolution=args.resolution, fine_window_h=args.fine_window_h)
+        paths = write_outputs(res, os.path.join(args.out, name), args.format)
+        report.append({
+            "scenario": name,
+            "params": ppath,
+            "outputs": paths,
+            "resolution": res.resolution,
+            "kpi": res.kpi(),
+            "constraints": res.constraints(),
+            "input_anomalies": res.input_anomalies(),
+            "timings_ms": {k: round(v * 1000.0, 1) for k, v in res.timings.items()},
+        })
+    print(json.dumps({"input": args.input, "read_ms": round(read_ms, 1), "scenarios": report},
+                     ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
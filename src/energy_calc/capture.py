@@ -0,0 +1,225 @@
+# src/energy_calc/capture.py
+"""
+Capture & replay wejść przebiegu (praca offline nad wydajnością).
+
+Plik capture = jeden skompresowany .npz (zip/deflate) z:
+  - ts_utc [int64 ns], delta_brutto, price_pln_mwh — dokładnie to, co zwrócił load_delta_brutto,
+  - meta (JSON): wersja formatu, run_id, Params (wynik load_params), czasy etapów przebiegu,
+    rozdzielczość symulacji przebiegu (SIM_RESOLUTION / SIM_FINE_WINDOW_H).
+Replay przygotowuje wejście silników jak worker: kondycjonowanie (conditioning.prepare,
+INPUT_* z ENV) i przepróbkowanie do zapisanej rozdzielczości (brak w pliku → ENV).
+
+Użycie:
+  CAPTURE_DIR=/var/log/energy-calc/captures   → worker zapisuje capture każdego przebiegu
+  python -m energy_calc.capture snapshot --out run.npz   → load + silniki (bez zapisu do DB)
+  python -m energy_calc.capture replay run.npz [--repeat 3] → silniki na pliku, bez DB
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from . import resample
+from .models import Params
+
+log = logging.getLogger(__name__)
+
+CAPTURE_FORMAT = "energy-calc-capture"
+CAPTURE_VERSION = 1
+
+
+@dataclass
+class Capture:
+    params: Params
+    df: pd.DataFrame
+    meta: Dict[str, object]
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        return dict(self.meta.get("timings") or {})
+
+    @property
+    def resolution(self) -> resample.Resolution:
+        """Rozdzielczość przebiegu z pliku; starsze pliki (bez niej) → SIM_RESOLUTION z ENV."""
+        r = self.meta.get("resolution")
+        if not isinstance(r, dict):
+            return resample.resolution_from_env()
+        return resample.Resolution(resample.parse_rule(r.get("rule")), float(r.get("fine_window_h") or 0.0))
+
+
+def capture_dir_from_env() -> Optional[str]:
+    d = os.getenv("CAPTURE_DIR", "").strip()
+    return d or None
+
+
+def capture_path(capture_dir: str, run_id: str) -> str:
+    return os.path.join(capture_dir, f"capture_{run_id}.npz")
+
+
+def save_capture(
+    path: str,
+    params: Params,
+    df: pd.DataFrame,
+    timings: Dict[str, float],
+    run_id: str,
+    resolution: Optional[resample.Resolution] = None,
+) -> str:
+    ts = pd.to_datetime(df["ts_utc"])
+    tz = str(ts.dt.tz) if ts.dt.tz is not None else None
+    if tz is not None:
+        ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    meta = {
+        "format": CAPTURE_FORMAT,
+        "version": CAPTURE_VERSION,
+        "run_id": run_id,
+        "created_at": pd.Timestamp.now(tz="UTC").isoformat(),
+        "rows": int(len(df)),
+        "ts_tz": tz,
+        "params": params.model_dump(mode="json"),
+        "timings": {k: float(v) for k, v in timings.items()},
+    }
+    if resolution is not None:
+        meta["resolution"] = {"rule": resolution.rule, "fine_window_h": resolution.fine_window_h}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f,
+            ts_utc=ts.to_numpy(dtype="datetime64[ns]").astype(np.int64),
+            delta_brutto=df["delta_brutto"].to_numpy(dtype=float, na_value=np.nan),
+            price_pln_mwh=df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan),
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+        )
+    os.replace(tmp, path)
+    log.info("Capture saved: %s (rows=%d, %.1f KiB)", path, len(df), os.path.getsize(path) / 1024.0)
+    return path
+
+
+def load_capture(path: str) -> Capture:
+    with np.load(path, allow_pickle=False) as z:
+        meta = json.loads(str(z["meta"]))
+        if meta.get("format") != CAPTURE_FORMAT:
+            raise ValueError(f"{path}: to nie jest plik capture ({meta.get('format')!r})")
+        if int(meta.get("version", 0)) > CAPTURE_VERSION:
+            raise ValueError(
+                f"{path}: wersja capture {meta.get('version')} nowsza niż obsługiwana ({CAPTURE_VERSION})"
+            )
+        ts = pd.to_datetime(z["ts_utc"].astype("datetime64[ns]"))
+        if meta.get("ts_tz"):
+            ts = ts.tz_localize("UTC").tz_convert(meta["ts_tz"])
+        df = pd.DataFrame({
+            "ts_utc": ts,
+            "delta_brutto": z["delta_brutto"],
+            "price_pln_mwh": z["price_pln_mwh"],
+        })
+    return Capture(params=Params.model_validate(meta["params"]), df=df, meta=meta)
+
+
+def replay(path: str, repeat: int = 1) -> Dict[str, object]:
+    """
+    Uruchamia silniki na pliku capture; zwraca czasy (najlepszy z `repeat`) vs zapisane.
+    Stan map dni (daymaps) czyszczony przed każdym powtórzeniem — mierzony jest pełny przebieg silników.
+    """
+    from . import daymaps
+    from .conditioning import prepare
+    from .pipeline import compute_details
+    from .util.timing import StageTimer
+
+    cap = load_capture(path)
+    res = cap.resolution
+    best: Dict[str, float] = {}
+    kpi: Dict[str, float] = {}
+    for _ in range(max(1, repeat)):
+        daymaps.reset()  # każde powtórzenie od zera — bez dni zapamiętanych przez poprzednie
+        timer = StageTimer()
+        df = prepare(cap.df, res, timer).df
+        df_broker, df_oze, df_arbi = compute_details(df, cap.params, timer)
+        for k, v in timer.timings.items():
+            best[k] = min(best.get(k, v), v)
+        kpi = {
+            "oze_e_ch_mwh": float(df_oze["e_ch_mwh"].sum()) if len(df_oze) else 0.0,
+            "oze_e_dis_mwh": float(df_oze["e_dis_mwh"].sum()) if len(df_oze) else 0.0,
+            "arbi_e_ch_mwh": float(df_arbi["e_ch_mwh"].sum()) if len(df_arbi) else 0.0,
+            "arbi_e_dis_mwh": float(df_arbi["e_dis_mwh"].sum()) if len(df_arbi) else 0.0,
+            "arbi_net_pln": float(df_arbi["net_value_pln"].sum()) if len(df_arbi) else 0.0,
+        }
+
+    captured = cap.timings
+    stages = {
+        k: {
+            "replay_ms": round(v * 1000.0, 1),
+            "captured_ms": round(captured[k] * 1000.0, 1) if k in captured else None,
+            "speedup": round(captured[k] / v, 2) if k in captured and v > 0 else None,
+        }
+        for k, v in best.items()
+    }
+    return {
+        "capture": path,
+        "run_id": cap.meta.get("run_id"),
+        "rows": cap.meta.get("rows"),
+        "resolution": res.label,
+        "repeat": max(1, repeat),
+        "stages": stages,
+        "kpi": kpi,
+    }
+
+
+def snapshot(out: str) -> str:
+    """Jak full_rebuild, ale bez zapisu do output.* — ładuje wejścia z DB, liczy i zapisuje capture."""
+    from .conditioning import prepare
+    from .config import RunConfig
+    from .io_db import connect_db, load_delta_brutto
+    from .main import _load_db_env
+    from .params.loader import load_params
+    from .pipeline import compute_details, new_run_id
+    from .util.timing import StageTimer
+
+    host, port, db, user, pwd = _load_db_env()
+    cfg = RunConfig(db_host=host, db_port=int(port), db_name=db, db_user=user, db_password=pwd)
+    run_id = new_run_id()
+    timer = StageTimer()
+    res = resample.resolution_from_env()
+    with connect_db(cfg) as conn:
+        with timer.stage("load_params"):
+            params = load_params(conn)
+        with timer.stage("load_delta"):
+            df = load_delta_brutto(conn)
+    compute_details(prepare(df, res, timer).df, params, timer)
+    return save_capture(out, params, df, timer.timings, run_id, resolution=res)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m energy_calc.capture", description=__doc__.split("\n\n")[0])
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("snapshot", help="zapisz wejścia bieżącego stanu DB do pliku capture")
+    s.add_argument("--out", required=True)
+    r = sub.add_parser("replay", help="uruchom silniki na pliku capture (bez DB)")
+    r.add_argument("path")
+    r.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        stream=sys.stderr,
+    )
+    t0 = time.perf_counter()
+    if args.cmd == "snapshot":
+        path = snapshot(args.out)
+        print(json.dumps({"capture": path, "elapsed_ms": int((time.perf_counter() - t0) * 1000)}))
+    else:
+        print(json.dumps(replay(args.path, args.repeat), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+# src/energy_calc/changes.py
+"""
+Tick sterowany zmianami: przebieg z ticku tylko wtedy, gdy źródła przebiegu się zmieniły.
+
+Na każdym ticku worker porównuje tanią sygnaturę źródeł z sygnaturą sprzed ostatniego
+przebiegu (jedno zapytanie do katalogu, bez czytania danych):
+  - pg_stat_user_tables: n_tup_ins / n_tup_upd / n_tup_del każdej tabeli źródłowej,
+  - pg_relation_filenode (TRUNCATE nie zmienia liczników),
+  - zbiór tabel (nowa tabela w schemacie params też jest zmianą),
+  - opcjonalnie CHANGE_WATERMARK_SQL — własny znacznik, np. `SELECT max(updated_at) FROM …`
+    (źródła spoza pg_stat, np. tabele obce).
+Źródła: CHANGE_SOURCES (domyślnie `params,output.delta_brutto`; nazwa bez kropki = cały schemat,
+z kropką = tabela albo widok — widoki rozwijane do tabel, z których czytają, razem z partycjami).
+
+Interwał: PERIODIC_TICK_SEC po zmianie, przy ciszy mnożony przez CHANGE_BACKOFF (domyślnie 2)
+aż do CHANGE_POLL_MAX_SEC (domyślnie 120 s). Przebieg wymuszany po CHANGE_MAX_IDLE_SEC
+(domyślnie 3600 s; 0 = nigdy) i gdy sygnatury nie da się odczytać (jak zwykły tick).
+Liczniki pg_stat są publikowane z opóźnieniem rzędu sekund — natychmiastową ścieżką
+pozostaje LISTEN/NOTIFY. CHANGE_DETECTION=0 — każdy tick to przebieg (jak dotąd).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+
+import psycopg
+
+log = logging.getLogger(__name__)
+
+Signature = Tuple[tuple, ...]
+
+SIGNATURE_SQL = """
+WITH RECURSIVE src(oid) AS (
+    SELECT c.oid
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = ANY(%(schemas)s)
+      AND c.relkind IN ('r', 'p', 'm', 'v')
+    UNION
+    SELECT to_regclass(t)::oid FROM unnest(%(tables)s::text[]) AS t WHERE to_regclass(t) IS NOT NULL
+    UNION
+    -- widok → relacje z jego reguły; tabela partycjonowana → partycje
+    SELECT x.oid
+    FROM src, LATERAL (
+        SELECT d.refobjid AS oid
+        FROM pg_rewrite r
+        JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+                        AND d.refclassid = 'pg_class'::regclass
+        WHERE r.ev_class = src.oid AND d.refobjid <> src.oid
+        UNION ALL
+        SELECT i.inhrelid FROM pg_inherits i WHERE i.inhparent = src.oid
+    ) x
+)
+SELECT c.oid::regclass::text,
+       s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+       pg_relation_filenode(c.oid)
+FROM (SELECT DISTINCT oid FROM src) src
+JOIN pg_class c ON c.oid = src.oid
+LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+WHERE c.relkind IN ('r', 'm')
+ORDER BY 1
+"""
+
+
+def enabled() -> bool:
+    """CHANGE_DETECTION (domyślnie włączone)."""
+    return os.getenv("CHANGE_DETECTION", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def sources_from_env() -> Tuple[List[str], List[str]]:
+    """CHANGE_SOURCES → (schematy, tabele/widoki)."""
+    items = [s.strip() for s in os.getenv("CHANGE_SOURCES", "params,output.delta_brutto").split(",") if s.strip()]
+    return [s for s in items if "." not in s], [s for s in items if "." in s]
+
+
+def read_signature(conn: psycopg.Connection, schemas: List[str], tables: List[str],
+                   watermark_sql: Optional[str] = None) -> Signature:
+    """Sygnatura źródeł: (tabela, ins, upd, del, filenode) po kolei + wiersz znacznika."""
+    rows = conn.execute(SIGNATURE_SQL, {"schemas": schemas, "tables": tables}).fetchall()
+    sig = tuple(tuple(r) for r in rows)
+    if watermark_sql:
+        sig += (("watermark",) + tuple(conn.execute(watermark_sql).fetchone() or ()),)
+    return sig
+
+
+def _changed(old: Signature, new: Signature) -> List[str]:
+    """Nazwy źródeł, których wpis w sygnaturze się różni (też dodane / usunięte)."""
+    a, b = {r[0]: r for r in old}, {r[0]: r for r in new}
+    return sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+
+
+class ChangeWatcher:
+    """
+    Sygnatura źródeł z chwili przed ostatnim udanym przebiegiem + adaptacyjny interwał ticku.
+    Połączenie własne (autocommit — liczniki pg_stat czytane na świeżo w każdym zapytaniu).
+    """
+
+    def __init__(self, dsn: str, tick_sec: float):
+        self.dsn = dsn
+        self.schemas, self.tables = sources_from_env()
+        self.watermark_sql = os.getenv("CHANGE_WATERMARK_SQL", "").strip() or None
+        self.base_sec = max(0.1, float(tick_sec))
+        self.max_sec = max(self.base_sec, float(os.getenv("CHANGE_POLL_MAX_SEC", "120") or 0))
+        self.backoff = max(1.0, float(os.getenv("CHANGE_BACKOFF", "2") or 1))
+        self.max_idle_sec = max(0.0, float(os.getenv("CHANGE_MAX_IDLE_SEC", "3600") or 0))
+        self.interval = self.base_sec
+        self._conn: Optional[psycopg.Connection] = None
+        self._baseline: Optional[Signature] = None
+        self._last_rebuild = time.monotonic()
+
+    def _connection(self) -> psycopg.Connection:
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg.connect(self.dsn, autocommit=True, connect_timeout=10)
+        return self._conn
+
+    def signature(self) -> Optional[Signature]:
+        """Bieżąca sygnatura; None przy błędzie (połączenie zamykane, kolejna próba na nowym)."""
+        try:
+            return read_signature(self._connection(), self.schemas, self.tables, self.watermark_sql)
+        except psycopg.Error as e:
+            log.warning("Change detection: cannot read source signature: %s", e)
+            self.close()
+            return None
+
+    def poll(self) -> Optional[str]:
+        """
+        Powód przebiegu (zmienione źródła / brak sygnatury / max idle) albo None przy ciszy.
+        Cisza wydłuża interwał (back-off); bazowy przywraca dopiero udany przebieg (after_rebuild).
+        """
+        sig = self.signature()
+        if sig is None:
+            reason = "source signature unavailable"
+        elif self._baseline is None:
+            reason = "no baseline"
+        elif not sig:
+            reason = "no source tables found"
+        else:
+            changed = _changed(self._baseline, sig)
+            if changed:
+                reason = "changed " + ",".join(changed[:5]) + (f" (+{len(changed) - 5})" if len(changed) > 5 else "")
+            elif self.max_idle_sec and time.monotonic() - self._last_rebuild >= self.max_idle_sec:
+                reason = f"no rebuild for {self.max_idle_sec:.0f}s"
+            else:
+                self.interval = min(self.max_sec, self.interval * self.backoff)
+                log.debug("Change detection: sources quiet, next check in %.1fs", self.interval)
+                return None
+        return reason
+
+    def before_rebuild(self) -> Optional[Signature]:
+        """Sygnatura sprzed przebiegu — zmiany w trakcie przebiegu wywołają kolejny."""
+        return self.signature()
+
+    def after_rebuild(self, sig: Optional[Signature], ok: bool) -> None:
+        """Udany przebieg: nowa baza porównań. Nieudany: baza bez zmian (ponowienie), dłuższy interwał."""
+        if ok:
+            self._last_rebuild = time.monotonic()
+            self.interval = self.base_sec
+            if sig is not None:
+                self._baseline = sig
+        else:
+            self.interval = min(self.max_sec, self.interval * self.backoff)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
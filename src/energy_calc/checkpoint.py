@@ -0,0 +1,126 @@
+# src/energy_calc/checkpoint.py
+"""
+Punkty kontrolne przebiegów strumieniowych (output.energy_rebuild_checkpoint).
+
+Po każdej zapisanej paczce, w tej samej transakcji co jej COPY, zapisywany jest stan:
+ts ostatniego kroku, SOC obu torów (bez zaokrąglenia), histogram Δt i sumy KPI.
+Po restarcie (kill, OOM, zerwane połączenie) przebieg `running` z tymi samymi
+parametrami jest wznawiany od ostatniej zatwierdzonej paczki zamiast od zera.
+
+Stan zawiera też znacznik wejścia (`state["input"]`): liczbę wierszy, max ts_utc
+i sumę skrótów wierszy output.delta_brutto do last_ts, liczone przyrostowo per paczka.
+Wznowienie wymaga zgodności znacznika z bieżącą zawartością tabeli — korekta
+historii już przeliczonej (UPDATE / DELETE / wstawka wstecz) oznacza start od zera.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import psycopg
+
+from .models import Params
+
+log = logging.getLogger(__name__)
+
+TABLE = "energy_rebuild_checkpoint"
+
+# suma skrótów nie zależy od kolejności wierszy — przyrosty paczek sumują się do całości
+WATERMARK_SQL = """
+    SELECT count(*),
+           max(ts_utc),
+           coalesce(sum(hashtextextended(concat_ws('|', ts_utc, delta_brutto, price_pln_mwh), 0)), 0)
+    FROM output.delta_brutto
+    WHERE ts_utc <= %s
+"""
+
+
+def enabled() -> bool:
+    """STREAM_CHECKPOINT (domyślnie włączone w trybie strumieniowym)."""
+    return os.getenv("STREAM_CHECKPOINT", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def params_hash(params: Params) -> str:
+    return hashlib.blake2b(params.model_dump_json().encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class Checkpoint:
+    run_id: str
+    params_hash: str
+    last_ts: Optional[datetime]
+    chunks_done: int
+    rows_done: int
+    soc_oze_mwh: Optional[float]
+    soc_arbi_mwh: Optional[float]
+    state: dict
+
+
+def load_running(conn: psycopg.Connection, schema: str = "output") -> Optional[Checkpoint]:
+    """Ostatni niedokończony przebieg (None, gdy brak)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT run_id, params_hash, last_ts, chunks_done, rows_done, soc_oze_mwh, soc_arbi_mwh, state "
+            f"FROM {schema}.{TABLE} WHERE status = 'running' ORDER BY started_at DESC LIMIT 1"
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    run_id, ph, last_ts, chunks, rows, soc_o, soc_a, state = row
+    if isinstance(state, str):
+        state = json.loads(state)
+    return Checkpoint(run_id, ph, last_ts, int(chunks), int(rows), soc_o, soc_a, state or {})
+
+
+def start(conn: psycopg.Connection, run_id: str, p_hash: str, schema: str = "output") -> None:
+    """Nowy przebieg; poprzednie niedokończone oznaczane jako porzucone."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE {schema}.{TABLE} SET status = 'abandoned', updated_at = now() WHERE status = 'running'"
+        )
+        cur.execute(
+            f"INSERT INTO {schema}.{TABLE} (run_id, status, params_hash) VALUES (%s, 'running', %s)",
+            (run_id, p_hash),
+        )
+
+
+def input_watermark(conn: psycopg.Connection, until: datetime, since: Optional[datetime] = None,
+                    prev: Optional[dict] = None) -> dict:
+    """
+    Znacznik wejścia dla wierszy (since, until] dodany do `prev` (znacznika do `since`).
+    Bez `since` — cała historia do `until` (porównanie przy wznowieniu).
+    """
+    q, args = WATERMARK_SQL, (until,)
+    if since is not None:
+        q, args = q.replace("WHERE ts_utc <= %s", "WHERE ts_utc <= %s AND ts_utc > %s"), (until, since)
+    with conn.cursor() as cur:
+        cur.execute(q, args)
+        n, max_ts, h = cur.fetchone()
+    wm = {"rows": int(n), "max_ts": None if max_ts is None else max_ts.isoformat(), "hash": str(int(h))}
+    if prev:
+        wm["rows"] += int(prev["rows"])
+        wm["hash"] = str(int(wm["hash"]) + int(prev["hash"]))
+        wm["max_ts"] = wm["max_ts"] or prev.get("max_ts")
+    return wm
+
+
+def save(conn: psycopg.Connection, run_id: str, last_ts: datetime, chunks_done: int, rows_done: int,
+         soc_oze: float, soc_arbi: float, state: dict, schema: str = "output") -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE {schema}.{TABLE} SET last_ts = %s, chunks_done = %s, rows_done = %s, "
+            "soc_oze_mwh = %s, soc_arbi_mwh = %s, state = %s::jsonb, updated_at = now() WHERE run_id = %s",
+            (last_ts, chunks_done, rows_done, soc_oze, soc_arbi, json.dumps(state), run_id),
+        )
+
+
+def finish(conn: psycopg.Connection, run_id: str, schema: str = "output") -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE {schema}.{TABLE} SET status = 'done', updated_at = now() WHERE run_id = %s", (run_id,)
+        )
@@ -0,0 +1,347 @@
+# src/energy_calc/conditioning.py
+"""
+Kondycjonowanie wejścia przed silnikami — jedna wektorowa obróbka output.delta_brutto
+zamiast powtarzania (i przemilczania) jej w każdym silniku.
+
+Etap 1 — `condition(df)`, surowe wejście (przed SIM_RESOLUTION):
+  - wiersze bez ts_utc → odrzucane,
+  - kolejność po ts_utc (sortowanie stabilne, gdy wejście nie jest posortowane),
+  - duplikaty ts_utc: INPUT_DUPLICATES=last (domyślnie; ostatni wczytany wiersz) | first |
+    keep (bez zmian — krok Δt≈0, a broker łączy zdublowane kroki każdy z każdym),
+  - luki: krok > INPUT_GAP_FACTOR × mediana Δt (domyślnie 1.5); INPUT_GAP_POLICY=keep (domyślnie;
+    krok przed luką trwa do kolejnego ts, jak dotąd) | fill (brakujące kroki siatki mediany
+    dopisywane z delta_brutto = 0 i bez ceny — bateria w nich tylko się samorozładowuje),
+  - DST: przy INPUT_LOCAL_TZ (np. Europe/Warsaw) luka / duplikat w czasie ściennym, który w tej
+    strefie nie istnieje albo jest niejednoznaczny (zmiana czasu), oznaczany jako dst_gap /
+    dst_duplicate (obsługa jak zwykłej luki / duplikatu).
+  Anomalie (`Conditioned.anomalies`) → output.energy_input_anomalies (`write_anomalies`).
+  `prepare(df, res)` — etap 1 + SIM_RESOLUTION: wspólne wejście silników workera, CLI wsadowego,
+  capture (snapshot / replay) i optymalizatora. Tryb strumieniowy — `ChunkConditioner` (paczki
+  z przeniesieniem wierszy granicznych).
+
+Etap 2 — `step_arrays(df, fingerprint, prev)`, wejście silników (po przepróbkowaniu):
+  Δt kroków (kolumna `step_hours` — honorują ją wszystkie backendy, daymaps i broker) i klucze
+  kalendarza (kubełki godzina/dzień/miesiąc czasu ściennego dla rollups.py). Trzymane w wyniku
+  przebiegu obok odcisku wejścia — kolejny przebieg z tym samym odciskiem ich nie liczy.
+"""
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import psycopg
+
+from . import resample, rollups
+
+log = logging.getLogger(__name__)
+
+TABLE = "energy_input_anomalies"
+ANOMALY_COLS = ["kind", "ts_start", "ts_end", "n_rows", "action", "detail"]
+DUPLICATE_POLICIES = ("last", "first", "keep")
+GAP_POLICIES = ("keep", "fill")
+
+
+def duplicate_policy() -> str:
+    v = os.getenv("INPUT_DUPLICATES", "last").strip().lower() or "last"
+    if v not in DUPLICATE_POLICIES:
+        raise ValueError(f"INPUT_DUPLICATES={v!r} (dozwolone: {', '.join(DUPLICATE_POLICIES)})")
+    return v
+
+
+def gap_policy() -> str:
+    v = os.getenv("INPUT_GAP_POLICY", "keep").strip().lower() or "keep"
+    if v not in GAP_POLICIES:
+        raise ValueError(f"INPUT_GAP_POLICY={v!r} (dozwolone: {', '.join(GAP_POLICIES)})")
+    return v
+
+
+def _gap_factor() -> float:
+    return max(1.0, float(os.getenv("INPUT_GAP_FACTOR", "1.5") or 1.5))
+
+
+def _local_tz() -> Optional[str]:
+    return os.getenv("INPUT_LOCAL_TZ", "").strip() or None
+
+
+def _max_rows() -> int:
+    return max(0, int(os.getenv("INPUT_ANOMALY_MAX_ROWS", "10000") or 0))
+
+
+def anomaly_counts(anomalies: Optional[pd.DataFrame]) -> Dict[str, int]:
+    """Rodzaj anomalii → liczba zdarzeń."""
+    if anomalies is None or anomalies.empty:
+        return {}
+    return {str(k): int(v) for k, v in anomalies["kind"].value_counts(sort=False).items()}
+
+
+@dataclass
+class Conditioned:
+    """Wejście po kondycjonowaniu + raport anomalii (ANOMALY_COLS, ts w czasie ściennym)."""
+    df: pd.DataFrame
+    anomalies: pd.DataFrame
+    median_ns: Optional[int] = None  # mediana Δt użyta do wykrywania luk
+
+    def counts(self) -> Dict[str, int]:
+        return anomaly_counts(self.anomalies)
+
+    def key(self) -> str:
+        """Skrót raportu (zapis do bazy tylko przy zmianie)."""
+        return hashlib.blake2b(self.anomalies.to_csv(index=False).encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class StepArrays:
+    """Tablice kroków wejścia silników, ważne dla wejścia o odcisku `fingerprint`."""
+    fingerprint: str
+    step_hours: np.ndarray
+    calendar: Dict[str, np.ndarray]  # rollups.RESOLUTIONS → kubełek każdego kroku (datetime64[us])
+
+
+# ---------- etap 1: wejście surowe ----------
+
+def _wall(ts: pd.Series) -> pd.Series:
+    return ts.dt.tz_localize(None) if ts.dt.tz is not None else ts
+
+
+def _dst(wall: pd.Series, tz: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (czas ścienny nieistniejący albo niejednoznaczny w strefie `tz`, przesunięcie strefy [ns]
+    — 0 w oknie zmiany czasu i bez `tz`).
+    """
+    n = len(wall)
+    if tz is None or n == 0:
+        return np.zeros(n, dtype=bool), np.zeros(n, dtype=np.int64)
+    loc = wall.dt.tz_localize(tz, ambiguous="NaT", nonexistent="NaT")
+    window = loc.isna().to_numpy()
+    utc = loc.dt.tz_convert(None).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    off = wall.to_numpy(dtype="datetime64[ns]").astype(np.int64) - utc
+    off[window] = 0
+    return window, off
+
+
+def _hours(ns) -> np.ndarray:
+    return np.asarray(ns, dtype=np.int64) / 1e9 / 3600.0
+
+
+def condition(df: pd.DataFrame, median_ns: Optional[int] = None) -> Conditioned:
+    """
+    Etap 1 (patrz opis modułu). Wynik: ts_utc, delta_brutto, price_pln_mwh[, inne kolumny wejścia].
+    `median_ns` — stała mediana Δt dla luk (paczki trybu strumieniowego); domyślnie z `df`.
+    """
+    dup_policy, fill, tz = duplicate_policy(), gap_policy() == "fill", _local_tz()
+    events: List[pd.DataFrame] = []
+    if df.empty:
+        return Conditioned(df, pd.DataFrame(columns=ANOMALY_COLS))
+
+    ts = pd.to_datetime(df["ts_utc"])
+    null_ts = ts.isna().to_numpy()
+    if null_ts.any():
+        events.append(pd.DataFrame({"kind": ["null_ts"], "ts_start": [pd.NaT], "ts_end": [pd.NaT],
+                                    "n_rows": [int(null_ts.sum())], "action": ["dropped"], "detail": [None]}))
+        df, ts = df[~null_ts], ts[~null_ts]
+    df = df.reset_index(drop=True).assign(ts_utc=ts.reset_index(drop=True))
+    if df.empty:
+        return Conditioned(df, pd.concat(events, ignore_index=True)[ANOMALY_COLS])
+
+    ns = df["ts_utc"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    if (np.diff(ns) < 0).any():
+        order = np.argsort(ns, kind="stable")
+        n_back = int((np.diff(ns) < 0).sum())
+        df, ns = df.iloc[order].reset_index(drop=True), ns[order]
+        wall = _wall(df["ts_utc"])
+        events.append(pd.DataFrame({"kind": ["unsorted"], "ts_start": [wall.iloc[0]], "ts_end": [wall.iloc[-1]],
+                                    "n_rows": [n_back], "action": ["sorted"],
+                                    "detail": [f"{n_back} steps back in time"]}))
+    wall = _wall(df["ts_utc"])
+    dst, offset = _dst(wall, tz)
+
+    # duplikaty: grupy kolejnych równych ts (po sortowaniu)
+    same = ns[1:] == ns[:-1]
+    if same.any():
+        first = np.flatnonzero(np.r_[True, ~same])
+        size = np.diff(np.r_[first, len(ns)])
+        g = first[size > 1]
+        action = {"last": "kept_last", "first": "kept_first", "keep": "kept"}[dup_policy]
+        events.append(pd.DataFrame({
+            "kind": np.where(dst[g], "dst_duplicate", "duplicate_ts"),
+            "ts_start": wall.iloc[g].to_numpy(), "ts_end": wall.iloc[g].to_numpy(),
+            "n_rows": size[size > 1], "action": action,
+            "detail": [f"{k} rows with the same ts_utc" for k in size[size > 1]],
+        }))
+        if dup_policy != "keep":
+            keep = np.r_[~same, True] if dup_policy == "last" else np.r_[True, ~same]
+            df, ns, wall = df[keep].reset_index(drop=True), ns[keep], wall[keep].reset_index(drop=True)
+            dst, offset = dst[keep], offset[keep]
+
+    # luki: krok dłuższy niż INPUT_GAP_FACTOR × mediana
+    d = np.diff(ns)
+    d_pos = d[d > 0]
+    med = median_ns if median_ns else (int(round(float(np.median(d_pos)))) if d_pos.size else None)
+    if med and d.size:
+        gi = np.flatnonzero(d > _gap_factor() * med)
+        if gi.size:
+            missing = (d[gi] - 1) // med  # kroki siatki mediany mieszczące się w luce
+            # luka DST: koniec w oknie zmiany czasu albo nadmiar kroku = zmiana przesunięcia strefy
+            shift = offset[gi + 1] - offset[gi]
+            is_dst = dst[gi] | dst[gi + 1] | ((shift != 0) & (d[gi] - med == shift))
+            events.append(pd.DataFrame({
+                "kind": np.where(is_dst, "dst_gap", "gap"),
+                "ts_start": wall.iloc[gi].to_numpy(), "ts_end": wall.iloc[gi + 1].to_numpy(),
+                "n_rows": missing, "action": "filled" if fill else "kept",
+                "detail": [f"step {h:g} h, median {float(_hours(med)):g} h" for h in _hours(d[gi])],
+            }))
+            if fill:
+                df = _fill_gaps(df, ns, gi, missing, med)
+
+    anomalies = pd.concat(events, ignore_index=True)[ANOMALY_COLS] if events else pd.DataFrame(columns=ANOMALY_COLS)
+    return Conditioned(df, anomalies, med)
+
+
+def _fill_gaps(df: pd.DataFrame, ns: np.ndarray, gi: np.ndarray, missing: np.ndarray, med: int) -> pd.DataFrame:
+    """Kroki ts[i] + k·med (k = 1..missing) w lukach: delta_brutto = 0, cena i pozostałe kolumny puste."""
+    total = int(missing.sum())
+    base = np.repeat(ns[gi], missing)
+    k = np.arange(total) - np.repeat(np.cumsum(missing) - missing, missing) + 1
+    new_ns = base + k * med
+    tz = df["ts_utc"].dt.tz
+    new_ts = pd.to_datetime(new_ns, utc=tz is not None)
+    if tz is not None:
+        new_ts = new_ts.tz_convert(tz)
+    filler = pd.DataFrame({"ts_utc": new_ts, "delta_brutto": 0.0, "price_pln_mwh": np.nan})
+    out = pd.concat([df, filler], ignore_index=True)
+    all_ns = np.r_[ns, new_ns]
+    order = np.argsort(all_ns, kind="stable")
+    out = out.iloc[order].reset_index(drop=True)
+    out["ts_utc"] = out["ts_utc"].astype(df["ts_utc"].dtype)
+    log.info("Conditioning: filled %d missing steps in %d gaps", total, len(gi))
+    return out
+
+
+def prepare(df: pd.DataFrame, res: Optional[resample.Resolution] = None, timer=None) -> Conditioned:
+    """
+    Surowe wejście (load_delta_brutto / plik) → wejście silników: `condition`, raport w logu
+    i przepróbkowanie do `res`. Jedna ścieżka dla workera, CLI wsadowego, capture i optymalizatora;
+    `Conditioned.df` to ramka po przepróbkowaniu.
+    """
+    stage = timer.stage if timer is not None else (lambda name: contextlib.nullcontext())
+    with stage("condition"):
+        cond = condition(df)
+    log_report(cond)
+    if res is not None and res.rule is not None:
+        with stage("resample"):
+            cond.df = resample.apply_resolution(cond.df, res)
+    return cond
+
+
+class ChunkConditioner:
+    """
+    Etap 1 dla paczek trybu strumieniowego (wejście posortowane przez ORDER BY ts_utc).
+
+    Wiersze z ostatnim ts paczki czekają na kolejną (duplikat na granicy paczek), a ostatni
+    wydany wiersz poprzedza kolejną ramkę i jest z wyniku usuwany (luka na granicy paczek).
+    Mediana Δt dla luk — z pierwszej ramki, stała w przebiegu (zapisywana w punkcie kontrolnym).
+    Wznowienie: `anchor` = ostatni wiersz wejścia przed punktem odczytu — luka na granicy
+    wznowienia jest wykrywana (i uzupełniana) jak w przebiegu bez przerwy.
+    """
+
+    def __init__(self, median_ns: Optional[int] = None, anchor: Optional[pd.DataFrame] = None):
+        self.median_ns = median_ns
+        self._anchor: Optional[pd.DataFrame] = anchor if anchor is not None and len(anchor) else None  # ostatni wydany wiersz
+        self._tail: Optional[pd.DataFrame] = None     # surowe wiersze o ostatnim ts, jeszcze niewydane
+        self._events: List[pd.DataFrame] = []
+
+    def _frame(self, raw: pd.DataFrame) -> pd.DataFrame:
+        anchored = self._anchor is not None
+        c = condition(pd.concat([self._anchor, raw], ignore_index=True) if anchored else raw, self.median_ns)
+        self.median_ns = self.median_ns or c.median_ns
+        if len(c.anomalies):
+            self._events.append(c.anomalies)
+        if len(c.df):
+            self._anchor = c.df.iloc[[-1]]
+        return c.df.iloc[1:].reset_index(drop=True) if anchored else c.df
+
+    def __call__(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        for chunk in chunks:
+            raw = chunk if self._tail is None else pd.concat([self._tail, chunk], ignore_index=True)
+            ts = pd.to_datetime(raw["ts_utc"])
+            last = (ts == ts.max()).to_numpy()
+            self._tail = raw[last].reset_index(drop=True) if last.any() else None
+            body = raw[~last]
+            if len(body):
+                out = self._frame(body)
+                if len(out):
+                    yield out
+        if self._tail is not None:
+            out = self._frame(self._tail)
+            self._tail = None
+            if len(out):
+                yield out
+
+    def report(self) -> Conditioned:
+        """Anomalie wszystkich paczek (ramka wejścia pusta — wynik poszedł do silników paczkami)."""
+        anomalies = (pd.concat(self._events, ignore_index=True)[ANOMALY_COLS] if self._events
+                     else pd.DataFrame(columns=ANOMALY_COLS))
+        return Conditioned(pd.DataFrame(), anomalies, self.median_ns)
+
+
+# ---------- etap 2: tablice kroków ----------
+
+def step_hours(ts: pd.Series) -> np.ndarray:
+    """Δt [h] jak kernels.step_hours (ostatni krok = mediana, min 1e-9) — na int64 zamiast shift()."""
+    ns = ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    if len(ns) == 0:
+        return np.zeros(0)
+    step = _hours(np.diff(ns))
+    last = float(np.median(step)) if step.size else 1.0
+    return np.maximum(np.r_[step, last], 1e-9)
+
+
+def step_arrays(df: pd.DataFrame, fingerprint: str, prev: Optional[StepArrays] = None) -> StepArrays:
+    """Tablice kroków wejścia silników; `prev` o tym samym odcisku (i długości) jest zwracany bez liczenia."""
+    if prev is not None and prev.fingerprint == fingerprint and len(prev.step_hours) == len(df):
+        log.info("Conditioning: step/calendar arrays reused (input unchanged)")
+        return prev
+    ts = pd.to_datetime(df["ts_utc"])
+    return StepArrays(fingerprint, step_hours(ts), rollups.calendar_keys(ts))
+
+
+def with_steps(df: pd.DataFrame, arrays: StepArrays) -> pd.DataFrame:
+    """Wejście silników z kolumną `step_hours` (zamiast liczenia Δt w każdym silniku)."""
+    return df.assign(step_hours=arrays.step_hours)
+
+
+# ---------- raport ----------
+
+def log_report(c: Conditioned) -> None:
+    counts = c.counts()
+    if counts:
+        log.warning("Input anomalies: %s (duplicates=%s, gaps=%s) — see output.%s",
+                    ", ".join(f"{k}={v}" for k, v in counts.items()), duplicate_policy(), gap_policy(), TABLE)
+
+
+def write_anomalies(conn: psycopg.Connection, run_id: str, anomalies: pd.DataFrame, schema: str = "output") -> None:
+    """Raport anomalii ostatniego wejścia (zastępuje poprzedni); najwyżej INPUT_ANOMALY_MAX_ROWS wierszy."""
+    fq = f"{schema}.{TABLE}"
+    limit = _max_rows()
+    if len(anomalies) > limit:
+        log.warning("Input anomalies: %d rows, writing first %d (INPUT_ANOMALY_MAX_ROWS)", len(anomalies), limit)
+        anomalies = anomalies.iloc[:limit]
+    rows = [
+        (run_id, r.kind, None if pd.isna(r.ts_start) else r.ts_start.to_pydatetime(),
+         None if pd.isna(r.ts_end) else r.ts_end.to_pydatetime(), int(r.n_rows), r.action, r.detail)
+        for r in anomalies.itertuples(index=False)
+    ]
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {fq}")
+        if rows:
+            cur.executemany(
+                f"INSERT INTO {fq} (run_id, kind, ts_start, ts_end, n_rows, action, detail) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                rows,
+            )
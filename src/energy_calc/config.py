@@ -12,6 +12,15 @@ class RunConfig:
     db_user: str = os.getenv("DB_USER", "postgres")
     db_password: str = os.getenv("DB_PASSWORD", "")
 
+    # Replika do odczytu wejść (params, delta_brutto); puste host = wszystko na primary.
+    # Puste name/user/password i port 0 = jak primary.
+    db_read_host: str = os.getenv("DB_READ_HOST", "")
+    db_read_port: int = int(os.getenv("DB_READ_PORT", "0") or 0)
+    db_read_name: str = os.getenv("DB_READ_NAME", "")
+    db_read_user: str = os.getenv("DB_READ_USER", "")
+    db_read_password: str = os.getenv("DB_READ_PASSWORD", "")
+    db_read_max_wait_sec: float = float(os.getenv("DB_READ_MAX_WAIT_SEC", "5"))
+
     # Listen / scheduling (jeśli użyjesz pętli LISTEN/NOTIFY w main)
     notify_channels: tuple[str, ...] = tuple(
         c.strip() for c in os.getenv("NOTIFY_CHANNELS", "ch_energy_rebuild").split(",") if c.strip()
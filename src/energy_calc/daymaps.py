@@ -0,0 +1,254 @@
+# src/energy_calc/daymaps.py
+"""
+Mapy przejścia SOC per dzień: ponowny przebieg torów OZE/ARBI bez przeliczania całej historii.
+
+Krok toru to odwzorowanie SOC s ↦ clamp(s + a, lo, hi) (engines/kernels.py), złożenie kroków
+jednego dnia — też. Mapa dnia (a, lo, hi) zależy tylko od wejścia dnia i parametrów toru
+(bez SOC startowego), więc jest cache'owana pod skrótem (kroki dnia: ts, Δt, delta_brutto /
+cena i progi, kolumny sched_*; parametry toru bez soc_init_mwh).
+
+Kolejny przebieg w tym procesie (np. zmiana `bess_soc_start`, korekta danych jednego dnia):
+  1. SOC startowy każdego dnia = złożenie map dni wcześniejszych (skan po dniach, nie krokach),
+  2. dzień o niezmienionym skrócie i SOC startowym → wiersze z poprzedniego wyniku,
+  3. pozostałe dni (ciągi kolejnych dni) → silnik aktywnego backendu z SOC startowym z map.
+Różnica SOC startowego ≤ DAY_MAPS_ATOL (domyślnie 1e-9 MWh) = dzień niezmieniony.
+
+  DAY_MAPS=1            (domyślnie włączone; 0 = zawsze pełny przebieg torów)
+  DAY_MAPS_CACHE=200000 (maks. liczba map dni w pamięci, LRU)
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .engines import kernels as K
+from .engines.registry import run_track
+from .models import TrackParams
+from .params.schedules import SCHED_PREFIX, timestamps_ns
+
+log = logging.getLogger(__name__)
+
+DAY_NS = 86_400 * 10**9
+TRACKS = ("oze", "arbi")
+
+DayMap = Tuple[float, float, float]
+
+
+def enabled() -> bool:
+    return os.getenv("DAY_MAPS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _atol() -> float:
+    return float(os.getenv("DAY_MAPS_ATOL", "1e-9"))
+
+
+def _cache_size() -> int:
+    return max(0, int(os.getenv("DAY_MAPS_CACHE", "200000") or 0))
+
+
+@dataclass
+class DayState:
+    """Wynik toru z ostatniego przebiegu w rozbiciu na dni (dzień UTC → skrót, SOC startowy, wiersze)."""
+    days: Dict[int, Tuple[str, float, int, int]]  # dzień [ns] → (skrót, SOC startowy, wiersz od, wiersz do)
+    frame: pd.DataFrame
+
+
+_STATE: Dict[str, DayState] = {}
+_MAPS: "OrderedDict[Tuple[str, str], DayMap]" = OrderedDict()
+# tory OZE i ARBI liczone równolegle (DAG) dzielą jedno LRU — get/move_to_end/popitem pod blokadą
+_MAPS_LOCK = threading.Lock()
+
+
+def reset() -> None:
+    _STATE.clear()
+    with _MAPS_LOCK:
+        _MAPS.clear()
+
+
+# ---------- dni i skróty ----------
+
+def day_layout(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """(dzień UTC [ns] każdego dnia, indeks pierwszego wiersza dnia); `df` posortowane po ts_utc."""
+    ts_ns = timestamps_ns(df["ts_utc"])
+    day = ts_ns - np.mod(ts_ns, DAY_NS)
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    return day[starts], starts
+
+
+def _params_key(track: str, tp: TrackParams) -> bytes:
+    return (track + tp.model_dump_json(exclude={"soc_init_mwh"})).encode("utf-8")
+
+
+def day_keys(track: str, df: pd.DataFrame, dt: np.ndarray, tp: TrackParams, starts: np.ndarray,
+             low=None, high=None) -> np.ndarray:
+    """Skrót wejścia każdego dnia (wszystko, od czego zależą wiersze dnia poza SOC startowym)."""
+    n = len(df)
+    cols = [timestamps_ns(df["ts_utc"]).view(np.float64), dt]
+    if track == "oze":
+        cols.append(df["delta_brutto"].to_numpy(dtype=float, na_value=np.nan))
+    else:
+        cols += [df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan),
+                 K.per_step(low, n), K.per_step(high, n)]
+    cols += [df[c].to_numpy(dtype=float) for c in sorted(df.columns) if c.startswith(SCHED_PREFIX)]
+    mat = np.ascontiguousarray(np.column_stack(cols))
+    p = _params_key(track, tp)
+    ends = np.r_[starts[1:], n]
+    return np.array([hashlib.blake2b(p + mat[s:e].tobytes(), digest_size=16).hexdigest()
+                     for s, e in zip(starts, ends)], dtype=object)
+
+
+# ---------- mapy ----------
+
+def _step_maps(track: str, df: pd.DataFrame, dt: np.ndarray, tp: TrackParams, low=None, high=None):
+    """Odwzorowania kroków toru (a, lo, hi) — jak w kernels.oze_arrays / arbi_arrays."""
+    st = K.track_steps(tp, df)
+    leak_cap = st.self_dis * st.emax * dt if st.self_dis > 0.0 else np.zeros_like(dt)
+    leak_cap = np.broadcast_to(leak_cap, dt.shape).astype(float)
+    e_cap_ch, e_cap_dis = st.c_ch * dt, st.c_dis * dt
+    if track == "oze":
+        need = df["delta_brutto"].to_numpy(dtype=float)
+        shift_up = np.where(need > 0.0, np.minimum(e_cap_ch, need * st.eta_ch), 0.0)
+        shift_down = np.where(need < 0.0, np.minimum(e_cap_dis, np.abs(need) / np.maximum(st.eta_dis, K.EPS)), 0.0)
+    else:
+        n = len(df)
+        price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+        ch, dis = K.arbi_masks(price, K.per_step(low, n), K.per_step(high, n))
+        shift_up = np.where(ch, e_cap_ch, 0.0)
+        shift_down = np.where(dis, e_cap_dis, 0.0)
+    return K._step_maps(leak_cap, shift_up, shift_down, st.soc_min, st.soc_max, st.varying)
+
+
+def compose_segments(a: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+                     starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Złożenie odwzorowań kroków w obrębie segmentów (początki `starts`) → jedna mapa na segment."""
+    n = len(a)
+    seg = np.cumsum(np.isin(np.arange(n), starts)) - 1
+    A, LO, HI = a.copy(), lo.copy(), hi.copy()
+    longest = int(np.diff(np.r_[starts, n]).max()) if n else 0
+    d = 1
+    while d < longest:
+        same = seg[d:] == seg[:-d]
+        nA, nLO, nHI = K._then(A[:-d], LO[:-d], HI[:-d], A[d:], LO[d:], HI[d:])
+        A[d:] = np.where(same, nA, A[d:])
+        LO[d:] = np.where(same, nLO, LO[d:])
+        HI[d:] = np.where(same, nHI, HI[d:])
+        d *= 2
+    last = np.r_[starts[1:], n] - 1
+    return A[last], LO[last], HI[last]
+
+
+def day_maps(track: str, df: pd.DataFrame, dt: np.ndarray, tp: TrackParams, starts: np.ndarray,
+             keys: np.ndarray, low=None, high=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+    """Mapy wszystkich dni: z cache albo złożone z kroków (tylko dni bez mapy w cache). + liczba trafień."""
+    nd = len(starts)
+    A, LO, HI = np.empty(nd), np.empty(nd), np.empty(nd)
+    miss = []
+    with _MAPS_LOCK:
+        for i, k in enumerate(keys):
+            m = _MAPS.get((track, k))
+            if m is None:
+                miss.append(i)
+            else:
+                _MAPS.move_to_end((track, k))
+                A[i], LO[i], HI[i] = m
+    if miss:
+        ends = np.r_[starts[1:], len(df)]
+        rows = np.concatenate([np.arange(starts[i], ends[i]) for i in miss])
+        seg_starts = np.r_[0, np.cumsum([ends[i] - starts[i] for i in miss])[:-1]]
+        sub = df.iloc[rows]
+        a, lo, hi = _step_maps(track, sub, dt[rows], tp,
+                               low if np.ndim(low) == 0 else np.asarray(low)[rows],
+                               high if np.ndim(high) == 0 else np.asarray(high)[rows])
+        ma, mlo, mhi = compose_segments(a, lo, hi, seg_starts)
+        A[miss], LO[miss], HI[miss] = ma, mlo, mhi
+        limit = _cache_size()
+        with _MAPS_LOCK:
+            for j, i in enumerate(miss):
+                _MAPS[(track, keys[i])] = (float(ma[j]), float(mlo[j]), float(mhi[j]))
+            while len(_MAPS) > limit:
+                _MAPS.popitem(last=False)
+    return A, LO, HI, nd - len(miss)
+
+
+# ---------- przebieg toru ----------
+
+def _slice(v, s: int, e: int):
+    return v if v is None or np.ndim(v) == 0 else np.asarray(v)[s:e]
+
+
+def _compute(track: str, df: pd.DataFrame, tp: TrackParams, low, high) -> pd.DataFrame:
+    if track == "oze":
+        return run_track("oze", df, tp)
+    return run_track("arbi", df, tp, low, high)
+
+
+def run(track: str, df: pd.DataFrame, tp: TrackParams, low=None, high=None) -> pd.DataFrame:
+    """
+    Wynik toru `track` (oze | arbi) jak run_track; gdy poprzedni przebieg tego procesu zostawił
+    stan dni, dni niezmienione (skrót + SOC startowy) są brane z niego, reszta liczona ciągami dni.
+    """
+    if not enabled() or df.empty:
+        _STATE.pop(track, None)
+        return _compute(track, df, tp, low, high)
+
+    dt = K.frame_step_hours(df)
+    labels, starts = day_layout(df)
+    keys = day_keys(track, df, dt, tp, starts, low, high)
+    st = K.track_steps(tp, df)
+    s0 = st.soc0
+    if track == "oze":
+        s0 = min(max(s0, st.at("soc_min")), st.at("soc_max"))
+    elif not K._in_domain(s0, st.at("soc_min"), st.at("soc_max")):
+        # SOC startowy ARBI poza granicami — pierwszy krok nie jest odwzorowaniem clamp-shift
+        _STATE.pop(track, None)
+        return _compute(track, df, tp, low, high)
+
+    A, LO, HI, hits = day_maps(track, df, dt, tp, starts, keys, low, high)
+    soc_start, _ = K._soc_path(s0, A, LO, HI)
+    ends = np.r_[starts[1:], len(df)]
+
+    prev = _STATE.get(track)
+    reuse = np.zeros(len(starts), dtype=bool)
+    if prev is not None:
+        atol = _atol()
+        for i, (lab, k) in enumerate(zip(labels.tolist(), keys)):
+            p = prev.days.get(lab)
+            reuse[i] = p is not None and p[0] == k and abs(p[1] - soc_start[i]) <= atol
+
+    if not reuse.any():
+        out = _compute(track, df, tp, low, high)
+    else:
+        parts = []
+        i, nd = 0, len(starts)
+        while i < nd:
+            j = i
+            while j < nd and reuse[j] == reuse[i]:
+                j += 1
+            if reuse[i]:
+                _, _, r0, _ = prev.days[int(labels[i])]
+                _, _, _, r1 = prev.days[int(labels[j - 1])]
+                parts.append(prev.frame.iloc[r0:r1])
+            else:
+                s, e = int(starts[i]), int(ends[j - 1])
+                sub = df.iloc[s:e].reset_index(drop=True).assign(step_hours=dt[s:e])
+                tp_i = tp.model_copy(update={"soc_init_mwh": float(soc_start[i])})
+                parts.append(_compute(track, sub, tp_i, _slice(low, s, e), _slice(high, s, e)))
+            i = j
+        out = pd.concat(parts, ignore_index=True)
+    log.info("Day maps %s: days=%d reused=%d recomputed=%d (map cache hits=%d)",
+             track, len(starts), int(reuse.sum()), int((~reuse).sum()), hits)
+
+    _STATE[track] = DayState(
+        days={int(lab): (k, float(s), int(r0), int(r1))
+              for lab, k, s, r0, r1 in zip(labels.tolist(), keys, soc_start, starts, ends)},
+        frame=out,
+    )
+    return out
@@ -0,0 +1,248 @@
+# src/energy_calc/detail_writer.py
+"""
+Zapis tabel output.energy_*_detail: pełny (TRUNCATE + COPY) lub różnicowy.
+
+Tryb różnicowy (DETAIL_WRITE_MODE=diff, domyślny):
+  1. wynik dzielony jest na bloki wg siatki ts_start (komórka = floor(ts_start / DETAIL_BLOCK_SPAN),
+     domyślnie 7 dni) — wstawka, usunięcie albo uzupełniona luka przesuwa tylko własny blok;
+     każdy blok ma skrót liczony wektorowo z kolumn wyniku (hash_pandas_object → blake2b per blok),
+  2. skróty porównywane są ze skrótami opublikowanymi (output.energy_detail_blocks),
+  3. ciągłe zakresy zmienionych bloków trafiają COPY do tabeli tymczasowej, a potem
+     DELETE po zakresie komórek [początek, koniec) + INSERT … SELECT — w jednej transakcji.
+Wolumen WAL jest więc proporcjonalny do liczby zmienionych bloków, nie do długości historii.
+Brak skrótów bazowych (pierwszy zapis, pusta tabela) → zapis pełny + zapis skrótów.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import psycopg
+
+from .io_db import DETAIL_TABLES, ensure_output_objects
+from .map_detail import BROKER_COLS, OZE_COLS, ARBI_COLS, TRACKS_COLS, TAG_COLS, sanitize_types
+
+LOG = logging.getLogger(__name__)
+
+TABLE_COLS: Dict[str, List[str]] = {
+    "broker": BROKER_COLS + TAG_COLS, "oze": OZE_COLS + TAG_COLS, "arbi": ARBI_COLS + TAG_COLS,
+    "tracks": TRACKS_COLS + TAG_COLS,
+}
+BLOCKS_TABLE = "energy_detail_blocks"
+
+
+@dataclass(frozen=True)
+class Block:
+    block_no: int
+    ts_min: np.datetime64
+    ts_max: np.datetime64
+    n_rows: int
+    block_hash: str
+
+
+def write_mode() -> str:
+    mode = os.getenv("DETAIL_WRITE_MODE", "diff").strip().lower()
+    return mode if mode in ("diff", "full") else "diff"
+
+
+def block_span() -> np.timedelta64:
+    """DETAIL_BLOCK_SPAN — szerokość komórki siatki ts_start (krok stałej długości, domyślnie 7D)."""
+    rule = os.getenv("DETAIL_BLOCK_SPAN", "7D").strip() or "7D"
+    try:
+        span = pd.Timedelta(rule).to_timedelta64().astype("timedelta64[us]")
+    except ValueError:
+        span = np.timedelta64(0, "us")
+    if span <= np.timedelta64(0, "us"):
+        raise ValueError(f"DETAIL_BLOCK_SPAN={rule!r}: oczekiwano dodatniego kroku")
+    return span
+
+
+def _naive_ts(s: pd.Series) -> np.ndarray:
+    """ts jak trafia do kolumny `timestamp without time zone` (czas ścienny, bez strefy)."""
+    ts = pd.to_datetime(s)
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_localize(None)
+    return ts.to_numpy(dtype="datetime64[us]")
+
+
+def _cell(ts: np.ndarray, span: np.timedelta64) -> np.ndarray:
+    """Numer komórki siatki: floor(ts / span) od epoki."""
+    return np.floor_divide(ts.astype(np.int64), span.astype(np.int64))
+
+
+def _cell_bounds(b0: int, b1: int, span: np.timedelta64) -> Tuple[np.datetime64, np.datetime64]:
+    """[początek komórki b0, początek komórki b1 + 1) jako ts."""
+    step = int(span.astype(np.int64))
+    return np.datetime64(b0 * step, "us"), np.datetime64((b1 + 1) * step, "us")
+
+
+def compute_blocks(df: pd.DataFrame, span: np.timedelta64) -> List[Block]:
+    """
+    Skróty bloków wyniku (po sanitize_types, kolejność kolumn jak w tabeli). Blok = komórka
+    siatki ts_start (`block_no` = floor(ts_start / span)) — wstawka albo usunięcie wiersza
+    zmienia tylko własny blok, granice dalszych bloków się nie przesuwają. `df` posortowane po ts_start.
+    """
+    n = len(df)
+    if n == 0:
+        return []
+    row_hash = pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+    ts = _naive_ts(df["ts_start"])
+    cell = _cell(ts, span)
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    stops = np.r_[starts[1:], n]
+    return [
+        Block(int(cell[a]), ts[a:z].min(), ts[a:z].max(), int(z - a),
+              hashlib.blake2b(row_hash[a:z].tobytes(), digest_size=16).hexdigest())
+        for a, z in zip(starts, stops)
+    ]
+
+
+def _load_blocks(conn: psycopg.Connection, schema: str, table: str) -> List[Block]:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT block_no, ts_min, ts_max, n_rows, block_hash FROM {schema}.{BLOCKS_TABLE} "
+            "WHERE table_name = %s ORDER BY block_no",
+            (table,),
+        )
+        return [Block(int(b), np.datetime64(lo, "us"), np.datetime64(hi, "us"), int(n), h)
+                for b, lo, hi, n, h in cur.fetchall()]
+
+
+def _save_blocks(conn: psycopg.Connection, schema: str, table: str,
+                 blocks: List[Block], only: Optional[Iterable[int]] = None) -> None:
+    """Podmienia skróty bloków o numerach `only` (None = wszystkie); numer bez nowego bloku — usuwany."""
+    with conn.cursor() as cur:
+        if only is None:
+            cur.execute(f"DELETE FROM {schema}.{BLOCKS_TABLE} WHERE table_name = %s", (table,))
+            todo = blocks
+        else:
+            only = sorted(set(only))
+            cur.execute(
+                f"DELETE FROM {schema}.{BLOCKS_TABLE} WHERE table_name = %s AND block_no = ANY(%s)",
+                (table, only),
+            )
+            todo = [blk for blk in blocks if blk.block_no in set(only)]
+        if todo:
+            with cur.copy(
+                f"COPY {schema}.{BLOCKS_TABLE} (table_name, block_no, ts_min, ts_max, n_rows, block_hash) FROM STDIN"
+            ) as cp:
+                for blk in todo:
+                    cp.write_row((table, blk.block_no, blk.ts_min.item(), blk.ts_max.item(), blk.n_rows, blk.block_hash))
+
+
+def _changed_ranges(old: List[Block], new: List[Block]) -> List[Tuple[int, int]]:
+    """Ciągłe zakresy [b0, b1] numerów komórek do przepisania (zmieniony skrót, blok tylko w `old` albo `new`)."""
+    a = {blk.block_no: blk.block_hash for blk in old}
+    b = {blk.block_no: blk.block_hash for blk in new}
+    changed = sorted(k for k in set(a) | set(b) if a.get(k) != b.get(k))
+    ranges: List[Tuple[int, int]] = []
+    for k in changed:
+        if ranges and k == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], k)
+        else:
+            ranges.append((k, k))
+    return ranges
+
+
+def _on_grid(blocks: List[Block], span: np.timedelta64) -> bool:
+    """Czy zapisane bloki leżą w komórkach bieżącej siatki (inaczej zmiana DETAIL_BLOCK_SPAN / stary format)."""
+    lo = _cell(np.array([b.ts_min for b in blocks], dtype="datetime64[us]"), span)
+    hi = _cell(np.array([b.ts_max for b in blocks], dtype="datetime64[us]"), span)
+    no = np.array([b.block_no for b in blocks], dtype=np.int64)
+    return bool((lo == no).all() and (hi == no).all())
+
+
+def _write_full(conn: psycopg.Connection, schema: str, table: str, df: pd.DataFrame, cols: List[str]) -> None:
+    fq = f"{schema}.energy_{table}_detail"
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {fq}")
+        if not df.empty:
+            with cur.copy(f"COPY {fq} ({','.join(cols)}) FROM STDIN WITH (FORMAT CSV)") as cp:
+                df.to_csv(cp, index=False, header=False)
+
+
+def _write_diff(conn: psycopg.Connection, schema: str, table: str, df: pd.DataFrame, cols: List[str],
+                old: List[Block], new: List[Block], span: np.timedelta64) -> Tuple[List[Tuple[int, int]], int]:
+    """Przepisuje zmienione zakresy komórek; zwraca (zakresy komórek, liczba wstawionych wierszy)."""
+    fq = f"{schema}.energy_{table}_detail"
+    ranges = _changed_ranges(old, new)
+    if not ranges:
+        return [], 0
+    cell = _cell(_naive_ts(df["ts_start"]), span)
+    keep = np.zeros(len(df), dtype=bool)
+    for b0, b1 in ranges:
+        keep |= (cell >= b0) & (cell <= b1)
+    stage = df[keep]
+    tmp = f"_stage_{table}"
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE {tmp} (LIKE {fq}) ON COMMIT DROP")
+        if not stage.empty:
+            with cur.copy(f"COPY {tmp} ({','.join(cols)}) FROM STDIN WITH (FORMAT CSV)") as cp:
+                stage.to_csv(cp, index=False, header=False)
+        for b0, b1 in ranges:
+            lo, hi = _cell_bounds(b0, b1, span)
+            cur.execute(f"DELETE FROM {fq} WHERE ts_start >= %s AND ts_start < %s", (lo.item(), hi.item()))
+        cur.execute(f"INSERT INTO {fq} ({','.join(cols)}) SELECT {','.join(cols)} FROM {tmp}")
+    return ranges, len(stage)
+
+
+def write_details(
+    conn: psycopg.Connection,
+    frames: Dict[str, pd.DataFrame],
+    schema: str = "output",
+    tables: Iterable[str] = DETAIL_TABLES,
+    mode: Optional[str] = None,
+    ensure: bool = True,
+) -> None:
+    """
+    Zapisuje wskazane tabele detail w jednej transakcji (pełny lub różnicowy zapis, patrz moduł).
+    `ensure=False` — obiekty output już utworzone przed transakcją zapisu (DDL wewnątrz niej
+    trzymałby blokady widoków do commitu).
+    """
+    mode = mode or write_mode()
+    span = block_span()
+    if ensure:
+        ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+
+    with conn.transaction():
+        for table in [t for t in DETAIL_TABLES if t in set(tables)]:
+            cols = TABLE_COLS[table]
+            df = sanitize_types(frames[table], cols).reset_index(drop=True)
+            new = compute_blocks(df, span)
+            old = _load_blocks(conn, schema, table) if mode == "diff" else []
+            if old and not _table_has_rows(conn, schema, table):
+                LOG.info("Detail %s: stored block hashes but table is empty → full write", table)
+                old = []
+            if old and not _on_grid(old, span):
+                LOG.info("Detail %s: stored blocks off the DETAIL_BLOCK_SPAN grid → full write", table)
+                old = []
+            if not old:
+                _write_full(conn, schema, table, df, cols)
+                _save_blocks(conn, schema, table, new)
+                LOG.info("Detail %s: full write rows=%d blocks=%d", table, len(df), len(new))
+                continue
+            ranges, n_rows = _write_diff(conn, schema, table, df, cols, old, new, span)
+            changed = [b for b0, b1 in ranges for b in range(b0, b1 + 1)]
+            _save_blocks(conn, schema, table, new, only=changed)
+            LOG.info(
+                "Detail %s: diff write ranges=%d rows=%d/%d (%.1f%%) blocks changed=%d/%d",
+                table, len(ranges), n_rows, len(df), 100.0 * n_rows / len(df) if len(df) else 0.0,
+                len(changed), len(new),
+            )
+
+
+def _table_has_rows(conn: psycopg.Connection, schema: str, table: str) -> bool:
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {schema}.energy_{table}_detail)")
+        return bool(cur.fetchone()[0])
+
+
+def clear_blocks(conn: psycopg.Connection, schema: str = "output", tables: Iterable[str] = DETAIL_TABLES) -> None:
+    """Unieważnia skróty bloków (po zapisie z pominięciem tego modułu, np. tryb strumieniowy)."""
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {schema}.{BLOCKS_TABLE} WHERE table_name = ANY(%s)", (list(tables),))
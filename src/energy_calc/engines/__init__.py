@@ -1,4 +1,12 @@
-from .oze import compute_oze_detail
-from .arbi import compute_arbi_detail
-
+# Eksport leniwy (PEP 562): import pakietu engines (np. rejestru backendów) nie ładuje silników referencyjnych.
 __all__ = ["compute_oze_detail", "compute_arbi_detail"]
+
+
+def __getattr__(name):
+    if name == "compute_oze_detail":
+        from .oze import compute_oze_detail
+        return compute_oze_detail
+    if name == "compute_arbi_detail":
+        from .arbi import compute_arbi_detail
+        return compute_arbi_detail
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
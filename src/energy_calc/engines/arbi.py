@@ -1,8 +1,10 @@
 from __future__ import annotations
 import logging
-from typing import Optional
+from typing import Union
+import numpy as np
 import pandas as pd
 from ..models import TrackParams
+from .kernels import per_step, track_steps
 
 log = logging.getLogger(__name__).getChild("arbi")
 
@@ -10,11 +12,13 @@ log = logging.getLogger(__name__).getChild("arbi")
 def compute_arbi_detail(
     df: pd.DataFrame,
     tp: TrackParams,
-    price_low_pln_mwh: Optional[float],
-    price_high_pln_mwh: Optional[float],
+    price_low_pln_mwh: Union[float, np.ndarray, None],
+    price_high_pln_mwh: Union[float, np.ndarray, None],
 ) -> pd.DataFrame:
     """
     Arbitraż cenowy: price <= low → ładuj; price >= high → rozładowuj.
+    Progi: skalar (stałe dla całej historii) albo tablica per krok
+    (np. z engines.thresholds); NaN w tablicy = brak handlu w kroku.
     Zwraca kolumny dla output.energy_arbi_detail (z finansami).
     """
     cols = [
@@ -30,28 +34,35 @@ def compute_arbi_detail(
         return pd.DataFrame(columns=cols)
 
     ts = pd.to_datetime(df["ts_utc"])
-    step = (ts.shift(-1) - ts).dt.total_seconds().div(3600.0)
-    default_step = step.dropna().median() if step.dropna().size else 1.0
-    step = step.fillna(default_step).clip(lower=1e-9)
-
-    emax = float(tp.emax_mwh)
-    soc_min = float(tp.soc_min_mwh)
-    soc_max = float(tp.soc_max_mwh)
-    soc = float(tp.soc_init_mwh)
-
-    c_ch = float(tp.c_rate_ch_mw)
-    c_dis = float(tp.c_rate_dis_mw)
-    eta_ch = float(tp.eta_ch)
-    eta_dis = float(tp.eta_dis)
-    self_dis = float(tp.self_discharge_per_h)
+    if "step_hours" in df.columns:
+        # Δt podane z zewnątrz (tryb strumieniowy: ostatni krok paczki zna ts następnej)
+        step = df["step_hours"].astype(float)
+    else:
+        step = (ts.shift(-1) - ts).dt.total_seconds().div(3600.0)
+        default_step = step.dropna().median() if step.dropna().size else 1.0
+        step = step.fillna(default_step).clip(lower=1e-9)
+
+    # parametry toru per krok (stałe albo z harmonogramu params.schedules — kolumny sched_*)
+    st = track_steps(tp, df)
+    n = len(df)
+    emax_a, soc_min_a, soc_max_a, c_ch_a, c_dis_a, eta_ch_a, eta_dis_a = (
+        per_step(v, n).tolist()  # floaty Pythona: round() jak dotąd (np.float64 zaokrągla inaczej)
+        for v in (st.emax, st.soc_min, st.soc_max, st.c_ch, st.c_dis, st.eta_ch, st.eta_dis)
+    )
+    soc = st.soc0
+    self_dis = st.self_dis
 
-    low = price_low_pln_mwh
-    high = price_high_pln_mwh
+    low = per_step(price_low_pln_mwh, len(df))  # None → NaN = brak handlu
+    high = per_step(price_high_pln_mwh, len(df))
 
     rows = []
     for i, r in df.iterrows():
         ts_start = ts.iloc[i]
         dt_h = float(step.iloc[i])
+        emax, soc_min, soc_max = emax_a[i], soc_min_a[i], soc_max_a[i]
+        c_ch, c_dis, eta_ch, eta_dis = c_ch_a[i], c_dis_a[i], eta_ch_a[i], eta_dis_a[i]
+        if i > 0:
+            soc = min(max(soc, soc_min), soc_max)  # granice zmienne w czasie; przy stałych no-op
         ts_end = ts_start + pd.Timedelta(hours=dt_h)
 
         price = None if pd.isna(r["price_pln_mwh"]) else float(r["price_pln_mwh"])
@@ -72,8 +83,9 @@ def compute_arbi_detail(
         e_ch = e_dis = loss_conv = 0.0
         cost = revenue = 0.0
 
-        if price is not None and low is not None and high is not None:
-            if price <= low:
+        lo, hi = low[i], high[i]
+        if price is not None and lo == lo and hi == hi:
+            if price <= lo:
                 can_store = soc_max - soc
                 if can_store > 1e-12:
                     e_store_max = min(can_store, e_cap_ch)
@@ -87,7 +99,7 @@ def compute_arbi_detail(
                         hit_max = True
                 else:
                     hit_max = True
-            elif price >= high:
+            elif price >= hi:
                 can_supply = soc - soc_min
                 if can_supply > 1e-12:
                     e_take_max = min(can_supply, e_cap_dis)
@@ -125,6 +137,7 @@ def compute_arbi_detail(
         })
 
     out = pd.DataFrame(rows)
+    out.attrs["soc_end_exact"] = soc  # SOC bez zaokrąglenia (kontynuacja w kolejnej paczce)
     log.info(
         "ARBI detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f) | net=%.2f PLN",
         len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
@@ -1,11 +1,33 @@
 from __future__ import annotations
 import logging
+from typing import Dict
 import numpy as np
 import pandas as pd
 from ..models import Params
+from . import kernels as K
 
 log = logging.getLogger(__name__).getChild("broker")
 
+# Bity kolumny constraint_mask (smallint; bit i = 1 << i) — kolejność = widok output.energy_constraint_codes
+CONSTRAINT_CODES = (
+    "CONTRACT_CH",      # ładowanie obcięte mocą umowną
+    "CONTRACT_DIS",     # rozładowanie obcięte mocą umowną
+    "C_RATE_CH",        # ładowanie obcięte łączną mocą ładowania magazynu
+    "C_RATE_DIS",       # rozładowanie obcięte łączną mocą rozładowania magazynu
+    "OZE_CUT_CH",       # alokacja OZE < żądanie (ładowanie)
+    "OZE_CUT_DIS",
+    "ARBI_CUT_CH",      # alokacja ARBI < żądanie (ładowanie)
+    "ARBI_CUT_DIS",
+    "OZE_SOC_MAX",      # tor OZE oparty o soc_max (hit_part_cap_max)
+    "OZE_SOC_MIN",
+    "ARBI_SOC_MAX",
+    "ARBI_SOC_MIN",
+    "OZE_C_RATE",       # tor OZE na własnym limicie mocy (ładowanie lub rozładowanie)
+    "ARBI_C_RATE",
+)
+CONSTRAINT_BITS = {c: 1 << i for i, c in enumerate(CONSTRAINT_CODES)}
+_TOL = 1e-6  # moce w wyniku torów zaokrąglone do 6 miejsc
+
 
 def compute_broker_detail(
     df_base: pd.DataFrame,   # ts_utc, delta_brutto, price_pln_mwh (nieużywane tu poza czasem)
@@ -22,22 +44,32 @@ def compute_broker_detail(
         "req_ch_oze_mw","req_dis_oze_mw","req_ch_arbi_mw","req_dis_arbi_mw",
         "cap_ch_mw","cap_dis_mw","cap_contract_mw",
         "alloc_ch_oze_mw","alloc_dis_oze_mw","alloc_ch_arbi_mw","alloc_dis_arbi_mw",
-        "note",
+        "note","constraint_mask",
     ]
     if df_oze.empty or df_arbi.empty:
         return pd.DataFrame(columns=cols)
 
-    o = df_oze[["ts_start","ts_end","step_hours","p_ch_mw","p_dis_mw"]].rename(
-        columns={"p_ch_mw":"req_ch_oze_mw","p_dis_mw":"req_dis_oze_mw"}
+    hits = ["hit_part_cap_max","hit_part_cap_min"]
+    o = df_oze[["ts_start","ts_end","step_hours","p_ch_mw","p_dis_mw"] + hits].rename(
+        columns={"p_ch_mw":"req_ch_oze_mw","p_dis_mw":"req_dis_oze_mw",
+                 "hit_part_cap_max":"oze_hit_max","hit_part_cap_min":"oze_hit_min"}
     )
-    a = df_arbi[["ts_start","ts_end","step_hours","p_ch_mw","p_dis_mw"]].rename(
-        columns={"p_ch_mw":"req_ch_arbi_mw","p_dis_mw":"req_dis_arbi_mw"}
+    a = df_arbi[["ts_start","ts_end","step_hours","p_ch_mw","p_dis_mw"] + hits].rename(
+        columns={"p_ch_mw":"req_ch_arbi_mw","p_dis_mw":"req_dis_arbi_mw",
+                 "hit_part_cap_max":"arbi_hit_max","hit_part_cap_min":"arbi_hit_min"}
     )
     m = o.merge(a, on=["ts_start","ts_end","step_hours"], how="inner").copy()
 
-    cap_ch_mw = params.oze.c_rate_ch_mw + params.arbi.c_rate_ch_mw
-    cap_dis_mw = params.oze.c_rate_dis_mw + params.arbi.c_rate_dis_mw
-    contract = params.moc_umowna_mw if params.moc_umowna_mw and params.moc_umowna_mw > 0 else None
+    # moce torów i moc umowna: skalary albo per krok z harmonogramu (kolumny sched_* w df_base)
+    cap_ch_mw = (params.oze.c_rate_ch_mw + params.arbi.c_rate_ch_mw) * _sched(df_base, "sched_p_ch_x", 1.0)
+    cap_dis_mw = (params.oze.c_rate_dis_mw + params.arbi.c_rate_dis_mw) * _sched(df_base, "sched_p_dis_x", 1.0)
+    contract = _sched(df_base, "sched_moc_umowna_mw", params.moc_umowna_mw)
+    if np.ndim(contract):
+        contract = np.where(contract > 0, contract, np.nan)
+        if np.isnan(contract).all():
+            contract = None
+    elif not (contract and contract > 0):
+        contract = None
 
     req_ch_oze = m["req_ch_oze_mw"].to_numpy()
     req_ch_arbi = m["req_ch_arbi_mw"].to_numpy()
@@ -47,8 +79,8 @@ def compute_broker_detail(
     cap_ch = np.full(len(m), cap_ch_mw, dtype=float)
     cap_dis = np.full(len(m), cap_dis_mw, dtype=float)
     if contract is not None:
-        cap_ch = np.minimum(cap_ch, contract)
-        cap_dis = np.minimum(cap_dis, contract)
+        cap_ch = np.fmin(cap_ch, contract)
+        cap_dis = np.fmin(cap_dis, contract)
 
     alloc_ch_oze = np.minimum(req_ch_oze, cap_ch)
     remaining_ch = np.maximum(0.0, cap_ch - alloc_ch_oze)
@@ -68,8 +100,61 @@ def compute_broker_detail(
     out["alloc_dis_arbi_mw"] = alloc_dis_arbi
     out["note"] = None
 
+    bits = {
+        "OZE_CUT_CH": alloc_ch_oze < req_ch_oze - _TOL,
+        "OZE_CUT_DIS": alloc_dis_oze < req_dis_oze - _TOL,
+        "ARBI_CUT_CH": alloc_ch_arbi < req_ch_arbi - _TOL,
+        "ARBI_CUT_DIS": alloc_dis_arbi < req_dis_arbi - _TOL,
+    }
+    # obcięcie przypisane do limitu, który wyznaczył cap (moc umowna ≤ moc magazynu → CONTRACT)
+    cut_ch = bits["OZE_CUT_CH"] | bits["ARBI_CUT_CH"]
+    cut_dis = bits["OZE_CUT_DIS"] | bits["ARBI_CUT_DIS"]
+    by_contract_ch = np.zeros(len(m), dtype=bool) if contract is None else contract <= cap_ch_mw
+    by_contract_dis = np.zeros(len(m), dtype=bool) if contract is None else contract <= cap_dis_mw
+    bits.update(CONTRACT_CH=cut_ch & by_contract_ch, C_RATE_CH=cut_ch & ~by_contract_ch,
+                CONTRACT_DIS=cut_dis & by_contract_dis, C_RATE_DIS=cut_dis & ~by_contract_dis)
+    # limity torów: flagi SOC z wyniku torów, limit mocy z parametrów (harmonogram sched_* w df_base)
+    for name, tp in (("OZE", params.oze), ("ARBI", params.arbi)):
+        t = name.lower()
+        st = K.track_steps(tp, df_base if len(df_base) == len(m) else None)
+        p_ch, p_dis = m[f"req_ch_{t}_mw"].to_numpy(dtype=float), m[f"req_dis_{t}_mw"].to_numpy(dtype=float)
+        bits[f"{name}_SOC_MAX"] = m[f"{t}_hit_max"].fillna(False).to_numpy(dtype=bool)
+        bits[f"{name}_SOC_MIN"] = m[f"{t}_hit_min"].fillna(False).to_numpy(dtype=bool)
+        bits[f"{name}_C_RATE"] = ((p_ch > _TOL) & (p_ch >= st.c_ch - _TOL)) \
+            | ((p_dis > _TOL) & (p_dis >= st.c_dis * st.eta_dis - _TOL))
+    mask = constraint_mask(bits, len(m))
+    out["constraint_mask"] = mask
+
     log.info(
-        "BROKER detail | rows=%d | cap[ch=%.3f,dis=%.3f], contract=%s",
-        len(out), cap_ch_mw, cap_dis_mw, f"{contract:.3f}" if contract else "None"
+        "BROKER detail | rows=%d | cap[ch=%s,dis=%s], contract=%s | constraints: %s",
+        len(out), _fmt(cap_ch_mw), _fmt(cap_dis_mw), "None" if contract is None else _fmt(contract),
+        ", ".join(f"{k}={v}" for k, v in constraint_counts(mask).items() if v) or "none",
     )
     return out[cols]
+
+
+def constraint_mask(bits: Dict[str, np.ndarray], n: int) -> np.ndarray:
+    """Flagi {kod: bool[n]} → maska int16 (bity wg CONSTRAINT_BITS)."""
+    mask = np.zeros(n, dtype=np.int16)
+    for code, flag in bits.items():
+        mask |= np.where(flag, CONSTRAINT_BITS[code], 0).astype(np.int16)
+    return mask
+
+
+def constraint_counts(mask) -> Dict[str, int]:
+    """Liczba kroków z aktywnym ograniczeniem, per kod (maska z kolumny constraint_mask)."""
+    m = np.asarray(mask, dtype=np.int64)
+    return {c: int(np.count_nonzero(m & b)) for c, b in CONSTRAINT_BITS.items()}
+
+
+def _sched(df_base: pd.DataFrame, col: str, default):
+    """Kolumna harmonogramu (params.schedules) jako tablica per krok; brak → `default`."""
+    return df_base[col].to_numpy(dtype=float) if col in df_base.columns else default
+
+
+def _fmt(v) -> str:
+    if np.ndim(v) == 0:
+        return f"{float(v):.3f}"
+    v = np.asarray(v, dtype=float)
+    lo, hi = np.nanmin(v), np.nanmax(v)
+    return f"{lo:.3f}" if lo == hi else f"{lo:.3f}..{hi:.3f}"
@@ -0,0 +1,78 @@
+"""
+Backend `compiled`: sekwencyjne kernele z engines/kernels.py skompilowane numbą
+(nogil — mogą liczyć równolegle w wątkach). Brak numby → ImportError, a rejestr
+backendów przechodzi na następny w kolejności.
+"""
+from __future__ import annotations
+import logging
+from typing import Dict, Union
+
+import numba
+import numpy as np
+import pandas as pd
+
+from ..models import Params, TrackParams
+from . import kernels as K
+from . import multitrack as M
+
+log = logging.getLogger(__name__).getChild("compiled")
+
+_oze_loop = numba.njit(cache=True, nogil=True)(K.oze_loop)
+_arbi_loop = numba.njit(cache=True, nogil=True)(K.arbi_loop)
+_multi_loop = numba.njit(cache=True, nogil=True)(M.multi_loop)
+
+
+def oze_kernel(need: np.ndarray, dt: np.ndarray, tp: Union[TrackParams, K.TrackSteps]) -> Dict[str, np.ndarray]:
+    """Surowe tablice kroków toru OZE (bez ramki) — np. dla optymalizatora."""
+    return dict(zip(K.OZE_LOOP_KEYS, _oze_loop(*K.oze_loop_args(need, dt, tp))))
+
+
+def arbi_kernel(price: np.ndarray, low, high, dt: np.ndarray, tp: Union[TrackParams, K.TrackSteps]) -> Dict[str, np.ndarray]:
+    return dict(zip(K.ARBI_LOOP_KEYS, _arbi_loop(*K.arbi_loop_args(price, low, high, dt, tp))))
+
+
+def compute_oze_detail(df: pd.DataFrame, tp: TrackParams) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame(columns=K.OZE_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    need = df["delta_brutto"].to_numpy(dtype=float)
+    st = K.track_steps(tp, df)
+    r = oze_kernel(need, dt, st)
+    out = K.oze_frame(ts, dt, r, st)
+    log.info(
+        "OZE detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f)",
+        len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
+        float(out["loss_conv_mwh"].sum()), float(out["loss_idle_mwh"].sum())
+    )
+    return out
+
+
+def compute_arbi_detail(
+    df: pd.DataFrame,
+    tp: TrackParams,
+    price_low_pln_mwh: Union[float, np.ndarray, None],
+    price_high_pln_mwh: Union[float, np.ndarray, None],
+) -> pd.DataFrame:
+    if df.empty:
+        return pd.DataFrame(columns=K.ARBI_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    st = K.track_steps(tp, df)
+    r = arbi_kernel(price, price_low_pln_mwh, price_high_pln_mwh, dt, st)
+    out = K.arbi_frame(ts, dt, price, r, st)
+    log.info(
+        "ARBI detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f) | net=%.2f PLN",
+        len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
+        float(out["loss_conv_mwh"].sum()), float(out["loss_idle_mwh"].sum()),
+        float(out["net_value_pln"].sum())
+    )
+    return out
+
+
+def compute_tracks_detail(df: pd.DataFrame, params: Params) -> pd.DataFrame:
+    """Model N-torowy: wszystkie tory w jednej skompilowanej pętli po krokach."""
+    return M.compute_with(
+        lambda ta, dt: dict(zip(M.MULTI_KEYS, _multi_loop(*M.multi_loop_args(ta, dt)))), df, params,
+    )
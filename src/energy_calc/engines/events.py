@@ -0,0 +1,191 @@
+"""
+Backend `events`: tory SOC liczone zdarzeniowo — pełna logika kroku tylko dla kroków aktywnych.
+
+Krok bezczynny (OZE: delta_brutto = 0, ARBI: cena między progami / brak ceny) zmienia SOC
+wyłącznie samorozładowaniem. Ciąg takich kroków (przy stałych granicach SOC) to jedno
+odwzorowanie w postaci zamkniętej:
+    s ↦ max(s - ΣL, soc_min),   L = self_dis · emax · Δt
+więc skan clamp-shift (engines/kernels.py) idzie po segmentach: każdy krok aktywny osobno,
+każdy ciąg bezczynny jako jeden element. SOC wewnątrz ciągu i wyciek kroków wypełniane są
+hurtowo (suma prefiksowa wycieku), pozostałe kolumny kroków bezczynnych to zera.
+Koszt skanu rośnie z liczbą zdarzeń (transakcji / kompensacji), nie z liczbą kroków.
+"""
+from __future__ import annotations
+import logging
+from typing import Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ..models import TrackParams
+from . import kernels as K
+
+log = logging.getLogger(__name__).getChild("events")
+
+
+def _take(v, idx: np.ndarray):
+    """Parametr toru (skalar albo tablica per krok) w krokach `idx`."""
+    return v if np.ndim(v) == 0 else v[idx]
+
+
+def event_segments(active: np.ndarray, *bounds) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (początki segmentów, numer segmentu każdego kroku): krok aktywny = własny segment,
+    maksymalny ciąg kroków bezczynnych o tych samych granicach (`bounds`) = jeden segment.
+    """
+    n = len(active)
+    brk = np.ones(n, dtype=bool)
+    if n > 1:
+        brk[1:] = active[1:] | active[:-1]
+        for b in bounds:
+            if np.ndim(b):
+                brk[1:] |= b[1:] != b[:-1]
+    return np.flatnonzero(brk), np.cumsum(brk) - 1
+
+
+def event_path(s0: float, active: np.ndarray, leak_cap: np.ndarray,
+               shift_up: np.ndarray, shift_down: np.ndarray,
+               st: K.TrackSteps) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (SOC przed krokiem, SOC po kroku) jak kernels._soc_path; `shift_up/down` tylko dla kroków
+    aktywnych (w kolejności). Wymaga s0 w [soc_min, soc_max] pierwszego kroku.
+    """
+    n = len(active)
+    if n == 0:
+        return np.zeros(0), np.zeros(0)
+    starts, seg = event_segments(active, st.soc_min, st.soc_max)
+    act = np.flatnonzero(active)
+    act_seg = seg[act]
+
+    # odwzorowania segmentów: ciąg bezczynny (z ewentualnym przycięciem na wejściu) w postaci zamkniętej
+    lsum = np.add.reduceat(leak_cap, starts)
+    smin_s = np.broadcast_to(_take(st.soc_min, starts), lsum.shape)
+    smax_s = np.broadcast_to(_take(st.soc_max, starts), lsum.shape)
+    a, lo, hi = -lsum, smin_s.copy(), np.maximum(smax_s - lsum, smin_s)
+    a[act_seg], lo[act_seg], hi[act_seg] = K._step_maps(
+        leak_cap[act], shift_up, shift_down, _take(st.soc_min, act), _take(st.soc_max, act), st.varying)
+    seg_prev, seg_end = K._soc_path(s0, a, lo, hi)
+
+    # SOC kroków bezczynnych: wejście segmentu minus wyciek narastająco, nie poniżej soc_min
+    c = np.cumsum(leak_cap)
+    c_in = c - (c[starts] - leak_cap[starts])[seg]
+    entry = K._entry(seg_prev, smin_s, smax_s, st.varying)[seg]
+    soc_end = np.maximum(entry - c_in, st.soc_min)
+    soc_end[act] = seg_end[act_seg]
+    soc_prev = np.empty_like(soc_end)
+    soc_prev[0] = s0
+    soc_prev[1:] = soc_end[:-1]
+    return soc_prev, soc_end
+
+
+def _idle_fill(n: int, soc_prev: np.ndarray, soc_end: np.ndarray, st: K.TrackSteps,
+               keys: Tuple[str, ...]) -> Dict[str, np.ndarray]:
+    """Wyniki wszystkich kroków jak dla bezczynnych: tylko wyciek, SOC startu = SOC końca."""
+    r = {k: np.zeros(n, dtype=bool) if k.startswith("hit_") else np.zeros(n) for k in keys}
+    r["soc_start"] = soc_end.copy()
+    r["soc_end"] = soc_end
+    r["loss_idle"] = K._entry(soc_prev, st.soc_min, st.soc_max, st.varying) - soc_end
+    return r
+
+
+def _scatter(r: Dict[str, np.ndarray], act: np.ndarray, sub: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    for k, v in sub.items():
+        r[k][act] = v
+    return r
+
+
+def oze_kernel(need: np.ndarray, dt: np.ndarray, tp: Union[TrackParams, K.TrackSteps]) -> Dict[str, np.ndarray]:
+    """Surowe tablice kroków toru OZE (bez ramki) — np. dla optymalizatora."""
+    st = K.track_steps(tp)
+    need = np.asarray(need, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    n = len(need)
+    s0 = min(max(st.soc0, st.at("soc_min")), st.at("soc_max")) if n else st.soc0
+    leak_cap = st.self_dis * st.emax * dt if st.self_dis > 0.0 else np.zeros_like(dt)
+    leak_cap = np.broadcast_to(leak_cap, dt.shape).astype(float)
+
+    active = (need > 0.0) | (need < 0.0)
+    act = np.flatnonzero(active)
+    nd, dt_a = need[act], dt[act]
+    eta_ch, eta_dis = _take(st.eta_ch, act), _take(st.eta_dis, act)
+    e_cap_ch, e_cap_dis = _take(st.c_ch, act) * dt_a, _take(st.c_dis, act) * dt_a
+    shift_up = np.where(nd > 0.0, np.minimum(e_cap_ch, nd * eta_ch), 0.0)
+    shift_down = np.where(nd < 0.0, np.minimum(e_cap_dis, np.abs(nd) / np.maximum(eta_dis, K.EPS)), 0.0)
+    soc_prev, soc_end = event_path(s0, active, leak_cap, shift_up, shift_down, st)
+
+    r = _idle_fill(n, soc_prev, soc_end, st, K.OZE_LOOP_KEYS)
+    smin_a, smax_a = _take(st.soc_min, act), _take(st.soc_max, act)
+    sub = K.oze_step_outputs(nd, K._entry(soc_prev[act], smin_a, smax_a, st.varying), leak_cap[act],
+                             e_cap_ch, e_cap_dis, smin_a, smax_a, eta_ch, eta_dis, st.self_dis)
+    return _scatter(r, act, sub)
+
+
+def arbi_kernel(price: np.ndarray, low, high, dt: np.ndarray,
+                tp: Union[TrackParams, K.TrackSteps]) -> Dict[str, np.ndarray]:
+    st = K.track_steps(tp)
+    price = np.asarray(price, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    n = len(price)
+    if n and not K._in_domain(st.soc0, st.at("soc_min"), st.at("soc_max")):
+        # SOC startowy poza [soc_min, soc_max] — kernel sekwencyjny (jak backend numpy)
+        return dict(zip(K.ARBI_LOOP_KEYS, K.arbi_loop(*K.arbi_loop_args(price, low, high, dt, tp))))
+    leak_cap = st.self_dis * st.emax * dt if st.self_dis > 0.0 else np.zeros_like(dt)
+    leak_cap = np.broadcast_to(leak_cap, dt.shape).astype(float)
+
+    ch, dis = K.arbi_masks(price, K.per_step(low, n), K.per_step(high, n))
+    active = ch | dis
+    act = np.flatnonzero(active)
+    dt_a = dt[act]
+    e_cap_ch, e_cap_dis = _take(st.c_ch, act) * dt_a, _take(st.c_dis, act) * dt_a
+    ch_a, dis_a = ch[act], dis[act]
+    shift_up = np.where(ch_a, e_cap_ch, 0.0)
+    shift_down = np.where(dis_a, e_cap_dis, 0.0)
+    soc_prev, soc_end = event_path(st.soc0, active, leak_cap, shift_up, shift_down, st)
+
+    r = _idle_fill(n, soc_prev, soc_end, st, K.ARBI_LOOP_KEYS)
+    smin_a, smax_a = _take(st.soc_min, act), _take(st.soc_max, act)
+    sub = K.arbi_step_outputs(price[act], ch_a, dis_a, K._entry(soc_prev[act], smin_a, smax_a, st.varying),
+                              leak_cap[act], e_cap_ch, e_cap_dis, smin_a, smax_a,
+                              _take(st.eta_ch, act), _take(st.eta_dis, act), st.self_dis)
+    return _scatter(r, act, sub)
+
+
+def compute_oze_detail(df: pd.DataFrame, tp: TrackParams) -> pd.DataFrame:
+    """Jak engines.oze.compute_oze_detail; logika kroku tylko dla kroków z delta_brutto ≠ 0."""
+    if df.empty:
+        return pd.DataFrame(columns=K.OZE_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    need = df["delta_brutto"].to_numpy(dtype=float)
+    st = K.track_steps(tp, df)
+    out = K.oze_frame(ts, dt, oze_kernel(need, dt, st), st)
+    log.info(
+        "OZE detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f)",
+        len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
+        float(out["loss_conv_mwh"].sum()), float(out["loss_idle_mwh"].sum())
+    )
+    return out
+
+
+def compute_arbi_detail(
+    df: pd.DataFrame,
+    tp: TrackParams,
+    price_low_pln_mwh: Union[float, np.ndarray, None],
+    price_high_pln_mwh: Union[float, np.ndarray, None],
+) -> pd.DataFrame:
+    """Jak engines.arbi.compute_arbi_detail; logika kroku tylko dla kroków z ceną poza progami."""
+    if df.empty:
+        return pd.DataFrame(columns=K.ARBI_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    st = K.track_steps(tp, df)
+    r = arbi_kernel(price, price_low_pln_mwh, price_high_pln_mwh, dt, st)
+    out = K.arbi_frame(ts, dt, price, r, st)
+    log.info(
+        "ARBI detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f) | net=%.2f PLN",
+        len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
+        float(out["loss_conv_mwh"].sum()), float(out["loss_idle_mwh"].sum()),
+        float(out["net_value_pln"].sum())
+    )
+    return out
@@ -0,0 +1,565 @@
+"""
+Kernele tablicowe torów SOC (wspólne dla backendów `numpy` i `compiled`).
+
+Każdy krok toru to na dziedzinie [soc_min, soc_max] odwzorowanie postaci
+    s ↦ clamp(s + a, lo, hi)
+(samorozładowanie, ładowanie do soc_max, rozładowanie do soc_min, końcowy clamp).
+Złożenie dwóch takich odwzorowań jest znów tej postaci, więc SOC dla całego
+szeregu to skan prefiksowy (`clamp_scan`) — bez pętli po krokach w Pythonie.
+Wielkości kroku (straty, spill, flagi) liczone są potem wektorowo z SOC.
+
+`oze_loop` / `arbi_loop` to sekwencyjne odpowiedniki (1:1 z engines/oze.py,
+engines/arbi.py) napisane tak, by dało się je skompilować numbą.
+
+Parametry toru mogą zmieniać się w czasie (params.schedules → kolumny `sched_*`):
+`track_steps` daje je jako skalary albo tablice per krok; kernele liczą na obu.
+Gdy granice SOC maleją (np. spadek pojemności), SOC wchodzący w krok jest najpierw
+przycinany do granic tego kroku (nadmiar przepada — to nie strata konwersji ani wyciek).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ..models import TrackParams
+
+EPS = 1e-12
+
+OZE_COLS = [
+    "ts_start","ts_end","step_hours",
+    "soc_start_mwh","soc_end_mwh",
+    "p_ch_mw","p_dis_mw","e_ch_mwh","e_dis_mwh",
+    "loss_conv_mwh","loss_idle_mwh","loss_total_mwh",
+    "spill_surplus_mwh","unmet_deficit_mwh",
+    "soc_gap_to_min_start_mwh","soc_gap_to_min_end_mwh",
+    "time_below_min_h","hit_part_cap_max","hit_part_cap_min",
+]
+
+ARBI_COLS = [
+    "ts_start","ts_end","step_hours",
+    "soc_start_mwh","soc_end_mwh",
+    "p_ch_mw","p_dis_mw","e_ch_mwh","e_dis_mwh",
+    "loss_conv_mwh","loss_idle_mwh","loss_total_mwh",
+    "price_pln_mwh","cost_pln","revenue_pln","net_value_pln",
+    "soc_gap_to_min_start_mwh","soc_gap_to_min_end_mwh",
+    "time_below_min_h","hit_part_cap_max","hit_part_cap_min",
+]
+
+
+# ---------- wejście ----------
+
+def step_hours(ts: pd.Series) -> np.ndarray:
+    """Δt [h] = ts[i+1] - ts[i]; ostatni krok = mediana; min 1e-9 (jak w silnikach referencyjnych)."""
+    step = (ts.shift(-1) - ts).dt.total_seconds().div(3600.0)
+    default_step = step.dropna().median() if step.dropna().size else 1.0
+    return step.fillna(default_step).clip(lower=1e-9).to_numpy(dtype=float)
+
+
+def frame_step_hours(df: pd.DataFrame) -> np.ndarray:
+    """Δt kroków ramki wejściowej: kolumna `step_hours`, jeśli podana (tryb strumieniowy), albo z ts_utc."""
+    if "step_hours" in df.columns:
+        return df["step_hours"].to_numpy(dtype=float)
+    return step_hours(pd.to_datetime(df["ts_utc"]))
+
+
+def per_step(v, n: int) -> np.ndarray:
+    """Skalar/tablica → tablica float długości n; None → same NaN."""
+    if v is None:
+        return np.full(n, np.nan)
+    arr = np.asarray(v, dtype=float)
+    if arr.ndim == 0:
+        return np.full(n, float(arr))
+    if len(arr) != n:
+        raise ValueError(f"Tablica ma {len(arr)} elementów, oczekiwano {n}")
+    return arr
+
+
+def round_py(x: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    Wektorowy odpowiednik round(x, ndigits) z Pythona (jak w silnikach referencyjnych).
+    np.round rozstrzyga "połówki" inaczej (x * 10^n bywa dokładnie .5), więc
+    przypadki bliskie połówki dolicza się skalarnym round().
+    """
+    x = np.asarray(x, dtype=float)
+    scale = 10.0 ** ndigits
+    y = x * scale
+    out = np.rint(y) / scale
+    with np.errstate(invalid="ignore"):
+        tie = np.abs(np.abs(y - np.trunc(y)) - 0.5) < 1e-6
+    if tie.any():
+        out[tie] = [round(v, ndigits) for v in x[tie].tolist()]
+    return out
+
+
+# ---------- parametry toru per krok ----------
+
+@dataclass
+class TrackSteps:
+    """Parametry toru: float (stałe dla przebiegu) albo tablica (n,) (harmonogram params.schedules)."""
+    emax: Union[float, np.ndarray]
+    soc_min: Union[float, np.ndarray]
+    soc_max: Union[float, np.ndarray]
+    c_ch: Union[float, np.ndarray]
+    c_dis: Union[float, np.ndarray]
+    eta_ch: Union[float, np.ndarray]
+    eta_dis: Union[float, np.ndarray]
+    self_dis: float
+    soc0: float
+    varying: bool = False  # granice SOC zmienne w czasie (przycięcie SOC na wejściu kroku)
+
+    def at(self, name: str, i: int = 0) -> float:
+        v = getattr(self, name)
+        return float(v) if np.ndim(v) == 0 else float(v[i])
+
+
+def track_steps(
+    tp: Union[TrackParams, TrackSteps],
+    df: Optional[pd.DataFrame] = None,
+    power_x: Tuple[str, str] = ("sched_p_ch_x", "sched_p_dis_x"),
+) -> TrackSteps:
+    """
+    TrackParams (+ kolumny `sched_*` ramki wejściowej) → TrackSteps. Pojemność i granice SOC
+    skaluje `sched_emax_x`, moce — kolumny `power_x` (tor z własnym czasem ładowania: `sched_emax_x`),
+    sprawności zastępują `sched_eta_ch/dis`. Bez kolumn — skalary jak w TrackParams.
+    """
+    if isinstance(tp, TrackSteps):
+        return tp
+
+    def col(name: str) -> Optional[np.ndarray]:
+        if df is None or name not in df.columns:
+            return None
+        return df[name].to_numpy(dtype=float)
+
+    def scaled(base: float, x: Optional[np.ndarray]):
+        return base if x is None else base * x
+
+    emax_x = col("sched_emax_x")
+    eta_ch, eta_dis = col("sched_eta_ch"), col("sched_eta_dis")
+    return TrackSteps(
+        emax=scaled(float(tp.emax_mwh), emax_x),
+        soc_min=scaled(float(tp.soc_min_mwh), emax_x),
+        soc_max=scaled(float(tp.soc_max_mwh), emax_x),
+        c_ch=scaled(float(tp.c_rate_ch_mw), col(power_x[0])),
+        c_dis=scaled(float(tp.c_rate_dis_mw), col(power_x[1])),
+        eta_ch=float(tp.eta_ch) if eta_ch is None else eta_ch,
+        eta_dis=float(tp.eta_dis) if eta_dis is None else eta_dis,
+        self_dis=float(tp.self_discharge_per_h),
+        soc0=float(tp.soc_init_mwh),
+        varying=emax_x is not None,
+    )
+
+
+# ---------- skan odwzorowań clamp-shift ----------
+
+def _then(a1, lo1, hi1, a2, lo2, hi2):
+    """(f2 ∘ f1) dla f(s) = clamp(s + a, lo, hi)."""
+    return a1 + a2, np.clip(lo1 + a2, lo2, hi2), np.clip(hi1 + a2, lo2, hi2)
+
+
+def clamp_scan(a: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Skan prefiksowy (Hillis–Steele, O(n log n) operacji wektorowych):
+    wynik[i] = f_i ∘ … ∘ f_0. Stan po kroku i: clamp(s0 + A[i], LO[i], HI[i]).
+    """
+    A, LO, HI = a.copy(), lo.copy(), hi.copy()
+    n = len(A)
+    d = 1
+    while d < n:
+        nA, nLO, nHI = _then(A[:-d], LO[:-d], HI[:-d], A[d:], LO[d:], HI[d:])
+        A[d:], LO[d:], HI[d:] = nA, nLO, nHI
+        d *= 2
+    return A, LO, HI
+
+
+def _soc_path(s0, a: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(SOC przed krokiem, SOC po kroku) dla kroków o odwzorowaniach (a, lo, hi); s0 skalar albo (N,)."""
+    A, LO, HI = clamp_scan(a, lo, hi)
+    soc_end = np.minimum(np.maximum(s0 + A, LO), HI)
+    soc_prev = np.empty_like(soc_end)
+    if len(soc_end):
+        soc_prev[0] = s0
+        soc_prev[1:] = soc_end[:-1]
+    return soc_prev, soc_end
+
+
+def _step_maps(leak_cap, shift_up, shift_down, soc_min, soc_max, entry_clamp: bool = False):
+    """
+    Odwzorowanie kroku: wyciek → ładowanie (do soc_max) → rozładowanie (do soc_min) → clamp.
+    Tablice (n,) dla jednego toru albo (n, N) dla N torów naraz (soc_min/soc_max jako wektory (N,)
+    albo tablice per krok). `entry_clamp` — najpierw przycięcie do granic kroku (granice zmienne w czasie).
+    """
+    shape = np.shape(leak_cap)
+    inf = np.full(shape, np.inf)
+    a, lo, hi = -leak_cap, np.full(shape, soc_min), inf
+    if entry_clamp:
+        a, lo, hi = _then(np.zeros(shape), np.full(shape, soc_min), np.full(shape, soc_max), a, lo, hi)
+    a, lo, hi = _then(a, lo, hi, shift_up, -inf, np.full(shape, soc_max))
+    a, lo, hi = _then(a, lo, hi, -shift_down, np.full(shape, soc_min), inf)
+    a, lo, hi = _then(a, lo, hi, np.zeros(shape), np.full(shape, soc_min), np.full(shape, soc_max))
+    return a, lo, hi
+
+
+def _entry(soc_prev, soc_min, soc_max, varying: bool) -> np.ndarray:
+    """SOC na wejściu kroku: przycięty do granic kroku, gdy są zmienne w czasie."""
+    return np.minimum(np.maximum(soc_prev, soc_min), soc_max) if varying else soc_prev
+
+
+def _leak(soc_prev, leak_cap, soc_min, self_dis) -> np.ndarray:
+    if np.all(np.asarray(self_dis) <= 0.0):
+        return np.zeros_like(soc_prev)
+    return np.where(soc_prev > soc_min, np.minimum(leak_cap, soc_prev - soc_min), 0.0)
+
+
+def _in_domain(s0: float, soc_min: float, soc_max: float) -> bool:
+    return soc_min <= s0 <= soc_max
+
+
+# ---------- OZE ----------
+
+def oze_arrays(need: np.ndarray, dt: np.ndarray, tp: Union[TrackParams, TrackSteps]) -> Dict[str, np.ndarray]:
+    """Wektorowy tor OZE; zwraca surowe (niezaokrąglone) tablice wyników kroku."""
+    st = track_steps(tp)
+    emax, soc_min, soc_max = st.emax, st.soc_min, st.soc_max
+    c_ch, c_dis = st.c_ch, st.c_dis
+    eta_ch, eta_dis = st.eta_ch, st.eta_dis
+    self_dis = st.self_dis
+    s0 = min(max(st.soc0, st.at("soc_min")), st.at("soc_max")) if len(need) else st.soc0
+
+    need = np.asarray(need, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    e_cap_ch = c_ch * dt
+    e_cap_dis = c_dis * dt
+    leak_cap = self_dis * emax * dt if self_dis > 0.0 else np.zeros_like(dt)
+    ch = need > 0.0
+    dis = need < 0.0
+    need_abs = np.abs(need)
+
+    shift_up = np.where(ch, np.minimum(e_cap_ch, need * eta_ch), 0.0)
+    shift_down = np.where(dis, np.minimum(e_cap_dis, need_abs / np.maximum(eta_dis, EPS)), 0.0)
+    soc_prev, soc_end = _soc_path(s0, *_step_maps(leak_cap, shift_up, shift_down, soc_min, soc_max, st.varying))
+
+    soc_prev = _entry(soc_prev, soc_min, soc_max, st.varying)
+    r = oze_step_outputs(need, soc_prev, leak_cap, e_cap_ch, e_cap_dis, soc_min, soc_max, eta_ch, eta_dis, self_dis)
+    r["soc_end"] = soc_end
+    return r
+
+
+def oze_step_outputs(need, soc_prev, leak_cap, e_cap_ch, e_cap_dis, soc_min, soc_max,
+                     eta_ch, eta_dis, self_dis) -> Dict[str, np.ndarray]:
+    """Wielkości kroków OZE z SOC na wejściu kroków (bez soc_end); tablice jednej długości albo skalary."""
+    ch = need > 0.0
+    dis = need < 0.0
+    need_abs = np.abs(need)
+    loss_idle = _leak(soc_prev, leak_cap, soc_min, self_dis)
+    soc_start = soc_prev - loss_idle
+
+    with np.errstate(invalid="ignore"):
+        # ładowanie (nadwyżka)
+        can_store = soc_max - soc_start
+        full = ch & (can_store <= EPS)
+        chg = ch & ~full
+        e_store_max = np.minimum(can_store, e_cap_ch)
+        e_in = np.minimum(e_store_max / np.maximum(eta_ch, EPS), need)
+        stored = e_in * eta_ch
+        # rozładowanie (niedobór)
+        can_supply = soc_start - soc_min
+        empty = dis & (can_supply <= EPS)
+        dsc = dis & ~empty
+        e_take_max = np.minimum(can_supply, e_cap_dis)
+        e_out = np.minimum(need_abs, e_take_max * eta_dis)
+        take = e_out / np.maximum(eta_dis, EPS)
+
+    e_ch = np.where(chg, stored, 0.0)
+    e_dis = np.where(dsc, e_out, 0.0)
+    loss_conv = np.where(chg, np.maximum(0.0, e_in - stored), 0.0) \
+        + np.where(dsc, np.maximum(0.0, take - e_out), 0.0)
+    spill = np.where(full | empty, need_abs, 0.0) + np.where(dsc, np.maximum(0.0, need_abs - e_out), 0.0)
+    unmet = np.where(chg, np.maximum(0.0, need - e_in), 0.0)
+    hit_max = full | (chg & (e_store_max >= can_store - EPS))
+    hit_min = empty | (dsc & (e_take_max >= can_supply - EPS))
+
+    return {
+        "soc_start": soc_start,
+        "e_ch": e_ch, "e_dis": e_dis, "loss_conv": loss_conv, "loss_idle": loss_idle,
+        "spill": spill, "unmet": unmet, "hit_max": hit_max, "hit_min": hit_min,
+    }
+
+
+def oze_loop(need, dt, emax, soc_min, soc_max, soc0, c_ch, c_dis, eta_ch, eta_dis, self_dis):
+    """Sekwencyjny kernel OZE (1:1 z engines/oze.py) — kompilowalny numbą. Parametry toru: tablice (n,)."""
+    n = need.shape[0]
+    soc_start = np.empty(n); soc_end = np.empty(n)
+    e_ch_a = np.zeros(n); e_dis_a = np.zeros(n)
+    loss_conv_a = np.zeros(n); loss_idle_a = np.zeros(n)
+    spill_a = np.zeros(n); unmet_a = np.zeros(n)
+    hit_max_a = np.zeros(n, dtype=np.bool_); hit_min_a = np.zeros(n, dtype=np.bool_)
+    soc = soc0
+    for i in range(n):
+        dt_h = dt[i]
+        nd = need[i]
+        s_min = soc_min[i]
+        s_max = soc_max[i]
+        soc = min(max(soc, s_min), s_max)  # i = 0: SOC startowy; dalej no-op przy stałych granicach
+        if self_dis > 0.0 and soc > s_min:
+            leak = min(self_dis * emax[i] * dt_h, soc - s_min)
+            soc -= leak
+            loss_idle_a[i] = leak
+        soc_start[i] = soc
+        if nd > 0.0:
+            can_store = s_max - soc
+            if can_store <= EPS:
+                spill_a[i] = nd
+                hit_max_a[i] = True
+            else:
+                e_store_max = min(can_store, c_ch[i] * dt_h)
+                e_in = min(e_store_max / max(eta_ch[i], EPS), nd)
+                stored = e_in * eta_ch[i]
+                e_ch_a[i] = stored
+                soc += stored
+                loss_conv_a[i] = max(0.0, e_in - stored)
+                unmet_a[i] = max(0.0, nd - e_in)
+                if e_store_max >= can_store - EPS:
+                    hit_max_a[i] = True
+        elif nd < 0.0:
+            need_abs = -nd
+            can_supply = soc - s_min
+            if can_supply <= EPS:
+                spill_a[i] = need_abs
+                hit_min_a[i] = True
+            else:
+                e_take_max = min(can_supply, c_dis[i] * dt_h)
+                e_out = min(need_abs, e_take_max * eta_dis[i])
+                take = e_out / max(eta_dis[i], EPS)
+                e_dis_a[i] = e_out
+                soc -= take
+                loss_conv_a[i] = max(0.0, take - e_out)
+                spill_a[i] = max(0.0, need_abs - e_out)
+                if e_take_max >= can_supply - EPS:
+                    hit_min_a[i] = True
+        soc = min(max(soc, s_min), s_max)
+        soc_end[i] = soc
+    return (soc_start, soc_end, e_ch_a, e_dis_a, loss_conv_a, loss_idle_a,
+            spill_a, unmet_a, hit_max_a, hit_min_a)
+
+
+# ---------- ARBI ----------
+
+def arbi_masks(price: np.ndarray, low: np.ndarray, high: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(ładuj, rozładuj) per krok; NaN ceny/progu → brak handlu."""
+    valid = ~(np.isnan(price) | np.isnan(low) | np.isnan(high))
+    with np.errstate(invalid="ignore"):
+        ch = valid & (price <= low)
+        dis = valid & ~ch & (price >= high)
+    return ch, dis
+
+
+def arbi_arrays(price: np.ndarray, low, high, dt: np.ndarray,
+                tp: Union[TrackParams, TrackSteps]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Wektorowy tor ARBI. Zwraca None, gdy SOC początkowy leży poza [soc_min, soc_max]
+    (tam kroki nie są odwzorowaniami clamp-shift) — wtedy użyj kernela sekwencyjnego.
+    """
+    st = track_steps(tp)
+    emax, soc_min, soc_max = st.emax, st.soc_min, st.soc_max
+    c_ch, c_dis = st.c_ch, st.c_dis
+    eta_ch, eta_dis = st.eta_ch, st.eta_dis
+    self_dis = st.self_dis
+    s0 = st.soc0
+    if len(price) and not _in_domain(s0, st.at("soc_min"), st.at("soc_max")):
+        return None
+
+    price = np.asarray(price, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    n = len(price)
+    ch, dis = arbi_masks(price, per_step(low, n), per_step(high, n))
+    e_cap_ch = c_ch * dt
+    e_cap_dis = c_dis * dt
+    leak_cap = self_dis * emax * dt if self_dis > 0.0 else np.zeros_like(dt)
+
+    shift_up = np.where(ch, e_cap_ch, 0.0)
+    shift_down = np.where(dis, e_cap_dis, 0.0)
+    soc_prev, soc_end = _soc_path(s0, *_step_maps(leak_cap, shift_up, shift_down, soc_min, soc_max, st.varying))
+
+    soc_prev = _entry(soc_prev, soc_min, soc_max, st.varying)
+    r = arbi_step_outputs(price, ch, dis, soc_prev, leak_cap, e_cap_ch, e_cap_dis, soc_min, soc_max,
+                          eta_ch, eta_dis, self_dis)
+    r["soc_end"] = soc_end
+    return r
+
+
+def arbi_step_outputs(price, ch, dis, soc_prev, leak_cap, e_cap_ch, e_cap_dis, soc_min, soc_max,
+                      eta_ch, eta_dis, self_dis) -> Dict[str, np.ndarray]:
+    """Wielkości kroków ARBI z SOC na wejściu kroków (bez soc_end); tablice jednej długości albo skalary."""
+    loss_idle = _leak(soc_prev, leak_cap, soc_min, self_dis)
+    soc_start = soc_prev - loss_idle
+
+    can_store = soc_max - soc_start
+    can_supply = soc_start - soc_min
+    chg = ch & (can_store > EPS)
+    dsc = dis & (can_supply > EPS)
+    e_store_max = np.minimum(can_store, e_cap_ch)
+    e_in = e_store_max / np.maximum(eta_ch, EPS)
+    stored = e_in * eta_ch
+    e_take_max = np.minimum(can_supply, e_cap_dis)
+    e_out = e_take_max * eta_dis
+    take = e_out / np.maximum(eta_dis, EPS)
+
+    e_ch = np.where(chg, stored, 0.0)
+    e_dis = np.where(dsc, e_out, 0.0)
+    loss_conv = np.where(chg, np.maximum(0.0, e_in - stored), 0.0) \
+        + np.where(dsc, np.maximum(0.0, take - e_out), 0.0)
+    with np.errstate(invalid="ignore"):
+        cost = np.where(chg, e_in * price, 0.0)
+        revenue = np.where(dsc, e_out * price, 0.0)
+    hit_max = (ch & ~chg) | (chg & (e_store_max >= can_store - EPS))
+    hit_min = (dis & ~dsc) | (dsc & (e_take_max >= can_supply - EPS))
+
+    return {
+        "soc_start": soc_start,
+        "e_ch": e_ch, "e_dis": e_dis, "loss_conv": loss_conv, "loss_idle": loss_idle,
+        "cost": cost, "revenue": revenue, "hit_max": hit_max, "hit_min": hit_min,
+    }
+
+
+def arbi_loop(price, low, high, dt, emax, soc_min, soc_max, soc0, c_ch, c_dis, eta_ch, eta_dis, self_dis):
+    """Sekwencyjny kernel ARBI (1:1 z engines/arbi.py) — kompilowalny numbą. NaN = brak; parametry toru: tablice (n,)."""
+    n = price.shape[0]
+    soc_start = np.empty(n); soc_end = np.empty(n)
+    e_ch_a = np.zeros(n); e_dis_a = np.zeros(n)
+    loss_conv_a = np.zeros(n); loss_idle_a = np.zeros(n)
+    cost_a = np.zeros(n); revenue_a = np.zeros(n)
+    hit_max_a = np.zeros(n, dtype=np.bool_); hit_min_a = np.zeros(n, dtype=np.bool_)
+    soc = soc0
+    for i in range(n):
+        dt_h = dt[i]
+        s_min = soc_min[i]
+        s_max = soc_max[i]
+        if i > 0:
+            soc = min(max(soc, s_min), s_max)  # granice zmienne w czasie; przy stałych no-op
+        if self_dis > 0.0 and soc > s_min:
+            leak = min(self_dis * emax[i] * dt_h, soc - s_min)
+            soc -= leak
+            loss_idle_a[i] = leak
+        soc_start[i] = soc
+        pr = price[i]
+        lo = low[i]
+        hi = high[i]
+        if pr == pr and lo == lo and hi == hi:
+            if pr <= lo:
+                can_store = s_max - soc
+                if can_store > EPS:
+                    e_store_max = min(can_store, c_ch[i] * dt_h)
+                    e_in = e_store_max / max(eta_ch[i], EPS)
+                    stored = e_in * eta_ch[i]
+                    e_ch_a[i] = stored
+                    soc += stored
+                    loss_conv_a[i] = max(0.0, e_in - stored)
+                    cost_a[i] = e_in * pr
+                    if e_store_max >= can_store - EPS:
+                        hit_max_a[i] = True
+                else:
+                    hit_max_a[i] = True
+            elif pr >= hi:
+                can_supply = soc - s_min
+                if can_supply > EPS:
+                    e_take_max = min(can_supply, c_dis[i] * dt_h)
+                    e_out = e_take_max * eta_dis[i]
+                    take = e_out / max(eta_dis[i], EPS)
+                    e_dis_a[i] = e_out
+                    soc -= take
+                    loss_conv_a[i] = max(0.0, take - e_out)
+                    revenue_a[i] = e_out * pr
+                    if e_take_max >= can_supply - EPS:
+                        hit_min_a[i] = True
+                else:
+                    hit_min_a[i] = True
+        soc = min(max(soc, s_min), s_max)
+        soc_end[i] = soc
+    return (soc_start, soc_end, e_ch_a, e_dis_a, loss_conv_a, loss_idle_a,
+            cost_a, revenue_a, hit_max_a, hit_min_a)
+
+
+OZE_LOOP_KEYS = ("soc_start", "soc_end", "e_ch", "e_dis", "loss_conv", "loss_idle",
+                 "spill", "unmet", "hit_max", "hit_min")
+ARBI_LOOP_KEYS = ("soc_start", "soc_end", "e_ch", "e_dis", "loss_conv", "loss_idle",
+                  "cost", "revenue", "hit_max", "hit_min")
+
+
+def _track_loop_args(tp: Union[TrackParams, TrackSteps], n: int) -> tuple:
+    st = track_steps(tp)
+    c = np.ascontiguousarray
+    return (c(per_step(st.emax, n)), c(per_step(st.soc_min, n)), c(per_step(st.soc_max, n)), st.soc0,
+            c(per_step(st.c_ch, n)), c(per_step(st.c_dis, n)),
+            c(per_step(st.eta_ch, n)), c(per_step(st.eta_dis, n)), st.self_dis)
+
+
+def oze_loop_args(need, dt, tp: Union[TrackParams, TrackSteps]) -> tuple:
+    return (np.ascontiguousarray(need, dtype=float), np.ascontiguousarray(dt, dtype=float),
+            *_track_loop_args(tp, len(need)))
+
+
+def arbi_loop_args(price, low, high, dt, tp: Union[TrackParams, TrackSteps]) -> tuple:
+    n = len(price)
+    return (np.ascontiguousarray(price, dtype=float),
+            np.ascontiguousarray(per_step(low, n)), np.ascontiguousarray(per_step(high, n)),
+            np.ascontiguousarray(dt, dtype=float),
+            *_track_loop_args(tp, n))
+
+
+# ---------- ramki wyjściowe ----------
+
+def _common_cols(ts: pd.Series, dt: np.ndarray, r: Dict[str, np.ndarray], soc_min,
+                 ts_end: Optional[pd.Series] = None) -> Dict[str, object]:
+    soc_start, soc_end = r["soc_start"], r["soc_end"]
+    gap_start = np.maximum(0.0, soc_min - soc_start)
+    gap_end = np.maximum(0.0, soc_min - soc_end)
+    below_s = soc_start < soc_min
+    below_e = soc_end < soc_min
+    below = below_s | below_e | ((gap_start > 0) & (gap_end > 0))
+    time_below = np.where(below, np.where(below_s & below_e, dt, dt * 0.5), 0.0)
+    ts_start = ts.reset_index(drop=True)
+    return {
+        "ts_start": ts_start,
+        "ts_end": ts_start + pd.to_timedelta(dt, unit="h") if ts_end is None else ts_end.reset_index(drop=True),
+        "step_hours": dt,
+        "soc_start_mwh": round_py(soc_start, 6), "soc_end_mwh": round_py(soc_end, 6),
+        "p_ch_mw": round_py(r["e_ch"] / dt, 6), "p_dis_mw": round_py(r["e_dis"] / dt, 6),
+        "e_ch_mwh": round_py(r["e_ch"], 6), "e_dis_mwh": round_py(r["e_dis"], 6),
+        "loss_conv_mwh": round_py(r["loss_conv"], 6), "loss_idle_mwh": round_py(r["loss_idle"], 6),
+        "loss_total_mwh": round_py(r["loss_conv"] + r["loss_idle"], 6),
+        "soc_gap_to_min_start_mwh": round_py(gap_start, 6),
+        "soc_gap_to_min_end_mwh": round_py(gap_end, 6),
+        "time_below_min_h": round_py(time_below, 6),
+        "hit_part_cap_max": np.asarray(r["hit_max"], dtype=bool),
+        "hit_part_cap_min": np.asarray(r["hit_min"], dtype=bool),
+    }
+
+
+def oze_frame(ts: pd.Series, dt: np.ndarray, r: Dict[str, np.ndarray],
+              tp: Union[TrackParams, TrackSteps]) -> pd.DataFrame:
+    cols = _common_cols(ts, dt, r, track_steps(tp).soc_min)
+    cols["spill_surplus_mwh"] = round_py(r["spill"], 6)
+    cols["unmet_deficit_mwh"] = round_py(r["unmet"], 6)
+    return _with_soc_end(pd.DataFrame(cols)[OZE_COLS], r)
+
+
+def arbi_frame(ts: pd.Series, dt: np.ndarray, price: np.ndarray, r: Dict[str, np.ndarray],
+               tp: Union[TrackParams, TrackSteps]) -> pd.DataFrame:
+    cols = _common_cols(ts, dt, r, track_steps(tp).soc_min)
+    cost = round_py(r["cost"], 2)
+    revenue = round_py(r["revenue"], 2)
+    cols["price_pln_mwh"] = price
+    cols["cost_pln"] = cost
+    cols["revenue_pln"] = revenue
+    cols["net_value_pln"] = round_py(r["revenue"] - r["cost"], 2)
+    return _with_soc_end(pd.DataFrame(cols)[ARBI_COLS], r)
+
+
+def _with_soc_end(out: pd.DataFrame, r: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """SOC po ostatnim kroku bez zaokrąglenia (jak engines.oze/arbi) — kontynuacja w kolejnej paczce."""
+    if len(r["soc_end"]):
+        out.attrs["soc_end_exact"] = float(r["soc_end"][-1])
+    return out
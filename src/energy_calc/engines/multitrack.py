@@ -0,0 +1,387 @@
+"""
+Model N-torowy: tory magazynu (params.tracks) jako kolumny tablic stanu (n, N), liczone razem.
+
+Rodzaje torów (sygnał sterujący kroku):
+  oze     — delta_brutto × need_share (jak engines/oze.py),
+  arbi    — progi cenowe toru albo globalne/rolling (jak engines/arbi.py): ładuj/rozładuj pełną mocą,
+  reserve — pojemność trzymana w rezerwie (np. regulacja częstotliwości) — tylko samorozładowanie.
+Każdy krok każdego toru to "żądanie" energii po stronie sieci (req_ch / req_dis; ∞ = pełna moc),
+więc jeden kernel obsługuje wszystkie rodzaje:
+  numpy    — skan clamp-shift (engines/kernels.py) na tablicach (n, N), bez pętli po torach,
+  compiled — `multi_loop` skompilowana numbą,
+  python   — `multi_loop` interpretowana (referencja).
+Broker: moc przydzielana wg listy priorytetów (skumulowane żądania, wektorowo dla wszystkich torów).
+
+Harmonogramy params.schedules (kolumny sched_*): parametry torów stają się tablicami (n, N)
+— jak sygnały kroków; tor z własnym czasem ładowania skaluje moc razem z pojemnością.
+
+Wynik: format długi (energy_tracks_detail), wiersze w kolejności (krok, tor) — bloki zapisu
+różnicowego to ciągłe zakresy ts_start.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..map_detail import TRACKS_COLS
+from ..models import Params
+from . import kernels as K
+from .thresholds import arbi_thresholds
+
+log = logging.getLogger(__name__).getChild("tracks")
+
+EPS = K.EPS
+KIND_OZE, KIND_ARBI, KIND_RESERVE = 0, 1, 2
+KIND_CODES = {"oze": KIND_OZE, "arbi": KIND_ARBI, "reserve": KIND_RESERVE}
+# kolumny harmonogramu, które nie zmieniają parametrów torów (broker / progi)
+_NON_TRACK_SCHED = ("sched_moc_umowna_mw", "sched_price_low", "sched_price_high")
+
+MULTI_KEYS = ("soc_start", "soc_end", "e_ch", "e_dis", "loss_conv", "loss_idle",
+              "spill", "unmet", "cost", "revenue", "hit_max", "hit_min")
+
+
+@dataclass
+class TrackArrays:
+    """
+    Parametry torów jako wektory (N,) — albo tablice (n, N) przy harmonogramie (`varying`) —
+    i sygnały kroków jako tablice (n, N).
+    """
+    ids: np.ndarray
+    kinds: np.ndarray
+    priority: np.ndarray
+    emax: np.ndarray
+    soc_min: np.ndarray
+    soc_max: np.ndarray
+    soc0: np.ndarray
+    c_ch: np.ndarray
+    c_dis: np.ndarray
+    eta_ch: np.ndarray
+    eta_dis: np.ndarray
+    self_dis: np.ndarray
+    req_ch: np.ndarray
+    req_dis: np.ndarray
+    price: np.ndarray
+    contract: Optional[np.ndarray] = None  # moc umowna per krok (NaN = brak limitu); None = brak
+    varying: bool = False       # parametry torów jako (n, N)
+    entry_clamp: bool = False   # granice SOC zmienne w czasie (kernels._step_maps)
+
+    def first(self, name: str) -> np.ndarray:
+        """Parametr (N,) w pierwszym kroku."""
+        v = getattr(self, name)
+        return v[0] if v.ndim == 2 else v
+
+
+def track_inputs(df: pd.DataFrame, params: Params) -> TrackArrays:
+    specs = params.tracks
+    n, N = len(df), len(specs)
+    kinds = np.array([KIND_CODES[s.kind] for s in specs], dtype=np.int64)
+
+    def vec(fn) -> np.ndarray:
+        return np.array([float(fn(s)) for s in specs], dtype=float)
+
+    # parametry per krok (harmonogram): tor z własnym czasem ładowania — moc ∝ pojemność toru
+    sts = [K.track_steps(s.tp, df, ("sched_emax_x" if s.charge_h else "sched_p_ch_x",
+                                     "sched_emax_x" if s.discharge_h else "sched_p_dis_x")) for s in specs]
+    varying = any(df.columns.str.startswith("sched_") & ~df.columns.isin(_NON_TRACK_SCHED))
+
+    def par(name: str) -> np.ndarray:
+        if varying:
+            return np.column_stack([K.per_step(getattr(st, name), n) for st in sts]) if N else np.empty((n, 0))
+        return np.array([float(getattr(st, name)) for st in sts], dtype=float)
+
+    soc_min, soc_max = par("soc_min"), par("soc_max")
+    soc0 = vec(lambda s: s.tp.soc_init_mwh)
+    oze = kinds == KIND_OZE
+    lo0, hi0 = (soc_min[0], soc_max[0]) if varying and n else (soc_min, soc_max)
+    soc0[oze] = np.minimum(np.maximum(soc0[oze], lo0[oze]), hi0[oze])  # jak engines/oze.py
+
+    need = df["delta_brutto"].to_numpy(dtype=float)
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    req_ch = np.zeros((n, N))
+    req_dis = np.zeros((n, N))
+
+    if oze.any():
+        share = vec(lambda s: s.need_share)[oze]
+        req_ch[:, oze] = np.maximum(need, 0.0)[:, None] * share
+        req_dis[:, oze] = np.maximum(-need, 0.0)[:, None] * share
+
+    arbi = np.flatnonzero(kinds == KIND_ARBI)
+    if len(arbi):
+        glob = None
+        if any(specs[k].price_low is None or specs[k].price_high is None for k in arbi):
+            glob = arbi_thresholds(df, params)
+        low = np.empty((n, len(arbi)))
+        high = np.empty((n, len(arbi)))
+        for j, k in enumerate(arbi):
+            s = specs[k]
+            low[:, j] = K.per_step(s.price_low if s.price_low is not None else glob[0], n)
+            high[:, j] = K.per_step(s.price_high if s.price_high is not None else glob[1], n)
+        ch, dis = K.arbi_masks(price[:, None], low, high)
+        req_ch[:, arbi] = np.where(ch, np.inf, 0.0)
+        req_dis[:, arbi] = np.where(dis, np.inf, 0.0)
+
+    contract = None
+    if "sched_moc_umowna_mw" in df.columns:
+        c = df["sched_moc_umowna_mw"].to_numpy(dtype=float)
+        contract = np.where(c > 0, c, np.nan)
+    elif params.moc_umowna_mw and params.moc_umowna_mw > 0:
+        contract = np.full(n, float(params.moc_umowna_mw))
+
+    return TrackArrays(
+        ids=np.array([s.id for s in specs], dtype=object), kinds=kinds,
+        priority=np.array([s.priority for s in specs], dtype=np.int64),
+        emax=par("emax"), soc_min=soc_min, soc_max=soc_max, soc0=soc0,
+        c_ch=par("c_ch"), c_dis=par("c_dis"), eta_ch=par("eta_ch"), eta_dis=par("eta_dis"),
+        self_dis=vec(lambda s: s.tp.self_discharge_per_h),
+        req_ch=req_ch, req_dis=req_dis, price=price, contract=contract, varying=varying,
+        entry_clamp=any(st.varying for st in sts),
+    )
+
+
+# ---------- kernele ----------
+
+def multi_arrays(ta: TrackArrays, dt: np.ndarray) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Wektorowy krok N torów (skan clamp-shift na (n, N)). None, gdy SOC startowy toru arbi/reserve
+    leży poza [soc_min, soc_max] — wtedy kernel sekwencyjny (jak kernels.arbi_arrays).
+    """
+    if np.any((ta.soc0 < ta.first("soc_min")) | (ta.soc0 > ta.first("soc_max"))):
+        return None
+    dt2 = np.asarray(dt, dtype=float)[:, None]
+    req_ch, req_dis = ta.req_ch, ta.req_dis
+    eta_ch, eta_dis = ta.eta_ch, ta.eta_dis
+    e_cap_ch = ta.c_ch * dt2
+    e_cap_dis = ta.c_dis * dt2
+    leak_cap = ta.self_dis * ta.emax * dt2
+    ch = req_ch > 0.0
+    dis = req_dis > 0.0
+
+    shift_up = np.where(ch, np.minimum(e_cap_ch, req_ch * eta_ch), 0.0)
+    shift_down = np.where(dis, np.minimum(e_cap_dis, req_dis / np.maximum(eta_dis, K.EPS)), 0.0)
+    soc_prev, soc_end = K._soc_path(
+        ta.soc0, *K._step_maps(leak_cap, shift_up, shift_down, ta.soc_min, ta.soc_max, ta.entry_clamp))
+
+    soc_prev = K._entry(soc_prev, ta.soc_min, ta.soc_max, ta.entry_clamp)
+    loss_idle = K._leak(soc_prev, leak_cap, ta.soc_min, ta.self_dis)
+    soc_start = soc_prev - loss_idle
+
+    with np.errstate(invalid="ignore"):
+        can_store = ta.soc_max - soc_start
+        full = ch & (can_store <= K.EPS)
+        chg = ch & ~full
+        e_store_max = np.minimum(can_store, e_cap_ch)
+        e_in = np.minimum(e_store_max / np.maximum(eta_ch, K.EPS), req_ch)
+        stored = e_in * eta_ch
+        can_supply = soc_start - ta.soc_min
+        empty = dis & (can_supply <= K.EPS)
+        dsc = dis & ~empty
+        e_take_max = np.minimum(can_supply, e_cap_dis)
+        e_out = np.minimum(req_dis, e_take_max * eta_dis)
+        take = e_out / np.maximum(eta_dis, K.EPS)
+
+        e_ch = np.where(chg, stored, 0.0)
+        e_dis = np.where(dsc, e_out, 0.0)
+        loss_conv = np.where(chg, np.maximum(0.0, e_in - stored), 0.0) \
+            + np.where(dsc, np.maximum(0.0, take - e_out), 0.0)
+        is_oze = ta.kinds == KIND_OZE
+        spill = np.where(is_oze, np.where(full, req_ch, 0.0) + np.where(empty, req_dis, 0.0)
+                         + np.where(dsc, np.maximum(0.0, req_dis - e_out), 0.0), 0.0)
+        unmet = np.where(is_oze & chg, np.maximum(0.0, req_ch - e_in), 0.0)
+        is_arbi = ta.kinds == KIND_ARBI
+        price = ta.price[:, None]
+        cost = np.where(is_arbi & chg, e_in * price, 0.0)
+        revenue = np.where(is_arbi & dsc, e_out * price, 0.0)
+    hit_max = full | (chg & (e_store_max >= can_store - K.EPS))
+    hit_min = empty | (dsc & (e_take_max >= can_supply - K.EPS))
+
+    return {
+        "soc_start": soc_start, "soc_end": soc_end,
+        "e_ch": e_ch, "e_dis": e_dis, "loss_conv": loss_conv, "loss_idle": loss_idle,
+        "spill": spill, "unmet": unmet, "cost": cost, "revenue": revenue,
+        "hit_max": hit_max, "hit_min": hit_min,
+    }
+
+
+def multi_loop(req_ch, req_dis, price, dt, kinds, emax, soc_min, soc_max, soc0,
+               c_ch, c_dis, eta_ch, eta_dis, self_dis):
+    """
+    Sekwencyjny kernel N torów (krok po kroku, tory w pętli wewnętrznej) — kompilowalny numbą.
+    Parametry torów (emax … eta_dis) jako tablice (n, N); soc0, self_dis jako (N,).
+    """
+    n, N = req_ch.shape
+    soc_start = np.empty((n, N)); soc_end = np.empty((n, N))
+    e_ch_a = np.zeros((n, N)); e_dis_a = np.zeros((n, N))
+    loss_conv_a = np.zeros((n, N)); loss_idle_a = np.zeros((n, N))
+    spill_a = np.zeros((n, N)); unmet_a = np.zeros((n, N))
+    cost_a = np.zeros((n, N)); revenue_a = np.zeros((n, N))
+    hit_max_a = np.zeros((n, N), dtype=np.bool_); hit_min_a = np.zeros((n, N), dtype=np.bool_)
+    soc = soc0.copy()
+    for i in range(n):
+        dt_h = dt[i]
+        pr = price[i]
+        for k in range(N):
+            s_min = soc_min[i, k]
+            s_max = soc_max[i, k]
+            s = soc[k]
+            if i > 0:
+                s = min(max(s, s_min), s_max)  # granice zmienne w czasie; przy stałych no-op
+            if self_dis[k] > 0.0 and s > s_min:
+                leak = min(self_dis[k] * emax[i, k] * dt_h, s - s_min)
+                s -= leak
+                loss_idle_a[i, k] = leak
+            soc_start[i, k] = s
+            rc = req_ch[i, k]
+            rd = req_dis[i, k]
+            if rc > 0.0:
+                can_store = s_max - s
+                if can_store <= EPS:
+                    hit_max_a[i, k] = True
+                    if kinds[k] == KIND_OZE:
+                        spill_a[i, k] = rc
+                else:
+                    e_store_max = min(can_store, c_ch[i, k] * dt_h)
+                    e_in = min(e_store_max / max(eta_ch[i, k], EPS), rc)
+                    stored = e_in * eta_ch[i, k]
+                    e_ch_a[i, k] = stored
+                    s += stored
+                    loss_conv_a[i, k] = max(0.0, e_in - stored)
+                    if kinds[k] == KIND_OZE:
+                        unmet_a[i, k] = max(0.0, rc - e_in)
+                    elif kinds[k] == KIND_ARBI:
+                        cost_a[i, k] = e_in * pr
+                    if e_store_max >= can_store - EPS:
+                        hit_max_a[i, k] = True
+            elif rd > 0.0:
+                can_supply = s - s_min
+                if can_supply <= EPS:
+                    hit_min_a[i, k] = True
+                    if kinds[k] == KIND_OZE:
+                        spill_a[i, k] = rd
+                else:
+                    e_take_max = min(can_supply, c_dis[i, k] * dt_h)
+                    e_out = min(rd, e_take_max * eta_dis[i, k])
+                    take = e_out / max(eta_dis[i, k], EPS)
+                    e_dis_a[i, k] = e_out
+                    s -= take
+                    loss_conv_a[i, k] = max(0.0, take - e_out)
+                    if kinds[k] == KIND_OZE:
+                        spill_a[i, k] = max(0.0, rd - e_out)
+                    elif kinds[k] == KIND_ARBI:
+                        revenue_a[i, k] = e_out * pr
+                    if e_take_max >= can_supply - EPS:
+                        hit_min_a[i, k] = True
+            s = min(max(s, s_min), s_max)
+            soc_end[i, k] = s
+            soc[k] = s
+    return (soc_start, soc_end, e_ch_a, e_dis_a, loss_conv_a, loss_idle_a,
+            spill_a, unmet_a, cost_a, revenue_a, hit_max_a, hit_min_a)
+
+
+def multi_loop_args(ta: TrackArrays, dt: np.ndarray) -> tuple:
+    c = np.ascontiguousarray
+    shape = ta.req_ch.shape
+
+    def steps(v: np.ndarray) -> np.ndarray:
+        return c(np.broadcast_to(v, shape), dtype=float)
+
+    return (c(ta.req_ch), c(ta.req_dis), c(ta.price, dtype=float), c(dt, dtype=float), c(ta.kinds),
+            steps(ta.emax), steps(ta.soc_min), steps(ta.soc_max), c(ta.soc0),
+            steps(ta.c_ch), steps(ta.c_dis), steps(ta.eta_ch), steps(ta.eta_dis), c(ta.self_dis))
+
+
+def loop_kernel(ta: TrackArrays, dt: np.ndarray) -> Dict[str, np.ndarray]:
+    return dict(zip(MULTI_KEYS, multi_loop(*multi_loop_args(ta, dt))))
+
+
+def vector_kernel(ta: TrackArrays, dt: np.ndarray) -> Dict[str, np.ndarray]:
+    r = multi_arrays(ta, dt)
+    return r if r is not None else loop_kernel(ta, dt)
+
+
+# ---------- broker ----------
+
+def allocate_by_priority(req: np.ndarray, priority: np.ndarray, cap: np.ndarray) -> np.ndarray:
+    """
+    Przydział mocy (n, N) wg priorytetu: tor dostaje min(żądanie, cap − żądania torów przed nim).
+    Dla dwóch torów to dokładnie alokacja engines/broker.py (OZE przed ARBI).
+    """
+    order = np.argsort(priority, kind="stable")
+    r = req[:, order]
+    before = np.cumsum(r, axis=1) - r
+    alloc = np.empty_like(r)
+    alloc[:, order] = np.clip(cap[:, None] - before, 0.0, r)
+    return alloc
+
+
+def _caps(ta: TrackArrays, n: int):
+    """Limit mocy brokera: suma mocy torów (jak engines/broker.py) ∧ moc umowna."""
+    cap_ch = np.full(n, ta.c_ch.sum(axis=-1), dtype=float)
+    cap_dis = np.full(n, ta.c_dis.sum(axis=-1), dtype=float)
+    if ta.contract is not None:
+        cap_ch = np.fmin(cap_ch, ta.contract)
+        cap_dis = np.fmin(cap_dis, ta.contract)
+    return cap_ch, cap_dis
+
+
+# ---------- ramka ----------
+
+def track_frame(ts: pd.Series, dt: np.ndarray, ta: TrackArrays, r: Dict[str, np.ndarray],
+                params: Params) -> pd.DataFrame:
+    n, N = ta.req_ch.shape
+    flat = {k: v.ravel() for k, v in r.items()}
+    # czas liczony per krok i powielany na tory (konwersja Δt → timedelta to koszt dominujący)
+    step = np.repeat(np.arange(n), N)
+    ts = ts.reset_index(drop=True)
+    ts_end = ts + pd.to_timedelta(dt, unit="h")
+    soc_min = np.broadcast_to(ta.soc_min, (n, N)).ravel()
+    cols = K._common_cols(ts.take(step), np.repeat(dt, N), flat, soc_min, ts_end=ts_end.take(step))
+    cap_ch, cap_dis = _caps(ta, n)
+    p_ch = cols["p_ch_mw"].reshape(n, N)
+    p_dis = cols["p_dis_mw"].reshape(n, N)
+    is_oze = np.tile(ta.kinds == KIND_OZE, n)
+    is_arbi = np.tile(ta.kinds == KIND_ARBI, n)
+    nan = np.nan
+    track_no = np.tile(np.arange(N), n)
+    cols["track_id"] = pd.Categorical.from_codes(track_no, categories=list(ta.ids))
+    cols["kind"] = pd.Categorical.from_codes(np.tile(ta.kinds, n), categories=list(KIND_CODES))
+    cols["spill_surplus_mwh"] = np.where(is_oze, K.round_py(flat["spill"], 6), nan)
+    cols["unmet_deficit_mwh"] = np.where(is_oze, K.round_py(flat["unmet"], 6), nan)
+    cols["price_pln_mwh"] = np.where(is_arbi, np.repeat(ta.price, N), nan)
+    cols["cost_pln"] = np.where(is_arbi, K.round_py(flat["cost"], 2), nan)
+    cols["revenue_pln"] = np.where(is_arbi, K.round_py(flat["revenue"], 2), nan)
+    cols["net_value_pln"] = np.where(is_arbi, K.round_py(flat["revenue"] - flat["cost"], 2), nan)
+    cols["alloc_ch_mw"] = allocate_by_priority(p_ch, ta.priority, cap_ch).ravel()
+    cols["alloc_dis_mw"] = allocate_by_priority(p_dis, ta.priority, cap_dis).ravel()
+    return pd.DataFrame(cols)[TRACKS_COLS]
+
+
+def compute_with(kernel: Callable[[TrackArrays, np.ndarray], Dict[str, np.ndarray]],
+                 df: pd.DataFrame, params: Params) -> pd.DataFrame:
+    if df.empty or not params.tracks:
+        return pd.DataFrame(columns=TRACKS_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    ta = track_inputs(df, params)
+    r = kernel(ta, dt)
+    out = track_frame(ts, dt, ta, r, params)
+    log.info(
+        "TRACKS detail | N=%d steps=%d rows=%d | %s",
+        len(ta.ids), len(df), len(out),
+        " ".join(f"{tid}[e_ch={ech:.3f},e_dis={edis:.3f}]"
+                 for tid, ech, edis in zip(ta.ids, r["e_ch"].sum(axis=0), r["e_dis"].sum(axis=0))),
+    )
+    return out
+
+
+def compute_tracks_detail(df: pd.DataFrame, params: Params) -> pd.DataFrame:
+    """Backend `numpy`: skan clamp-shift na (n, N)."""
+    return compute_with(vector_kernel, df, params)
+
+
+def compute_tracks_detail_loop(df: pd.DataFrame, params: Params) -> pd.DataFrame:
+    """Backend `python`: pętla referencyjna."""
+    return compute_with(loop_kernel, df, params)
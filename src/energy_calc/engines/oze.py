@@ -2,6 +2,7 @@ from __future__ import annotations
 import logging
 import pandas as pd
 from ..models import TrackParams
+from .kernels import per_step, track_steps
 
 log = logging.getLogger(__name__).getChild("oze")
 
@@ -27,27 +28,32 @@ def compute_oze_detail(df: pd.DataFrame, tp: TrackParams) -> pd.DataFrame:
         return pd.DataFrame(columns=cols)
 
     ts = pd.to_datetime(df["ts_utc"])
-    step = (ts.shift(-1) - ts).dt.total_seconds().div(3600.0)
-    default_step = step.dropna().median() if step.dropna().size else 1.0
-    step = step.fillna(default_step).clip(lower=1e-9)
-
-    emax = float(tp.emax_mwh)
-    soc_min = float(tp.soc_min_mwh)
-    soc_max = float(tp.soc_max_mwh)
-    soc = float(tp.soc_init_mwh)
-
-    c_ch = float(tp.c_rate_ch_mw)
-    c_dis = float(tp.c_rate_dis_mw)
-    eta_ch = float(tp.eta_ch)
-    eta_dis = float(tp.eta_dis)
-    self_dis = float(tp.self_discharge_per_h)
-
-    soc = min(max(soc, soc_min), soc_max)
+    if "step_hours" in df.columns:
+        # Δt podane z zewnątrz (tryb strumieniowy: ostatni krok paczki zna ts następnej)
+        step = df["step_hours"].astype(float)
+    else:
+        step = (ts.shift(-1) - ts).dt.total_seconds().div(3600.0)
+        default_step = step.dropna().median() if step.dropna().size else 1.0
+        step = step.fillna(default_step).clip(lower=1e-9)
+
+    # parametry toru per krok (stałe albo z harmonogramu params.schedules — kolumny sched_*)
+    st = track_steps(tp, df)
+    n = len(df)
+    emax_a, soc_min_a, soc_max_a, c_ch_a, c_dis_a, eta_ch_a, eta_dis_a = (
+        per_step(v, n).tolist()  # floaty Pythona: round() jak dotąd (np.float64 zaokrągla inaczej)
+        for v in (st.emax, st.soc_min, st.soc_max, st.c_ch, st.c_dis, st.eta_ch, st.eta_dis)
+    )
+    soc = st.soc0
+    self_dis = st.self_dis
 
     rows = []
     for i, r in df.iterrows():
         ts_start = ts.iloc[i]
         dt_h = float(step.iloc[i])
+        emax, soc_min, soc_max = emax_a[i], soc_min_a[i], soc_max_a[i]
+        c_ch, c_dis, eta_ch, eta_dis = c_ch_a[i], c_dis_a[i], eta_ch_a[i], eta_dis_a[i]
+        # i = 0: SOC startowy w granicach; dalej przycięcie przy zmianie granic (stałe → no-op)
+        soc = min(max(soc, soc_min), soc_max)
         ts_end = ts_start + pd.Timedelta(hours=dt_h)
 
         need = float(r["delta_brutto"])          # +pobór / -nadwyżka [MWh/Δt]
@@ -123,6 +129,7 @@ def compute_oze_detail(df: pd.DataFrame, tp: TrackParams) -> pd.DataFrame:
         })
 
     out = pd.DataFrame(rows)
+    out.attrs["soc_end_exact"] = soc  # SOC bez zaokrąglenia (kontynuacja w kolejnej paczce)
     log.info(
         "OZE detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f)",
         len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
@@ -0,0 +1,228 @@
+"""
+Rejestr backendów silników (per tor) z wyborem przez ENV i trybem shadow.
+
+Backendy:
+  python    — referencyjne pętle (engines/oze.py, engines/arbi.py),
+  numpy     — wektorowy skan SOC (engines/vectorized.py),
+  compiled  — kernele sekwencyjne kompilowane numbą (engines/compiled.py, opcjonalne),
+  events    — skan tylko po krokach aktywnych, ciągi bezczynne w postaci zamkniętej (engines/events.py).
+
+ENV:
+  ENGINE_BACKEND=python|numpy|compiled|events — domyślny backend wszystkich torów,
+  ENGINE_BACKEND_OZE / _ARBI / _BROKER / _TRACKS — nadpisanie per tor (TRACKS = model N-torowy),
+  ENGINE_SHADOW_BACKEND (+ _OZE/_ARBI/_BROKER/_TRACKS) — kandydat liczony obok aktywnego,
+  ENGINE_SHADOW_ATOL / ENGINE_SHADOW_RTOL      — tolerancja porównania kolumn
+                                               (domyślnie 1.5e-6: jedna jednostka zaokrąglenia wyników).
+
+Jeśli backend nie importuje się (np. brak numby), rejestr przechodzi na kolejny
+z FALLBACK_ORDER i loguje ostrzeżenie. Wyniki shadow są tylko porównywane i logowane
+— nigdy nie trafiają do zapisu.
+"""
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+TRACKS = ("oze", "arbi", "broker", "tracks")
+FALLBACK_ORDER = ("compiled", "numpy", "python")
+DEFAULT_BACKEND = "python"
+# backendy, których pętla SOC działa bez GIL (numba nogil / segmenty w numpy) — tory w wątkach równolegle
+NOGIL_BACKENDS = ("compiled", "events")
+
+# tor → backend → "moduł:funkcja"
+_REGISTRY: Dict[str, Dict[str, str]] = {
+    "oze": {
+        "python": "energy_calc.engines.oze:compute_oze_detail",
+        "numpy": "energy_calc.engines.vectorized:compute_oze_detail",
+        "compiled": "energy_calc.engines.compiled:compute_oze_detail",
+        "events": "energy_calc.engines.events:compute_oze_detail",
+    },
+    "arbi": {
+        "python": "energy_calc.engines.arbi:compute_arbi_detail",
+        "numpy": "energy_calc.engines.vectorized:compute_arbi_detail",
+        "compiled": "energy_calc.engines.compiled:compute_arbi_detail",
+        "events": "energy_calc.engines.events:compute_arbi_detail",
+    },
+    "broker": {
+        # broker jest wektorowy od zawsze — jedna implementacja pod wszystkimi nazwami
+        "python": "energy_calc.engines.broker:compute_broker_detail",
+        "numpy": "energy_calc.engines.broker:compute_broker_detail",
+        "compiled": "energy_calc.engines.broker:compute_broker_detail",
+        "events": "energy_calc.engines.broker:compute_broker_detail",
+    },
+    # model N-torowy (params.tracks) — tory + broker priorytetowy w jednym kernelu
+    "tracks": {
+        "python": "energy_calc.engines.multitrack:compute_tracks_detail_loop",
+        "numpy": "energy_calc.engines.multitrack:compute_tracks_detail",
+        "compiled": "energy_calc.engines.compiled:compute_tracks_detail",
+        "events": "energy_calc.engines.multitrack:compute_tracks_detail",  # tory współdzielą moc — bez skoków
+    },
+}
+
+
+@dataclass(frozen=True)
+class Backend:
+    track: str
+    name: str
+    fn: Callable[..., pd.DataFrame]
+
+
+def register_backend(track: str, name: str, target: str) -> None:
+    """Dodaje/nadpisuje backend toru; `target` = "pakiet.moduł:funkcja" (import leniwy)."""
+    if track not in _REGISTRY:
+        raise ValueError(f"Nieznany tor {track!r}; dostępne: {', '.join(TRACKS)}")
+    _REGISTRY[track][name] = target
+    _CACHE.pop((track, name), None)
+
+
+def available(track: str) -> List[str]:
+    return list(_REGISTRY[track])
+
+
+_CACHE: Dict[Tuple[str, str], Backend] = {}
+
+
+def _import(track: str, name: str) -> Backend:
+    key = (track, name)
+    if key not in _CACHE:
+        target = _REGISTRY[track].get(name)
+        if target is None:
+            raise ImportError(f"Brak backendu {name!r} dla toru {track!r}")
+        mod_name, fn_name = target.split(":")
+        fn = getattr(importlib.import_module(mod_name), fn_name)
+        _CACHE[key] = Backend(track, name, fn)
+    return _CACHE[key]
+
+
+def _env_choice(prefix: str, track: str) -> Optional[str]:
+    v = os.getenv(f"{prefix}_{track.upper()}") or os.getenv(prefix)
+    return v.strip().lower() if v and v.strip() else None
+
+
+def resolve(track: str, name: Optional[str] = None) -> Backend:
+    """Backend dla toru: jawny `name` → ENV → DEFAULT_BACKEND, z fallbackiem przy błędzie importu."""
+    wanted = name or _env_choice("ENGINE_BACKEND", track) or DEFAULT_BACKEND
+    # fallback tylko "w dół" kolejności (compiled → numpy → python); własny backend → cała kolejka
+    rank = FALLBACK_ORDER.index(wanted) if wanted in FALLBACK_ORDER else -1
+    chain = [wanted] + [b for b in FALLBACK_ORDER if FALLBACK_ORDER.index(b) > rank]
+    tried = []
+    for cand in chain:
+        if cand not in _REGISTRY[track]:
+            continue
+        try:
+            b = _import(track, cand)
+        except Exception as e:  # ImportError, brak numby, błąd kompilacji…
+            tried.append(f"{cand}: {e.__class__.__name__}: {e}")
+            continue
+        if cand != wanted:
+            log.warning("Engine backend %s/%s unavailable (%s) → fallback to %s",
+                        track, wanted, "; ".join(tried) or "not registered", cand)
+        return b
+    raise ImportError(f"Żaden backend toru {track!r} nie jest dostępny: {'; '.join(tried)}")
+
+
+def shadow_backend(track: str, active: Backend) -> Optional[Backend]:
+    """Kandydat shadow z ENV (None gdy nie ustawiono, niedostępny albo ten sam co aktywny)."""
+    name = _env_choice("ENGINE_SHADOW_BACKEND", track)
+    if not name or name not in _REGISTRY[track]:
+        return None
+    try:
+        b = _import(track, name)
+    except Exception as e:
+        log.warning("Shadow backend %s/%s unavailable: %s", track, name, e)
+        return None
+    if b.fn is active.fn:
+        return None
+    return b
+
+
+def releases_gil(*tracks: str) -> bool:
+    """Czy aktywne (i shadow) backendy torów zwalniają GIL — tylko wtedy tory warto liczyć w wątkach."""
+    for track in tracks:
+        active = resolve(track)
+        shadow = shadow_backend(track, active)
+        if any(b.name not in NOGIL_BACKENDS for b in (active, shadow) if b is not None):
+            return False
+    return True
+
+
+# ---------- porównanie ----------
+
+@dataclass
+class ColumnDiff:
+    column: str
+    mismatches: int
+    max_abs_diff: float
+
+
+def compare_frames(active: pd.DataFrame, candidate: pd.DataFrame,
+                   atol: float = 1e-6, rtol: float = 0.0) -> Tuple[List[ColumnDiff], Optional[str]]:
+    """Porównanie kolumna po kolumnie; zwraca (różnice, błąd strukturalny lub None)."""
+    if len(active) != len(candidate):
+        return [], f"rows {len(active)} != {len(candidate)}"
+    missing = [c for c in active.columns if c not in candidate.columns]
+    if missing:
+        return [], f"missing columns: {', '.join(missing)}"
+    diffs: List[ColumnDiff] = []
+    for c in active.columns:
+        a, b = active[c], candidate[c]
+        if a.dtype.kind in "fiu" and b.dtype.kind in "fiu":
+            av, bv = a.to_numpy(dtype=float), b.to_numpy(dtype=float)
+            both_nan = np.isnan(av) & np.isnan(bv)
+            with np.errstate(invalid="ignore"):
+                d = np.where(both_nan, 0.0, np.abs(av - bv))
+            bad = ~(d <= atol + rtol * np.nan_to_num(np.abs(av)))
+            if bad.any():
+                diffs.append(ColumnDiff(c, int(bad.sum()), float(np.nanmax(d)) if np.isfinite(d).any() else float("inf")))
+        else:
+            eq = (a.reset_index(drop=True) == b.reset_index(drop=True)) | (a.isna().to_numpy() & b.isna().to_numpy())
+            n_bad = int((~eq).sum())
+            if n_bad:
+                diffs.append(ColumnDiff(c, n_bad, float("nan")))
+    return diffs, None
+
+
+def _tolerances() -> Tuple[float, float]:
+    return float(os.getenv("ENGINE_SHADOW_ATOL", "1.5e-6")), float(os.getenv("ENGINE_SHADOW_RTOL", "0"))
+
+
+def run_track(track: str, *args, **kwargs) -> pd.DataFrame:
+    """Liczy tor aktywnym backendem; jeśli skonfigurowano shadow — liczy też kandydata i loguje porównanie."""
+    active = resolve(track)
+    t0 = time.perf_counter()
+    out = active.fn(*args, **kwargs)
+    t_active = time.perf_counter() - t0
+
+    shadow = shadow_backend(track, active)
+    if shadow is None:
+        return out
+    try:
+        t0 = time.perf_counter()
+        cand = shadow.fn(*args, **kwargs)
+        t_cand = time.perf_counter() - t0
+        atol, rtol = _tolerances()
+        diffs, err = compare_frames(out, cand, atol=atol, rtol=rtol)
+        speedup = t_active / t_cand if t_cand > 0 else float("inf")
+        if err or diffs:
+            log.warning(
+                "SHADOW %s | active=%s %.1fms vs candidate=%s %.1fms (speedup x%.2f) | DIVERGED: %s",
+                track, active.name, t_active * 1000, shadow.name, t_cand * 1000, speedup,
+                err or ", ".join(f"{d.column}[n={d.mismatches}, max={d.max_abs_diff:.3g}]" for d in diffs),
+            )
+        else:
+            log.info(
+                "SHADOW %s | active=%s %.1fms vs candidate=%s %.1fms (speedup x%.2f) | match (atol=%g, rtol=%g)",
+                track, active.name, t_active * 1000, shadow.name, t_cand * 1000, speedup, atol, rtol,
+            )
+    except Exception as e:
+        log.exception("SHADOW %s | candidate %s failed: %s", track, shadow.name, e)
+    return out
@@ -0,0 +1,78 @@
+from __future__ import annotations
+import logging
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from ..models import Params
+from ..util.rolling import TrailingQuantiles
+
+log = logging.getLogger(__name__).getChild("thresholds")
+
+Threshold = Union[float, np.ndarray, None]
+
+
+def new_threshold_state(params: Params) -> Optional[TrailingQuantiles]:
+    """Stan okna kwantyli dla trybu `rolling_quantile` (None dla progów stałych)."""
+    if params.arbi_threshold_mode != "rolling_quantile":
+        return None
+    return TrailingQuantiles(
+        window_h=params.arbi_q_window_h,
+        qs=(params.arbi_q_low_pct / 100.0, params.arbi_q_high_pct / 100.0),
+        min_samples=params.arbi_q_min_samples,
+    )
+
+
+def arbi_thresholds(
+    df: pd.DataFrame,
+    params: Params,
+    state: Optional[TrailingQuantiles] = None,
+) -> Tuple[Threshold, Threshold]:
+    """
+    Progi cenowe toru ARBI dla kroków `df`:
+      - `fixed`            → skalary `arbi_price_low/high` z params (z harmonogramem
+                             params.schedules — tablice per krok z kolumn sched_price_*),
+      - `rolling_quantile` → tablice per krok: kwantyle `price_pln_mwh` z okna
+                             (t - arbi_q_window_h, t); przy zbyt małej próbce
+                             w oknie fallback na progi stałe.
+
+    `state` pozwala liczyć szereg w kawałkach (okno przechodzi między wywołaniami).
+    """
+    fixed_low = _fixed(df, "sched_price_low", params.arbi_price_low)
+    fixed_high = _fixed(df, "sched_price_high", params.arbi_price_high)
+    if params.arbi_threshold_mode != "rolling_quantile":
+        return fixed_low, fixed_high
+
+    if state is None:
+        state = new_threshold_state(params)
+    if df.empty:
+        return np.empty(0), np.empty(0)
+
+    ts_ns = pd.to_datetime(df["ts_utc"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    low, high = state.update(ts_ns, price)
+
+    warmup = np.isnan(low)
+    if warmup.any():
+        low[warmup] = np.broadcast_to(np.nan if fixed_low is None else fixed_low, low.shape)[warmup]
+        high[warmup] = np.broadcast_to(np.nan if fixed_high is None else fixed_high, high.shape)[warmup]
+
+    log.info(
+        "ARBI thresholds | rolling P%.0f/P%.0f window=%.1fh | low[min=%.2f,max=%.2f] "
+        "high[min=%.2f,max=%.2f] | warmup(fixed)=%d",
+        params.arbi_q_low_pct, params.arbi_q_high_pct, params.arbi_q_window_h,
+        np.nanmin(low) if np.isfinite(low).any() else float("nan"),
+        np.nanmax(low) if np.isfinite(low).any() else float("nan"),
+        np.nanmin(high) if np.isfinite(high).any() else float("nan"),
+        np.nanmax(high) if np.isfinite(high).any() else float("nan"),
+        int(warmup.sum()),
+    )
+    return low, high
+
+
+def _fixed(df: pd.DataFrame, col: str, value: Optional[float]) -> Threshold:
+    """Próg stały albo z harmonogramu (kolumna sched_price_* rozwinięta z params.schedules)."""
+    if col in df.columns:
+        return df[col].to_numpy(dtype=float)
+    return value
@@ -0,0 +1,66 @@
+"""Backend `numpy`: tory SOC jako skan odwzorowań clamp-shift (engines/kernels.py)."""
+from __future__ import annotations
+import logging
+from typing import Dict, Union
+
+import numpy as np
+import pandas as pd
+
+from ..models import TrackParams
+from . import kernels as K
+
+log = logging.getLogger(__name__).getChild("numpy")
+
+
+def oze_kernel(need: np.ndarray, dt: np.ndarray, tp: Union[TrackParams, K.TrackSteps]) -> Dict[str, np.ndarray]:
+    """Surowe tablice kroków toru OZE (bez ramki) — np. dla optymalizatora."""
+    return K.oze_arrays(need, dt, tp)
+
+
+def arbi_kernel(price: np.ndarray, low, high, dt: np.ndarray, tp: Union[TrackParams, K.TrackSteps]) -> Dict[str, np.ndarray]:
+    r = K.arbi_arrays(price, low, high, dt, tp)
+    if r is None:
+        # SOC startowy poza [soc_min, soc_max] — kernel sekwencyjny (wolniejszy, ale dokładny)
+        r = dict(zip(K.ARBI_LOOP_KEYS, K.arbi_loop(*K.arbi_loop_args(price, low, high, dt, tp))))
+    return r
+
+
+def compute_oze_detail(df: pd.DataFrame, tp: TrackParams) -> pd.DataFrame:
+    """Jak engines.oze.compute_oze_detail, bez pętli po wierszach."""
+    if df.empty:
+        return pd.DataFrame(columns=K.OZE_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    need = df["delta_brutto"].to_numpy(dtype=float)
+    st = K.track_steps(tp, df)
+    out = K.oze_frame(ts, dt, oze_kernel(need, dt, st), st)
+    log.info(
+        "OZE detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f)",
+        len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
+        float(out["loss_conv_mwh"].sum()), float(out["loss_idle_mwh"].sum())
+    )
+    return out
+
+
+def compute_arbi_detail(
+    df: pd.DataFrame,
+    tp: TrackParams,
+    price_low_pln_mwh: Union[float, np.ndarray, None],
+    price_high_pln_mwh: Union[float, np.ndarray, None],
+) -> pd.DataFrame:
+    """Jak engines.arbi.compute_arbi_detail, bez pętli po wierszach."""
+    if df.empty:
+        return pd.DataFrame(columns=K.ARBI_COLS)
+    ts = pd.to_datetime(df["ts_utc"])
+    dt = K.frame_step_hours(df)
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    st = K.track_steps(tp, df)
+    r = arbi_kernel(price, price_low_pln_mwh, price_high_pln_mwh, dt, st)
+    out = K.arbi_frame(ts, dt, price, r, st)
+    log.info(
+        "ARBI detail | rows=%d | e_ch=%.3f e_dis=%.3f loss(conv=%.3f idle=%.3f) | net=%.2f PLN",
+        len(out), float(out["e_ch_mwh"].sum()), float(out["e_dis_mwh"].sum()),
+        float(out["loss_conv_mwh"].sum()), float(out["loss_idle_mwh"].sum()),
+        float(out["net_value_pln"].sum())
+    )
+    return out
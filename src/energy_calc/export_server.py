@@ -0,0 +1,275 @@
+# src/energy_calc/export_server.py
+"""
+Lokalny serwer HTTP wystawiający ostatni opublikowany przebieg jako Arrow IPC.
+
+Włączany przez EXPORT_HTTP_PORT (puste = wyłączony); wymaga pyarrow.
+Endpointy:
+  GET /v1/latest                     → JSON: run_id, tabele, liczba wierszy, kolumny
+  GET /v1/tables/<nazwa>?from=&to=&columns=a,b
+                                     → strumień Arrow IPC (zakres [from, to) po ts_start)
+Tabele: broker, oze, arbi, summary (odpowiednik widoku energy_store_summary),
+tracks (model N-torowy, gdy params.tracks).
+ETag = run_id; If-None-Match z tym samym run_id → 304 bez ciała.
+Po przebiegu strumieniowym (wynik poza pamięcią) snapshot jest wycofywany: 503 z powodem.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+ARROW_STREAM_MIME = "application/vnd.apache.arrow.stream"
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    run_id: str
+    tables: Dict[str, "object"]            # nazwa → pyarrow.Table
+    ts_index: Dict[str, np.ndarray]        # nazwa → ts_start [ns] (posortowane)
+    published_at: str = ""
+    meta: Dict[str, object] = field(default_factory=dict)
+
+
+class ResultStore:
+    """
+    Trzyma ostatni opublikowany przebieg jako tabele Arrow.
+
+    Konwersja pandas → Arrow następuje raz przy publikacji; zapytania to wyłącznie
+    wycinki (slice) i projekcje kolumn — bez kopiowania buforów. Podmiana snapshotu
+    jest atomowa (jedno przypisanie referencji), więc czytelnicy nigdy nie widzą
+    mieszanki dwóch przebiegów.
+    """
+
+    def __init__(self):
+        self._snap: Optional[_Snapshot] = None
+        self._unavailable: Optional[str] = None     # powód braku snapshotu (503)
+
+    @property
+    def snapshot(self) -> Optional[_Snapshot]:
+        return self._snap
+
+    @property
+    def unavailable(self) -> str:
+        return self._unavailable or "no published run yet"
+
+    def invalidate(self, reason: str) -> None:
+        """Wycofuje snapshot — klienci dostają 503 z powodem zamiast danych starszego przebiegu."""
+        self._unavailable = reason
+        self._snap = None
+        log.info("Export: snapshot withdrawn (%s)", reason)
+
+    def publish(self, run_id: str, frames: Dict[str, pd.DataFrame], meta: Optional[dict] = None) -> None:
+        import pyarrow as pa
+
+        tables: Dict[str, object] = {}
+        ts_index: Dict[str, np.ndarray] = {}
+        for name, df in frames.items():
+            if df is None:
+                continue
+            t = pa.Table.from_pandas(df, preserve_index=False)
+            tables[name] = t
+            if "ts_start" in df.columns and len(df):
+                ts_index[name] = pd.to_datetime(df["ts_start"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            else:
+                ts_index[name] = np.empty(0, dtype=np.int64)
+        self._snap = _Snapshot(
+            run_id=run_id,
+            tables=tables,
+            ts_index=ts_index,
+            published_at=pd.Timestamp.now(tz="UTC").isoformat(),
+            meta=dict(meta or {}),
+        )
+        self._unavailable = None
+        log.info("Export: published run %s (%s)", run_id,
+                 ", ".join(f"{k}={v.num_rows}" for k, v in tables.items()))
+
+    def query(self, name: str, ts_from: Optional[str], ts_to: Optional[str], columns: Optional[list]):
+        snap = self._snap
+        if snap is None:
+            raise LookupError("Brak opublikowanego przebiegu")
+        if name not in snap.tables:
+            raise KeyError(name)
+        t = snap.tables[name]
+        idx = snap.ts_index[name]
+        lo, hi = 0, t.num_rows
+        if ts_from and len(idx):
+            lo = int(np.searchsorted(idx, _parse_ts_ns(ts_from), side="left"))
+        if ts_to and len(idx):
+            hi = int(np.searchsorted(idx, _parse_ts_ns(ts_to), side="left"))
+        t = t.slice(lo, max(0, hi - lo))
+        if columns:
+            missing = [c for c in columns if c not in t.column_names]
+            if missing:
+                raise ValueError(f"Nieznane kolumny: {', '.join(missing)}")
+            t = t.select(columns)
+        return snap.run_id, t
+
+
+def _parse_ts_ns(v: str) -> int:
+    ts = pd.Timestamp(v)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return int(ts.value)
+
+
+def summary_frame(df_oze: pd.DataFrame, df_arbi: pd.DataFrame, emax_mwh: float, share_oze: float) -> pd.DataFrame:
+    """Odpowiednik widoku output.energy_store_summary liczony z wyników w pamięci."""
+    o = df_oze[["ts_start", "ts_end", "e_ch_mwh", "e_dis_mwh", "loss_total_mwh", "soc_end_mwh"]].rename(
+        columns={"e_ch_mwh": "oze_e_ch_mwh", "e_dis_mwh": "oze_e_dis_mwh",
+                 "loss_total_mwh": "oze_losses_mwh", "soc_end_mwh": "soc_oze_mwh"}
+    )
+    a = df_arbi[["ts_start", "ts_end", "e_ch_mwh", "e_dis_mwh", "loss_total_mwh",
+                 "cost_pln", "revenue_pln", "net_value_pln", "soc_end_mwh"]].rename(
+        columns={"e_ch_mwh": "arbi_e_ch_mwh", "e_dis_mwh": "arbi_e_dis_mwh",
+                 "loss_total_mwh": "arbi_losses_mwh", "cost_pln": "arbi_cost_pln",
+                 "revenue_pln": "arbi_revenue_pln", "net_value_pln": "arbi_net_pln",
+                 "soc_end_mwh": "soc_arbi_mwh"}
+    )
+    j = o.merge(a, on=["ts_start", "ts_end"], how="inner")
+    j.insert(2, "hour", pd.to_datetime(j["ts_start"]).dt.hour.astype("int32"))
+
+    emax_oze = emax_mwh * share_oze
+    emax_arbi = emax_mwh * (1.0 - share_oze)
+    soc_oze = j["soc_oze_mwh"].to_numpy(dtype=float)
+    soc_arbi = j["soc_arbi_mwh"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        j["soc_oze_pct"] = np.round(soc_oze / emax_oze * 100.0, 2) if emax_oze > 0 else np.nan
+        j["soc_arbi_pct"] = np.round(soc_arbi / emax_arbi * 100.0, 2) if emax_arbi > 0 else np.nan
+        j["soc_total_pct"] = np.round((soc_oze + soc_arbi) / emax_mwh * 100.0, 2)
+    return j
+
+
+def publish_result(store: ResultStore, result) -> None:
+    """Publikuje RebuildResult z pipeline (detale + summary) w store."""
+    if getattr(result, "streamed", False):
+        # wynik nie jest w pamięci; poprzedni snapshot nie odpowiada już tabelom w bazie
+        store.invalidate(f"run {result.run_id} streamed, not exported")
+        return
+    p = result.params
+    frames = {
+        "broker": result.df_broker,
+        "oze": result.df_oze,
+        "arbi": result.df_arbi,
+        "summary": summary_frame(result.df_oze, result.df_arbi, p.emax, p.share_oze),
+    }
+    df_tracks = getattr(result, "df_tracks", None)
+    if df_tracks is not None and len(df_tracks):
+        frames["tracks"] = df_tracks        # model N-torowy (format długi, posortowany po ts_start)
+    store.publish(result.run_id, frames, meta={"emax_mwh": p.emax, "share_oze": p.share_oze})
+
+
+def _make_handler(store: ResultStore):
+    class _Handler(BaseHTTPRequestHandler):
+        server_version = "energy-calc-export/1"
+
+        def log_message(self, fmt, *args):  # pragma: no cover - logi do loggera
+            log.debug("export %s - " + fmt, self.address_string(), *args)
+
+        def _send_json(self, code: int, body: dict, etag: Optional[str] = None) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            if etag:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _not_modified(self, etag: str) -> bool:
+            inm = self.headers.get("If-None-Match")
+            if inm and etag in [t.strip() for t in inm.split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return True
+            return False
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            snap = store.snapshot
+            if snap is None:
+                return self._send_json(503, {"error": store.unavailable})
+            etag = f'"{snap.run_id}"'
+
+            if parts == ["v1", "latest"]:
+                if self._not_modified(etag):
+                    return
+                return self._send_json(200, {
+                    "run_id": snap.run_id,
+                    "published_at": snap.published_at,
+                    "meta": snap.meta,
+                    "tables": {k: {"rows": t.num_rows, "columns": t.column_names} for k, t in snap.tables.items()},
+                }, etag=etag)
+
+            if len(parts) == 3 and parts[:2] == ["v1", "tables"]:
+                q = parse_qs(url.query)
+                cols = [c for c in ",".join(q.get("columns", [])).split(",") if c] or None
+                try:
+                    run_id, t = store.query(parts[2], q.get("from", [None])[0], q.get("to", [None])[0], cols)
+                except KeyError:
+                    return self._send_json(404, {"error": f"unknown table {parts[2]!r}"})
+                except (ValueError, LookupError) as e:
+                    return self._send_json(400, {"error": str(e)})
+                etag = f'"{run_id}"'
+                if self._not_modified(etag):
+                    return
+                return self._send_arrow(t, etag)
+
+            return self._send_json(404, {"error": "not found"})
+
+        def _send_arrow(self, table, etag: str) -> None:
+            import pyarrow as pa
+
+            self.send_response(200)
+            self.send_header("Content-Type", ARROW_STREAM_MIME)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            sink = pa.PythonFile(self.wfile, mode="w")
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                for batch in table.to_batches():
+                    writer.write_batch(batch)
+            self.close_connection = True
+
+    return _Handler
+
+
+def start_export_server(host: str, port: int) -> Optional[ResultStore]:
+    """Startuje serwer w wątku-demonie; zwraca store do publikacji (None gdy brak pyarrow)."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        log.warning("EXPORT_HTTP_PORT ustawiony, ale brak pyarrow — eksport Arrow wyłączony.")
+        return None
+    store = ResultStore()
+    httpd = ThreadingHTTPServer((host, port), _make_handler(store))
+    httpd.daemon_threads = True
+    th = threading.Thread(target=httpd.serve_forever, name="arrow-export", daemon=True)
+    th.start()
+    log.info("Arrow export server listening on http://%s:%d/v1/", host, port)
+    return store
+
+
+def start_from_env() -> Optional[ResultStore]:
+    port = os.getenv("EXPORT_HTTP_PORT", "").strip()
+    if not port:
+        return None
+    host = os.getenv("EXPORT_HTTP_HOST", "127.0.0.1").strip() or "127.0.0.1"
+    try:
+        return start_export_server(host, int(port))
+    except Exception as e:
+        log.exception("Cannot start Arrow export server (continuing without it): %s", e)
+        return None
+
@@ -3,6 +3,9 @@ from __future__ import annotations
 import logging
 import time
 import os
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
 import pandas as pd
 import psycopg
 
@@ -26,16 +29,68 @@ def connect_db(cfg: RunConfig) -> psycopg.Connection:
     return conn
 
 
-def load_delta_brutto(conn: psycopg.Connection) -> pd.DataFrame:
-    q = """
-        SELECT
-          ts_utc,
-          delta_brutto::float8 AS delta_brutto,
-          price_pln_mwh::float8 AS price_pln_mwh
-        FROM output.delta_brutto
-        ORDER BY ts_utc
+def read_replica_configured(cfg) -> bool:
+    return bool(getattr(cfg, "db_read_host", ""))
+
+
+def connect_read_db(cfg) -> psycopg.Connection:
+    """Połączenie do repliki odczytu (pola db_read_*; puste → jak primary)."""
+    t0 = time.perf_counter()
+    conn = psycopg.connect(
+        host=cfg.db_read_host,
+        port=int(cfg.db_read_port or cfg.db_port),
+        dbname=cfg.db_read_name or cfg.db_name,
+        user=cfg.db_read_user or cfg.db_user,
+        password=cfg.db_read_password or cfg.db_password,
+        autocommit=True,
+        connect_timeout=10,
+    )
+    LOG.info("DB read replica connection established in %.1f ms", (time.perf_counter() - t0) * 1000)
+    return conn
+
+
+def primary_lsn(conn: psycopg.Connection) -> Optional[str]:
+    """Bieżący LSN zapisu primary (None, gdy serwer jest w recovery albo zapytanie się nie powiodło)."""
+    try:
+        row = conn.execute("SELECT pg_current_wal_lsn()::text").fetchone()
+    except psycopg.Error as e:
+        LOG.warning("Cannot read primary WAL LSN: %s", e)
+        return None
+    return row[0] if row else None
+
+
+def wait_for_replay(conn: psycopg.Connection, lsn: str, max_wait_sec: float, poll_sec: float = 0.05) -> bool:
     """
-    df = pd.read_sql_query(q, conn)
+    Czeka, aż replika odtworzy WAL do `lsn` (pg_last_wal_replay_lsn ≥ lsn), najwyżej `max_wait_sec`.
+    Serwer niebędący standby (replay LSN = NULL) jest traktowany jak aktualny.
+    """
+    deadline = time.monotonic() + max(0.0, max_wait_sec)
+    while True:
+        replay, behind = conn.execute(
+            "SELECT pg_last_wal_replay_lsn()::text, pg_wal_lsn_diff(%s::pg_lsn, pg_last_wal_replay_lsn())",
+            (lsn,),
+        ).fetchone()
+        if replay is None or behind <= 0:
+            return True
+        if time.monotonic() >= deadline:
+            LOG.warning("Read replica behind primary by %s bytes (replay=%s, target=%s) after %.1fs",
+                        behind, replay, lsn, max_wait_sec)
+            return False
+        time.sleep(poll_sec)
+
+
+DELTA_BRUTTO_SQL = """
+    SELECT
+      ts_utc,
+      delta_brutto::float8 AS delta_brutto,
+      price_pln_mwh::float8 AS price_pln_mwh
+    FROM output.delta_brutto
+    ORDER BY ts_utc
+"""
+
+
+def load_delta_brutto(conn: psycopg.Connection) -> pd.DataFrame:
+    df = pd.read_sql_query(DELTA_BRUTTO_SQL, conn)
     LOG.info(
         "Loaded output.delta_brutto: rows=%d cols=%d price[min=%.2f, max=%.2f] nulls=%d",
         len(df), len(df.columns),
@@ -46,6 +101,45 @@ def load_delta_brutto(conn: psycopg.Connection) -> pd.DataFrame:
     return df
 
 
+def iter_delta_brutto(
+    conn: psycopg.Connection, chunk_rows: int, since: Optional[datetime] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    output.delta_brutto w paczkach po `chunk_rows` wierszy (kursor po stronie serwera),
+    opcjonalnie od `since` (ts_utc > since). Wymaga połączenia, które na czas iteracji
+    może trzymać otwartą transakcję (osobne od zapisu).
+    """
+    cols = ["ts_utc", "delta_brutto", "price_pln_mwh"]
+    q, args = DELTA_BRUTTO_SQL, None
+    if since is not None:
+        q = DELTA_BRUTTO_SQL.replace("ORDER BY ts_utc", "WHERE ts_utc > %s\n    ORDER BY ts_utc")
+        args = (since,)
+    with conn.transaction():
+        with conn.cursor(name="energy_calc_delta_stream") as cur:
+            cur.itersize = chunk_rows
+            cur.execute(q, args)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                df = pd.DataFrame(rows, columns=cols)
+                df["ts_utc"] = pd.to_datetime(df["ts_utc"])
+                df[cols[1:]] = df[cols[1:]].astype(float)
+                yield df
+
+
+def last_delta_before(conn: psycopg.Connection, until: datetime) -> pd.DataFrame:
+    """Ostatni wiersz output.delta_brutto z ts_utc <= `until` (0 albo 1 wiersz) — kotwica wznowienia."""
+    q = DELTA_BRUTTO_SQL.replace("ORDER BY ts_utc", "WHERE ts_utc <= %s\n    ORDER BY ts_utc DESC LIMIT 1")
+    cols = ["ts_utc", "delta_brutto", "price_pln_mwh"]
+    with conn.cursor() as cur:
+        cur.execute(q, (until,))
+        df = pd.DataFrame(cur.fetchall(), columns=cols)
+    df["ts_utc"] = pd.to_datetime(df["ts_utc"])
+    df[cols[1:]] = df[cols[1:]].astype(float)
+    return df
+
+
 # ---------- BOOTSTRAP OUTPUT OBJECTS (idempotent) ----------
 
 def _run_sql_file(conn: psycopg.Connection, path: str) -> None:
@@ -75,15 +169,54 @@ def ensure_output_objects(conn: psycopg.Connection, sql_dir: str = "/app/sql") -
     _run_sql_file(conn, view_sql)
 
 
-def truncate_details_v2(conn: psycopg.Connection, schema: str = "output") -> None:
+DETAIL_TABLES = ("broker", "oze", "arbi", "tracks")
+
+
+def truncate_details_v2(
+    conn: psycopg.Connection,
+    schema: str = "output",
+    tables: Iterable[str] = DETAIL_TABLES,
+) -> None:
     # Upewnij się, że obiekty istnieją (po wipe DB)
-    ensure_output_objects(conn, sql_dir="/app/sql")
+    ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+
+    tables = [t for t in ("oze", "arbi", "broker") if t in set(tables)]
+    with conn.cursor() as cur:
+        for t in tables:
+            cur.execute(f"TRUNCATE {schema}.energy_{t}_detail")
+    LOG.info("Truncated %s.energy_{%s}_detail tables", schema, ",".join(tables))
+
+
+def delete_details_v2(
+    conn: psycopg.Connection,
+    schema: str = "output",
+    tables: Iterable[str] = DETAIL_TABLES,
+) -> None:
+    """
+    DELETE zamiast TRUNCATE — do czyszczenia wewnątrz długiej transakcji: blokada ROW EXCLUSIVE,
+    czytelnicy (MVCC) widzą stare wiersze aż do COMMIT. Obiekty muszą już istnieć
+    (ensure_output_objects przed transakcją).
+    """
+    tables = [t for t in ("oze", "arbi", "broker") if t in set(tables)]
+    with conn.cursor() as cur:
+        for t in tables:
+            cur.execute(f"DELETE FROM {schema}.energy_{t}_detail")
+    LOG.info("Deleted rows of %s.energy_{%s}_detail tables", schema, ",".join(tables))
+
 
+def nonempty_details(conn: psycopg.Connection, schema: str = "output") -> set[str]:
+    """Tabele energy_*_detail, które istnieją i mają choć jeden wiersz (tani test, bez count(*))."""
+    found = set()
     with conn.cursor() as cur:
-        cur.execute(f"TRUNCATE {schema}.energy_oze_detail")
-        cur.execute(f"TRUNCATE {schema}.energy_arbi_detail")
-        cur.execute(f"TRUNCATE {schema}.energy_broker_detail")
-    LOG.info("Truncated %s.energy_*_detail tables", schema)
+        for t in DETAIL_TABLES:
+            fq = f"{schema}.energy_{t}_detail"
+            cur.execute("SELECT to_regclass(%s)", (fq,))
+            if cur.fetchone()[0] is None:
+                continue
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {fq})")
+            if cur.fetchone()[0]:
+                found.add(t)
+    return found
 
 
 def copy_details_v2(
@@ -92,12 +225,16 @@ def copy_details_v2(
     df_oze: pd.DataFrame,
     df_arbi: pd.DataFrame,
     schema: str = "output",
+    tables: Iterable[str] = DETAIL_TABLES,
 ) -> None:
-    from .map_detail import BROKER_COLS, OZE_COLS, ARBI_COLS, sanitize_types
+    from .map_detail import BROKER_COLS, OZE_COLS, ARBI_COLS, TAG_COLS, sanitize_types
 
-    tb = sanitize_types(df_broker, BROKER_COLS)
-    to = sanitize_types(df_oze,    OZE_COLS)
-    ta = sanitize_types(df_arbi,   ARBI_COLS)
+    broker_cols, oze_cols, arbi_cols = BROKER_COLS + TAG_COLS, OZE_COLS + TAG_COLS, ARBI_COLS + TAG_COLS
+    tables = set(tables)
+    empty = pd.DataFrame()
+    tb = sanitize_types(df_broker, broker_cols) if "broker" in tables else empty
+    to = sanitize_types(df_oze,    oze_cols) if "oze" in tables else empty
+    ta = sanitize_types(df_arbi,   arbi_cols) if "arbi" in tables else empty
 
     def _copy(df, fq, cols):
         if df.empty:
@@ -106,8 +243,8 @@ def copy_details_v2(
             with cur.copy(f"COPY {fq} ({','.join(cols)}) FROM STDIN WITH (FORMAT CSV)") as cp:
                 df.to_csv(cp, index=False, header=False)
 
-    _copy(tb, f"{schema}.energy_broker_detail", BROKER_COLS)
-    _copy(to, f"{schema}.energy_oze_detail",    OZE_COLS)
-    _copy(ta, f"{schema}.energy_arbi_detail",   ARBI_COLS)
+    _copy(tb, f"{schema}.energy_broker_detail", broker_cols)
+    _copy(to, f"{schema}.energy_oze_detail",    oze_cols)
+    _copy(ta, f"{schema}.energy_arbi_detail",   arbi_cols)
 
     LOG.info("COPY v2 done | broker=%d, oze=%d, arbi=%d", len(tb), len(to), len(ta))
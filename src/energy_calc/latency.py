@@ -0,0 +1,451 @@
+# src/energy_calc/latency.py
+"""
+Pomiar end-to-end: NOTIFY ch_energy_rebuild → spójne dane w output.energy_*_detail.
+
+Harness stawia jednorazowego Postgresa (initdb/pg_ctl w katalogu tymczasowym) albo używa
+wskazanej, dedykowanej bazy (--dsn), instaluje sql/01_tables.sql i 02_view_summary.sql oraz
+syntetyczne params.form_zmienne i output.delta_brutto, po czym uruchamia prawdziwą pętlę
+workera (`python -m energy_calc.main`) jako podproces.
+
+Każda seria (burst): zmiana ceny ostatniego kroku delta_brutto na znacznik → `--burst-size`
+powiadomień z częstotliwością `--rate` /s → oczekiwanie, aż znacznik pojawi się w
+output.energy_arbi_detail (opublikowany przebieg). Równolegle `--readers` wątków czyta widok
+output.energy_store_summary jak dashboard.
+
+Raport (JSON na stdout):
+  - trigger → publish [ms] (od pierwszego i od ostatniego NOTIFY serii): p50/p90/p99/max,
+  - liczba przebiegów na serię (debounce: oczekiwane 1),
+  - czas zapytań czytelników w trakcie przebiegu vs poza nim.
+
+Użycie:
+  python -m energy_calc.latency --bursts 10 --burst-size 5 --rate 20 --debounce-s 0.5 --readers 4
+  python -m energy_calc.latency --dsn "host=… dbname=bench …" --env ENGINE_BACKEND=numpy
+
+initdb nie działa jako root — wtedy --dsn albo uruchomienie z konta zwykłego użytkownika.
+Znacznik to cena ostatniego kroku — SIM_RESOLUTION workera jest czyszczone (przepróbkowanie uśredniłoby cenę).
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import psycopg
+from psycopg.conninfo import conninfo_to_dict
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "ch_energy_rebuild"
+SQL_DIR = os.getenv("SQL_DIR") or os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "sql"))
+
+# komunikaty main._rebuild / main._loop wyznaczające okno przebiegu
+REBUILD_START = "Rebuild started"
+REBUILD_END = ("Rebuild finished", "Fatal error in rebuild", "Error in initial rebuild")
+
+MARKER_BASE = 10_000.0  # cena-znacznik serii i: MARKER_BASE + i (poza zakresem cen syntetycznych)
+
+SYNTH_PARAMS = dict(
+    emax=10, procent_arbitrazu=40,
+    bess_c_rate_charge=2, bess_c_rate_discharge=2, bess_charge_eff=95, bess_discharge_eff=95,
+    bess_lambda_month=3, arbi_price_low=250, arbi_price_high=450, klient_moc_umowna=3,
+    bess_soc_start=50, bess_min_soc=5, bess_max_soc=95,
+)
+
+SETUP_SQL = """
+CREATE SCHEMA IF NOT EXISTS params;
+CREATE SCHEMA IF NOT EXISTS output;
+DROP TABLE IF EXISTS params.form_zmienne CASCADE;
+CREATE TABLE params.form_zmienne (
+  id                serial PRIMARY KEY,
+  updated_at        timestamptz NOT NULL DEFAULT now(),
+  emax              numeric,
+  procent_arbitrazu numeric,
+  payload           jsonb
+);
+DROP TABLE IF EXISTS output.delta_brutto CASCADE;
+CREATE TABLE output.delta_brutto (
+  ts_utc        timestamptz PRIMARY KEY,
+  delta_brutto  numeric,
+  price_pln_mwh numeric
+);
+"""
+
+READER_SQL = """
+SELECT ts_start, soc_oze_pct, soc_arbi_pct, arbi_net_pln
+FROM output.energy_store_summary
+ORDER BY ts_start DESC
+LIMIT %s
+"""
+
+MARKER_SQL = "SELECT price_pln_mwh::float8 FROM output.energy_arbi_detail ORDER BY ts_start DESC LIMIT 1"
+
+
+# ---------- jednorazowy Postgres ----------
+
+def _pg_bin(explicit: Optional[str]) -> str:
+    """Katalog z initdb/pg_ctl: --pg-bin, PG_BIN, PATH, pg_config --bindir, /usr/lib/postgresql/*/bin."""
+    for d in (explicit, os.getenv("PG_BIN")):
+        if d:
+            return d
+    found = shutil.which("initdb")
+    if found:
+        return os.path.dirname(found)
+    if shutil.which("pg_config"):
+        out = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True)
+        if out.returncode == 0 and os.path.exists(os.path.join(out.stdout.strip(), "initdb")):
+            return out.stdout.strip()
+    cands = sorted(glob.glob("/usr/lib/postgresql/*/bin/initdb"))
+    if cands:
+        return os.path.dirname(cands[-1])
+    raise RuntimeError("Nie znaleziono initdb/pg_ctl — podaj --pg-bin / PG_BIN albo --dsn do istniejącej bazy")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalPostgres:
+    """Postgres w katalogu tymczasowym (trust, 127.0.0.1, losowy port); usuwany przy wyjściu."""
+
+    def __init__(self, pg_bin: Optional[str] = None, keep: bool = False, dbname: str = "energia"):
+        self.bin = _pg_bin(pg_bin)
+        self.keep = keep
+        self.dbname = dbname
+        self.root = tempfile.mkdtemp(prefix="energy-calc-pg-")
+        self.data = os.path.join(self.root, "data")
+        self.port = _free_port()
+
+    def _run(self, *args: str) -> None:
+        subprocess.run([os.path.join(self.bin, args[0]), *args[1:]], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def __enter__(self) -> Dict[str, str]:
+        t0 = time.perf_counter()
+        self._run("initdb", "-D", self.data, "-U", "postgres", "-A", "trust", "-E", "UTF8", "--no-sync")
+        self._run("pg_ctl", "-D", self.data, "-l", os.path.join(self.root, "postgres.log"), "-w",
+                  "-o", f"-p {self.port} -k {self.root} -c listen_addresses=127.0.0.1", "start")
+        conn = dict(host="127.0.0.1", port=str(self.port), dbname="postgres", user="postgres", password="x")
+        with psycopg.connect(**conn, autocommit=True) as c:
+            c.execute(f'CREATE DATABASE "{self.dbname}"')
+        log.info("Local Postgres %s on port %d ready in %.1f s", self.data, self.port, time.perf_counter() - t0)
+        return {**conn, "dbname": self.dbname}
+
+    def __exit__(self, *exc) -> None:
+        try:
+            self._run("pg_ctl", "-D", self.data, "-m", "fast", "-w", "stop")
+        except subprocess.CalledProcessError as e:
+            log.warning("pg_ctl stop failed: %s", e.stderr.decode(errors="replace").strip())
+        if self.keep:
+            log.info("Kept Postgres directory: %s", self.root)
+        else:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+# ---------- dane syntetyczne ----------
+
+def synthetic_delta(rows: int, freq: str = "15min", seed: int = 0) -> List[Tuple]:
+    """Wiersze (ts_utc, delta_brutto, price_pln_mwh): profil dobowy cen, ~30% kroków bez nadwyżki."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    ts = pd.date_range("2024-01-01", periods=rows, freq=freq, tz="UTC")
+    h = ts.hour.to_numpy()
+    delta = np.where(rng.random(rows) < 0.3, 0.0, rng.normal(0.0, 0.8, rows))
+    price = 350.0 + 150.0 * np.sin(h / 24.0 * 2 * np.pi) + rng.normal(0.0, 60.0, rows)
+    return list(zip(ts.to_pydatetime(), np.round(delta, 6).tolist(), np.round(price, 2).tolist()))
+
+
+def install(conn_kw: Dict[str, str], rows: int, force: bool = False) -> None:
+    """Schemat output (01/02) + syntetyczne params.form_zmienne i output.delta_brutto."""
+    with psycopg.connect(**conn_kw, autocommit=True) as conn:
+        if not force:
+            n = conn.execute("SELECT to_regclass('output.delta_brutto') IS NOT NULL").fetchone()[0]
+            if n and conn.execute("SELECT EXISTS (SELECT 1 FROM output.delta_brutto)").fetchone()[0]:
+                raise RuntimeError("output.delta_brutto ma dane — harness nadpisuje bazę; użyj --force "
+                                   "tylko na bazie testowej")
+        with conn.transaction():
+            conn.execute(SETUP_SQL)
+            conn.execute(
+                "INSERT INTO params.form_zmienne (emax, procent_arbitrazu, payload) VALUES (%s, %s, %s)",
+                (SYNTH_PARAMS["emax"], SYNTH_PARAMS["procent_arbitrazu"], json.dumps(SYNTH_PARAMS)),
+            )
+            with conn.cursor() as cur:
+                with cur.copy("COPY output.delta_brutto (ts_utc, delta_brutto, price_pln_mwh) FROM STDIN") as cp:
+                    for row in synthetic_delta(rows):
+                        cp.write_row(row)
+            for name in ("01_tables.sql", "02_view_summary.sql"):
+                with open(os.path.join(SQL_DIR, name), encoding="utf-8") as f:
+                    conn.execute(f.read())
+    log.info("Installed schema and synthetic input (%d rows)", rows)
+
+
+# ---------- worker ----------
+
+@dataclass
+class WorkerLog:
+    """Znaczniki czasu (perf_counter harnessu) początków i końców przebiegów z logu workera."""
+    starts: List[float] = field(default_factory=list)
+    ends: List[float] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    tee: Optional[object] = None
+
+    def feed(self, line: str) -> None:
+        t = time.perf_counter()
+        if self.tee is not None:
+            self.tee.write(line)
+        with self.lock:
+            if REBUILD_START in line:
+                self.starts.append(t)
+            elif any(m in line for m in REBUILD_END):
+                self.ends.append(t)
+
+    def counts(self) -> Tuple[int, int]:
+        with self.lock:
+            return len(self.starts), len(self.ends)
+
+    def windows(self) -> List[Tuple[float, float]]:
+        with self.lock:
+            ends = self.ends + [float("inf")] * (len(self.starts) - len(self.ends))
+            return list(zip(self.starts, ends))
+
+
+def start_worker(conn_kw: Dict[str, str], debounce_s: float, extra_env: Dict[str, str],
+                 wlog: WorkerLog) -> subprocess.Popen:
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith(("PG", "DB_")) and k not in ("RUN_ONCE", "SIM_RESOLUTION")}
+    src = os.path.normpath(os.path.join(os.path.dirname(__file__), ".."))
+    env.update(
+        PGHOST=conn_kw["host"], PGPORT=str(conn_kw.get("port") or 5432), PGDATABASE=conn_kw["dbname"],
+        PGUSER=conn_kw["user"], PGPASSWORD=conn_kw.get("password") or "x",
+        DB_HOST=conn_kw["host"], DB_PORT=str(conn_kw.get("port") or 5432), DB_NAME=conn_kw["dbname"],
+        DB_USER=conn_kw["user"], DB_PASSWORD=conn_kw.get("password") or "x",
+        NOTIFY_CHANNELS=CHANNEL, PERIODIC_TICK_SEC="86400", DEBOUNCE_SECONDS=str(debounce_s),
+        SQL_DIR=SQL_DIR, LOG_LEVEL="INFO", PYTHONUNBUFFERED="1",
+        PYTHONPATH=os.pathsep.join(p for p in (src, env.get("PYTHONPATH")) if p),
+    )
+    env.update(extra_env)
+    proc = subprocess.Popen([sys.executable, "-m", "energy_calc.main"], env=env, text=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1)
+
+    def pump():
+        for line in proc.stdout:
+            wlog.feed(line)
+
+    threading.Thread(target=pump, name="worker-log", daemon=True).start()
+    return proc
+
+
+def _wait(cond, timeout_s: float, what: str, proc: subprocess.Popen) -> bool:
+    deadline = time.perf_counter() + timeout_s
+    while time.perf_counter() < deadline:
+        if cond():
+            return True
+        if proc.poll() is not None:
+            raise RuntimeError(f"Worker exited with code {proc.returncode} while waiting for {what}")
+        time.sleep(0.005)
+    log.warning("Timeout (%.0f s) waiting for %s", timeout_s, what)
+    return False
+
+
+# ---------- czytelnicy (dashboard) ----------
+
+class Readers:
+    """Wątki czytające widok podsumowania; zapisują (start, czas trwania) każdego zapytania."""
+
+    def __init__(self, conn_kw: Dict[str, str], n: int, limit: int, interval_s: float):
+        self.conn_kw, self.n, self.limit, self.interval_s = conn_kw, n, limit, interval_s
+        self.samples: List[Tuple[float, float]] = []
+        self.errors = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def _run(self) -> None:
+        with psycopg.connect(**self.conn_kw, autocommit=True) as conn:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    conn.execute(READER_SQL, (self.limit,)).fetchall()
+                except psycopg.Error:
+                    with self._lock:
+                        self.errors += 1
+                else:
+                    with self._lock:
+                        self.samples.append((t0, time.perf_counter() - t0))
+                self._stop.wait(self.interval_s)
+
+    def __enter__(self) -> "Readers":
+        for i in range(self.n):
+            t = threading.Thread(target=self._run, name=f"reader-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=10)
+
+
+# ---------- pomiar ----------
+
+def _pct(xs: List[float]) -> Dict[str, float]:
+    if not xs:
+        return {"n": 0}
+    a = np.asarray(xs) * 1000.0
+    return {"n": int(a.size), "p50": round(float(np.percentile(a, 50)), 1),
+            "p90": round(float(np.percentile(a, 90)), 1), "p99": round(float(np.percentile(a, 99)), 1),
+            "max": round(float(a.max()), 1)}
+
+
+def run_bursts(conn_kw: Dict[str, str], proc: subprocess.Popen, wlog: WorkerLog, args) -> List[Dict]:
+    """Serie NOTIFY; dla każdej: opóźnienie do publikacji znacznika i liczba przebiegów."""
+    out: List[Dict] = []
+    with psycopg.connect(**conn_kw, autocommit=True) as conn:
+        last_ts = conn.execute("SELECT max(ts_utc) FROM output.delta_brutto").fetchone()[0]
+        for i in range(1, args.bursts + 1):
+            marker = MARKER_BASE + i
+            n0, _ = wlog.counts()
+            conn.execute("UPDATE output.delta_brutto SET price_pln_mwh = %s WHERE ts_utc = %s", (marker, last_ts))
+            t_first = time.perf_counter()
+            for k in range(args.burst_size):
+                if k:
+                    time.sleep(1.0 / args.rate)
+                conn.execute(f"NOTIFY {CHANNEL}, %s", (json.dumps({"burst": i, "seq": k}),))
+            t_last = time.perf_counter()
+
+            def published() -> bool:
+                row = conn.execute(MARKER_SQL).fetchone()
+                return row is not None and row[0] is not None and abs(row[0] - marker) < 1e-6
+
+            ok = _wait(published, args.timeout_s, f"burst {i} publish", proc)
+            t_pub = time.perf_counter()
+            # przebiegi spóźnione względem debounce: odczekaj okno i dokończenie trwających
+            time.sleep(args.debounce_s + args.settle_s)
+            _wait(lambda: wlog.counts()[0] == wlog.counts()[1], args.timeout_s, f"burst {i} settle", proc)
+            rebuilds = wlog.counts()[0] - n0
+            rec = {"burst": i, "notifies": args.burst_size, "rebuilds": rebuilds, "published": ok,
+                   "from_first_ms": round((t_pub - t_first) * 1000.0, 1) if ok else None,
+                   "from_last_ms": round((t_pub - t_last) * 1000.0, 1) if ok else None}
+            log.info("Burst %d: %s", i, rec)
+            out.append(rec)
+            time.sleep(args.gap_s)
+    return out
+
+
+def report(bursts: List[Dict], readers: Readers, wlog: WorkerLog, args) -> Dict:
+    ok = [b for b in bursts if b["published"]]
+    rb = [b["rebuilds"] for b in bursts]
+    win = wlog.windows()
+    busy, idle = [], []
+    for t0, dt in readers.samples:
+        (busy if any(s < t0 + dt and t0 < e for s, e in win) else idle).append(dt)
+    return {
+        "config": {k: getattr(args, k) for k in ("rows", "bursts", "burst_size", "rate", "debounce_s",
+                                                  "readers", "reader_rows", "reader_interval_s")},
+        "worker_env": args.env,
+        "trigger_to_publish_ms": {
+            "from_first_notify": _pct([b["from_first_ms"] / 1000.0 for b in ok]),
+            "from_last_notify": _pct([b["from_last_ms"] / 1000.0 for b in ok]),
+            "timeouts": len(bursts) - len(ok),
+        },
+        "rebuilds_per_burst": {
+            "mean": round(float(np.mean(rb)), 2) if rb else None,
+            "max": max(rb) if rb else None,
+            "hist": {str(k): rb.count(k) for k in sorted(set(rb))},
+        },
+        "reader_ms": {"during_rebuild": _pct(busy), "idle": _pct(idle), "errors": readers.errors},
+        "bursts": bursts,
+    }
+
+
+# ---------- CLI ----------
+
+def _parse_env(items: List[str]) -> Dict[str, str]:
+    out = {}
+    for it in items:
+        k, sep, v = it.partition("=")
+        if not sep or not k:
+            raise SystemExit(f"--env: oczekiwano KLUCZ=WARTOŚĆ, jest {it!r}")
+        out[k] = v
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m energy_calc.latency", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--dsn", help="dedykowana baza testowa zamiast jednorazowego Postgresa (zostanie nadpisana)")
+    ap.add_argument("--force", action="store_true", help="z --dsn: nadpisz niepuste output.delta_brutto")
+    ap.add_argument("--pg-bin", help="katalog z initdb/pg_ctl (domyślnie PG_BIN / PATH / pg_config)")
+    ap.add_argument("--keep", action="store_true", help="nie usuwaj katalogu jednorazowego Postgresa")
+    ap.add_argument("--rows", type=int, default=35_040, help="kroki syntetycznej delta_brutto (15 min)")
+    ap.add_argument("--bursts", type=int, default=10)
+    ap.add_argument("--burst-size", type=int, default=5, help="NOTIFY w serii")
+    ap.add_argument("--rate", type=float, default=20.0, help="NOTIFY/s w serii")
+    ap.add_argument("--gap-s", type=float, default=1.0, help="przerwa między seriami")
+    ap.add_argument("--settle-s", type=float, default=0.5, help="zapas po debounce na spóźnione przebiegi")
+    ap.add_argument("--debounce-s", type=float, default=0.5, help="DEBOUNCE_SECONDS workera")
+    ap.add_argument("--timeout-s", type=float, default=120.0)
+    ap.add_argument("--readers", type=int, default=4, help="wątki czytające widok podsumowania")
+    ap.add_argument("--reader-rows", type=int, default=672, help="LIMIT zapytania czytelnika")
+    ap.add_argument("--reader-interval-s", type=float, default=0.05)
+    ap.add_argument("--env", action="append", default=[], help="dodatkowe ENV workera, np. ENGINE_BACKEND=numpy")
+    ap.add_argument("--worker-log", help="kopia logu workera do pliku")
+    args = ap.parse_args(argv)
+    extra_env = _parse_env(args.env)
+
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        stream=sys.stderr,
+    )
+    if args.dsn:
+        conn_kw = {k: str(v) for k, v in conninfo_to_dict(args.dsn).items()}
+        conn_kw.setdefault("host", "localhost")
+        conn_kw.setdefault("user", os.getenv("USER", "postgres"))
+        pg = None
+    else:
+        pg = LocalPostgres(args.pg_bin, keep=args.keep)
+        conn_kw = pg.__enter__()
+
+    tee = open(args.worker_log, "w", encoding="utf-8") if args.worker_log else None
+    wlog = WorkerLog(tee=tee)
+    proc: Optional[subprocess.Popen] = None
+    try:
+        install(conn_kw, args.rows, force=args.force or pg is not None)
+        proc = start_worker(conn_kw, args.debounce_s, extra_env, wlog)
+        if not _wait(lambda: wlog.counts()[1] >= 1, args.timeout_s, "initial rebuild", proc):
+            return 1
+        log.info("Initial rebuild done; %d bursts × %d NOTIFY @ %.1f/s", args.bursts, args.burst_size, args.rate)
+        with Readers(conn_kw, args.readers, args.reader_rows, args.reader_interval_s) as readers:
+            bursts = run_bursts(conn_kw, proc, wlog, args)
+        print(json.dumps(report(bursts, readers, wlog, args), ensure_ascii=False))
+        return 0
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if tee is not None:
+            tee.close()
+        if pg is not None:
+            pg.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,36 @@
 # src/energy_calc/main.py
+"""
+Worker: pierwszy przebieg na starcie, potem tick (PERIODIC_TICK_SEC) + LISTEN/NOTIFY.
+Tick przelicza tylko po zmianie źródeł (liczniki pg_stat, changes.py; CHANGE_DETECTION=0 — zawsze).
+RUN_ONCE=1 — jeden przebieg w tym samym procesie i wyjście z kodem (cron/batch):
+  0 ok, 64 błędna konfiguracja (ENV), 42 błąd importu modułów, 69 baza niedostępna, 70 błąd przebiegu.
+
+Na poziomie modułu tylko biblioteka standardowa — psycopg, pandas, pydantic i kernele
+ładowane są dopiero przez etapy, które ich używają (preflight w tym samym procesie).
+"""
 from __future__ import annotations
 
+import importlib
 import json
 import logging
 import os
+import sys
+import threading
 import time
+import traceback
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
-import psycopg  # psycopg3
+if TYPE_CHECKING:
+    import psycopg
 
-from .pipeline import full_rebuild
+_T0 = time.perf_counter()
+
+EXIT_OK = 0
+EXIT_IMPORT = 42        # jak dotychczasowy preflight w entrypoint.sh
+EXIT_CONFIG = 64        # EX_USAGE
+EXIT_DB_UNAVAILABLE = 69  # EX_UNAVAILABLE
+EXIT_REBUILD = 70       # EX_SOFTWARE
 
 # --- logowanie ---
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -34,6 +54,13 @@ class Config:
     db_name: str
     db_user: str
     db_password: str
+    # replika odczytu wejść (io_db.connect_read_db); puste host = wszystko na primary
+    db_read_host: str = ""
+    db_read_port: int = 0
+    db_read_name: str = ""
+    db_read_user: str = ""
+    db_read_password: str = ""
+    db_read_max_wait_sec: float = 5.0
 
 
 def _env_required(name: str) -> str:
@@ -75,6 +102,8 @@ def _dsn_from_cfg(cfg: Config) -> str:
 
 
 def _connect_listen(dsn: str) -> psycopg.Connection:
+    import psycopg
+
     conn = psycopg.connect(dsn)
     conn.autocommit = True  # wymagane przy LISTEN/NOTIFY
     return conn
@@ -87,29 +116,176 @@ def _listen_on(conn: psycopg.Connection, channels: List[str]) -> None:
             log.info("Listening on channel: %s", ch)
 
 
-def _rebuild(cfg: Config) -> None:
+def _trigger_lsn(cfg: Config, conn: psycopg.Connection) -> Optional[str]:
+    """LSN primary w chwili triggera — replika musi go odtworzyć przed odczytem wejść."""
+    if not cfg.db_read_host:
+        return None
+    from .io_db import primary_lsn
+
+    return primary_lsn(conn)
+
+
+def _rebuild(cfg: Config, export_store=None, read_lsn: Optional[str] = None) -> None:
+    from .pipeline import full_rebuild
+
     log.info("Rebuild started…")
-    full_rebuild(cfg)  # io_db.connect_db korzysta z cfg.db_*
+    result = full_rebuild(cfg, read_lsn=read_lsn)  # io_db.connect_db korzysta z cfg.db_*
     log.info("Rebuild finished.")
+    if export_store is not None:
+        try:
+            from .export_server import publish_result
 
+            publish_result(export_store, result)
+        except Exception as e:
+            log.exception("Export publish failed (DB results are intact): %s", e)
 
-def main():
-    # --- konfiguracja tylko z ENV (tick bez fallbacków) ---
-    notify_channels = [c.strip() for c in os.getenv("NOTIFY_CHANNELS", "ch_energy_rebuild").split(",") if c.strip()]
 
-    tick_env = _env_required("PERIODIC_TICK_SEC")  # brak -> wyjątek
+def _change_watcher(cfg: Config):
+    """Tick sterowany zmianami źródeł (changes.py); None przy CHANGE_DETECTION=0 — każdy tick to przebieg."""
+    from . import changes
+
+    if not changes.enabled():
+        return None
+    watcher = changes.ChangeWatcher(_dsn_from_cfg(cfg), cfg.tick_seconds)
+    log.info("Change detection: sources=%s interval=%g…%gs max_idle=%gs",
+             ",".join(watcher.schemas + watcher.tables), watcher.base_sec, watcher.max_sec, watcher.max_idle_sec)
+    return watcher
+
+
+def _watched_rebuild(cfg: Config, export_store, watcher, read_lsn: Optional[str] = None) -> None:
+    """Przebieg; sygnatura źródeł sprzed niego staje się bazą kolejnych ticków (po sukcesie)."""
+    sig = watcher.before_rebuild() if watcher is not None else None
+    ok = False
+    try:
+        _rebuild(cfg, export_store, read_lsn)
+        ok = True
+    finally:
+        if watcher is not None:
+            watcher.after_rebuild(sig, ok)
+
+
+def _start_export():
+    """Serwer eksportu Arrow tylko przy EXPORT_HTTP_PORT (bez importu pandas/pyarrow w przeciwnym razie)."""
+    if not os.getenv("EXPORT_HTTP_PORT", "").strip():
+        return None
+    from .export_server import start_from_env
+
+    return start_from_env()
+
+
+def run_once_enabled() -> bool:
+    return os.getenv("RUN_ONCE", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _ms() -> float:
+    return (time.perf_counter() - _T0) * 1000.0
+
+
+def _prefetch(module: str, errors: List[BaseException]) -> threading.Thread:
+    """Import ciężkich modułów w tle, gdy wątek główny czeka na bazę (libpq zwalnia GIL)."""
+    def run():
+        try:
+            importlib.import_module(module)
+        except BaseException as e:  # zgłaszane w preflight, z pełnym tracebackiem
+            errors.append(e)
+
+    t = threading.Thread(target=run, name=f"prefetch:{module}", daemon=True)
+    t.start()
+    return t
+
+
+def preflight(cfg: Config, check_db: bool) -> int:
+    """
+    Preflight w procesie workera (zamiast osobnego `python -` w entrypoint.sh):
+    import pipeline (w tle) + opcjonalnie pierwsze zapytanie do bazy. Zwraca kod wyjścia (0 = ok).
+    """
+    log.info("[preflight] python=%s cwd=%s sys.path[0:3]=%s",
+             sys.version.split()[0], os.getcwd(), sys.path[0:3])
+    errors: List[BaseException] = []
+    loader = _prefetch(f"{__package__}.pipeline", errors)
+    rc = EXIT_OK
+    if check_db:
+        try:
+            import psycopg
+
+            with psycopg.connect(_dsn_from_cfg(cfg), connect_timeout=10) as conn:
+                conn.execute("SELECT 1").fetchone()
+            log.info("[preflight] first DB query ok after %.0f ms", _ms())
+        except Exception as e:
+            log.error("[preflight] database unavailable: %s", e)
+            rc = EXIT_DB_UNAVAILABLE
+    loader.join()
+    if errors:
+        log.error("[preflight] import %s.pipeline FAILED — traceback below", __package__)
+        traceback.print_exception(errors[0])
+        return EXIT_IMPORT
+    log.info("[preflight] modules loaded after %.0f ms", _ms())
+    return rc
+
+
+def run_once(cfg: Config) -> int:
+    """Jeden przebieg (RUN_ONCE=1): preflight → rebuild → kod wyjścia."""
+    rc = preflight(cfg, check_db=True)
+    if rc != EXIT_OK:
+        return rc
+    try:
+        _rebuild(cfg, _start_export())
+    except Exception as e:
+        log.exception("Rebuild failed: %s", e)
+        return EXIT_REBUILD
+    log.info("Run-once finished in %.0f ms.", _ms())
+    return EXIT_OK
+
+
+def main() -> int:
+    once = run_once_enabled()
     try:
-        tick_s = float(tick_env)
-    except Exception:
-        raise RuntimeError(f"PERIODIC_TICK_SEC must be numeric seconds, got: {tick_env!r}")
+        cfg = _config_from_env(require_tick=not once)
+    except RuntimeError as e:
+        log.error("FATAL: %s", e)
+        return EXIT_CONFIG
+
+    # nagłówek
+    pyver = f"{os.sys.version_info.major}.{os.sys.version_info.minor}.{os.sys.version_info.micro}"
+    log.info("[entrypoint] starting energy-calc-6 worker… host=%s python=%s pid=%s mode=%s",
+             os.uname().nodename, pyver, os.getpid(), "run-once" if once else "loop")
+    if once:
+        return run_once(cfg)
+    log.info("Config: notify_channels=%s tick=%ss debounce=%ss log_level=%s",
+             ",".join(cfg.notify_channels), int(cfg.tick_seconds), cfg.debounce_seconds, LOG_LEVEL)
+    if cfg.db_read_host:
+        log.info("Config: read replica=%s (max wait %.1fs)", cfg.db_read_host, cfg.db_read_max_wait_sec)
+
+    rc = preflight(cfg, check_db=False)
+    if rc != EXIT_OK:
+        return rc
+    return _loop(cfg)
+
+
+def _config_from_env(require_tick: bool = True) -> Config:
+    # --- konfiguracja tylko z ENV (tick bez fallbacków; w trybie RUN_ONCE tick nieużywany) ---
+    notify_channels = [c.strip() for c in os.getenv("NOTIFY_CHANNELS", "ch_energy_rebuild").split(",") if c.strip()]
+
+    tick_s = 0.0
+    if require_tick:
+        tick_env = _env_required("PERIODIC_TICK_SEC")  # brak -> wyjątek
+        try:
+            tick_s = float(tick_env)
+        except Exception:
+            raise RuntimeError(f"PERIODIC_TICK_SEC must be numeric seconds, got: {tick_env!r}")
 
     # debounce: jeśli ma być też „bez fallbacków”, zastąp poniższą linię na _env_required("DEBOUNCE_SECONDS")
     debounce_s = float(os.getenv("DEBOUNCE_SECONDS", "2.0"))
 
     # DB env (PG* lub DB_*)
     db_host, db_port, db_name, db_user, db_password = _load_db_env()
+    try:
+        read_port = int(os.getenv("DB_READ_PORT", "0") or 0)
+        read_wait = float(os.getenv("DB_READ_MAX_WAIT_SEC", "5"))
+    except ValueError as e:
+        raise RuntimeError(f"DB_READ_PORT / DB_READ_MAX_WAIT_SEC must be numeric: {e}")
 
-    cfg = Config(
+    return Config(
         notify_channels=notify_channels,
         tick_seconds=tick_s,
         debounce_seconds=debounce_s,
@@ -119,34 +295,42 @@ def main():
         db_name=db_name,
         db_user=db_user,
         db_password=db_password,
+        db_read_host=os.getenv("DB_READ_HOST", "").strip(),
+        db_read_port=read_port,
+        db_read_name=os.getenv("DB_READ_NAME", ""),
+        db_read_user=os.getenv("DB_READ_USER", ""),
+        db_read_password=os.getenv("DB_READ_PASSWORD", ""),
+        db_read_max_wait_sec=read_wait,
     )
 
-    # nagłówek
-    pyver = f"{os.sys.version_info.major}.{os.sys.version_info.minor}.{os.sys.version_info.micro}"
-    log.info("[entrypoint] starting energy-calc-6 worker… host=%s python=%s pid=%s",
-             os.uname().nodename, pyver, os.getpid())
-    log.info("Config: notify_channels=%s tick=%ss debounce=%ss log_level=%s",
-             ",".join(notify_channels), int(tick_s), debounce_s, LOG_LEVEL)
+
+def _loop(cfg: Config) -> int:
+    # opcjonalny eksport Arrow IPC ostatniego przebiegu (EXPORT_HTTP_PORT)
+    export_store = _start_export()
 
     # połączenie do LISTEN/NOTIFY
     listen_conn: Optional[psycopg.Connection] = None
     try:
         dsn = _dsn_from_cfg(cfg)
         listen_conn = _connect_listen(dsn)
-        _listen_on(listen_conn, notify_channels)
+        _listen_on(listen_conn, cfg.notify_channels)
     except Exception as e:
         log.exception("Cannot set up LISTEN/NOTIFY (will run on tick only): %s", e)
         listen_conn = None
 
+    # tick sterowany zmianami (CHANGE_DETECTION): przebieg tylko po zmianie źródeł
+    watcher = _change_watcher(cfg)
+    interval = (lambda: watcher.interval) if watcher is not None else (lambda: cfg.tick_seconds)
+
     # 1) pierwszy przebieg na starcie (jeśli padnie – zostajemy w pętli i będziemy próbować dalej)
     try:
         log.info("Initial full rebuild…")
-        _rebuild(cfg)
+        _watched_rebuild(cfg, export_store, watcher)
     except Exception as e:
         log.exception("Error in initial rebuild (will keep running): %s", e)
 
     # 2) pętla: tick + triggery (natychmiastowy rebuild po debounce)
-    next_tick = time.monotonic() + cfg.tick_seconds
+    next_tick = time.monotonic() + interval()
 
     while True:
         try:
@@ -184,13 +368,14 @@ def main():
                             break
 
                     # NATYCHMIAST po debounce – przebuduj i kontynuuj pętlę
+                    # (LSN po debounce obejmuje zapisy wszystkich zebranych powiadomień)
                     log.info("Rebuild due to: trigger (immediate after debounce)…")
                     try:
-                        _rebuild(cfg)
+                        _watched_rebuild(cfg, export_store, watcher, _trigger_lsn(cfg, listen_conn))
                     except Exception as e:
                         log.exception("Fatal error in rebuild: %s", e)
                     # restart zegara ticku
-                    next_tick = time.monotonic() + cfg.tick_seconds
+                    next_tick = time.monotonic() + interval()
                     continue  # nowa iteracja (nie sprawdzaj już ticka teraz)
 
                 # brak triggerów w oknie wait_timeout – sprawdź tick poniżej
@@ -201,20 +386,25 @@ def main():
             # Tick okresowy?
             now = time.monotonic()
             if now >= next_tick:
-                log.info("Rebuild due to: tick…")
-                try:
-                    _rebuild(cfg)
-                except Exception as e:
-                    log.exception("Fatal error in rebuild: %s", e)
-                next_tick = time.monotonic() + cfg.tick_seconds
+                reason = watcher.poll() if watcher is not None else ""
+                if reason is not None:
+                    log.info("Rebuild due to: tick%s…", f" ({reason})" if reason else "")
+                    try:
+                        _watched_rebuild(cfg, export_store, watcher)
+                    except Exception as e:
+                        log.exception("Fatal error in rebuild: %s", e)
+                next_tick = time.monotonic() + interval()
 
         except KeyboardInterrupt:
             log.info("Interrupted. Bye.")
+            if watcher is not None:
+                watcher.close()
             break
         except Exception as e:
             log.exception("Loop error: %s", e)
             time.sleep(0.5)
+    return EXIT_OK
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
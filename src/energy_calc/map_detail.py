@@ -7,7 +7,7 @@ BROKER_COLS = [
     "req_ch_oze_mw","req_dis_oze_mw","req_ch_arbi_mw","req_dis_arbi_mw",
     "cap_ch_mw","cap_dis_mw","cap_contract_mw",
     "alloc_ch_oze_mw","alloc_dis_oze_mw","alloc_ch_arbi_mw","alloc_dis_arbi_mw",
-    "note",
+    "note","constraint_mask",
 ]
 
 OZE_COLS = [
@@ -30,6 +30,24 @@ ARBI_COLS = [
     "time_below_min_h","hit_part_cap_max","hit_part_cap_min",
 ]
 
+# model N-torowy: format długi, wiersz = (krok, tor); kolumny toru spoza rodzaju → NULL
+TRACKS_COLS = [
+    "track_id","kind",
+    "ts_start","ts_end","step_hours",
+    "soc_start_mwh","soc_end_mwh",
+    "p_ch_mw","p_dis_mw","e_ch_mwh","e_dis_mwh",
+    "loss_conv_mwh","loss_idle_mwh","loss_total_mwh",
+    "spill_surplus_mwh","unmet_deficit_mwh",
+    "price_pln_mwh","cost_pln","revenue_pln","net_value_pln",
+    "alloc_ch_mw","alloc_dis_mw",
+    "soc_gap_to_min_start_mwh","soc_gap_to_min_end_mwh",
+    "time_below_min_h","hit_part_cap_max","hit_part_cap_min",
+]
+
+
+# kolumny dopisywane do wyniku silników przez pipeline (nie przez silniki)
+TAG_COLS = ["sim_resolution"]  # rozdzielczość kroku symulacji (resample.py)
+
 
 def sanitize_types(df: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
     df = df.copy()
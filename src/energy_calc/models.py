@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -37,6 +37,30 @@ class TrackParams(BaseModel):
     soc_init_mwh: float = Field(0.0, description="Początkowy SOC [MWh]")
 
 
+class TrackSpec(BaseModel):
+    """
+    Tor w modelu N-torowym (klucz params.tracks): rodzaj sygnału, priorytet w brokerze, parametry SOC.
+    """
+    id: str = Field(..., description="Identyfikator toru (klucz w energy_tracks_detail)")
+    kind: str = Field(..., description="oze | arbi | reserve")
+    priority: int = Field(0, description="Kolejność alokacji mocy w brokerze (0 = pierwszy)")
+    tp: TrackParams
+    need_share: float = Field(1.0, description="oze: część delta_brutto obsługiwana przez tor [0..1]")
+    price_low: Optional[float] = Field(None, description="arbi: próg ładowania toru; None → progi globalne")
+    price_high: Optional[float] = Field(None, description="arbi: próg rozładowania toru; None → progi globalne")
+    charge_h: Optional[float] = Field(None, description="Czas pełnego ładowania toru [h]; None → moc całego BESS")
+    discharge_h: Optional[float] = Field(None, description="Czas pełnego rozładowania toru [h]; None → moc całego BESS")
+
+
+class StepSchedule(BaseModel):
+    """
+    Wielkość zmienna w czasie (params.schedules): `base` do pierwszej daty, potem `values[j]` od `starts[j]`.
+    """
+    base: float
+    starts: List[str] = Field(default_factory=list, description="Początki obowiązywania (ISO 8601, UTC)")
+    values: List[float] = Field(default_factory=list)
+
+
 class Params(BaseModel):
     """
     Zestaw parametrów do przebiegu.
@@ -50,6 +74,20 @@ class Params(BaseModel):
     arbi_price_low: Optional[float] = None
     arbi_price_high: Optional[float] = None
 
+    # Strategia progów ARBI: "fixed" (low/high wyżej) lub "rolling_quantile"
+    # (kwantyle ceny z okna kroczącego, liczone per krok).
+    arbi_threshold_mode: str = "fixed"
+    arbi_q_low_pct: float = 20.0
+    arbi_q_high_pct: float = 80.0
+    arbi_q_window_h: float = 24.0
+    arbi_q_min_samples: int = 1
+
+    # Model N-torowy (opcjonalny): pusta lista = tylko klasyczne tory OZE/ARBI
+    tracks: List[TrackSpec] = Field(default_factory=list)
+
+    # Harmonogramy (opcjonalne): nazwa wielkości silnika → wartości od dat (params/schedules.py)
+    schedules: Dict[str, StepSchedule] = Field(default_factory=dict)
+
     @property
     def emax(self) -> float:
         return self.bess.emax_mwh
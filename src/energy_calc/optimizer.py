@@ -0,0 +1,434 @@
+# src/energy_calc/optimizer.py
+"""
+Optymalizator progów i wielkości magazynu na szybkich kernelach (bez ramek, bez zapisu detali).
+
+Przeszukiwane (surowe klucze params.*): arbi_price_low, arbi_price_high, procent_arbitrazu, emax.
+Cel:
+  net — maksymalizacja zysku ARBI [PLN],
+  oze — minimalizacja spill + unmet toru OZE [MWh] (progi cenowe nie mają wpływu — stałe).
+Ograniczenia: low < high, opcjonalnie max_unmet / max_spill / min_net.
+
+Przebieg:
+  1. siatka zgrubna (GRID punktów na wymiar) w granicach,
+  2. wczesne odrzucanie: kandydaci liczeni najpierw na prefiksie danych (PRUNE_FRAC),
+     na całości tylko lepsza połowa,
+  3. zagęszczanie: siatka 3^d wokół TOP_K najlepszych z krokiem o połowę mniejszym, ROUNDS razy
+     (albo do wyczerpania budżetu czasu).
+Wspólne pośrednie wyniki liczone raz: Δt, tablice delta/ceny, progi kroczące (tryb rolling_quantile),
+wynik toru OZE per (emax, procent_arbitrazu).
+
+Wynik (optimum + wszystkie kandydaty policzone na całości, z flagą frontu Pareto net vs spill+unmet)
+trafia do output.energy_optimizer_result.
+
+Użycie:
+  python -m energy_calc.optimizer --objective net --low 100:400 --high 400:900 --share 0:80 --emax 5:40
+  python -m energy_calc.optimizer --input delta.parquet --params p.yaml --no-write   (bez bazy)
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .engines import kernels as K
+from .engines.thresholds import arbi_thresholds
+from .models import Params
+from .params.loader import params_from_dict
+from .params.schedules import SCHED_PREFIX, schedule_values, timestamps_ns
+
+log = logging.getLogger(__name__)
+
+DIMS = ("arbi_price_low", "arbi_price_high", "procent_arbitrazu", "emax")
+OBJECTIVES = ("net", "oze")
+TABLE = "energy_optimizer_result"
+
+
+@dataclass(frozen=True)
+class Bound:
+    lo: float
+    hi: float
+
+    @property
+    def fixed(self) -> bool:
+        return self.hi <= self.lo
+
+
+@dataclass
+class Constraints:
+    max_unmet_mwh: Optional[float] = None
+    max_spill_mwh: Optional[float] = None
+    min_net_pln: Optional[float] = None
+
+
+@dataclass
+class Candidate:
+    values: Dict[str, float]
+    net_pln: float = float("nan")
+    spill_mwh: float = float("nan")
+    unmet_mwh: float = float("nan")
+    score: float = float("-inf")
+    feasible: bool = False
+    round: int = 0
+    rows: int = 0
+    pareto: bool = False
+    note: Optional[str] = None
+
+
+@dataclass
+class OptimizeResult:
+    objective: str
+    best: Optional[Candidate]
+    frontier: List[Candidate]
+    evaluations: int
+    pruned: int
+    elapsed_s: float
+    rounds_done: int
+    run_id: str = field(default_factory=lambda: time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+                        + "-" + uuid.uuid4().hex[:8])
+
+
+# ---------- ewaluacja ----------
+
+def _load_kernels(backend: Optional[str]) -> Tuple[str, Callable, Callable]:
+    """(nazwa, oze_kernel, arbi_kernel): compiled → numpy (jak fallback rejestru backendów)."""
+    order = [backend] if backend else ["compiled", "numpy"]
+    for name in order:
+        try:
+            if name == "compiled":
+                from .engines import compiled as mod
+            elif name == "numpy":
+                from .engines import vectorized as mod
+            elif name == "events":
+                from .engines import events as mod
+            else:
+                raise ImportError(f"nieznany backend optymalizatora: {name}")
+            return name, mod.oze_kernel, mod.arbi_kernel
+        except ImportError as e:
+            log.warning("Optimizer backend %s unavailable: %s", name, e)
+    from .engines import vectorized as mod
+    return "numpy", mod.oze_kernel, mod.arbi_kernel
+
+
+class Evaluator:
+    """Kandydat → metryki; tablice wejścia i wyniki pośrednie liczone raz."""
+
+    def __init__(self, df: pd.DataFrame, base_raw: Dict[str, object], backend: Optional[str] = None):
+        self.base_raw = dict(base_raw)
+        ts = pd.to_datetime(df["ts_utc"])
+        self.n = len(df)
+        self.dt = K.step_hours(ts)
+        self.need = df["delta_brutto"].to_numpy(dtype=float)
+        self.price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+        self.backend, self._oze_kernel, self._arbi_kernel = _load_kernels(backend)
+        self._oze: Dict[Tuple[float, float, int], Tuple[float, float]] = {}
+        self._rolling: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._df = df
+        self._ts_ns: Optional[np.ndarray] = None  # dla harmonogramów (params.schedules)
+        self.evaluations = 0
+
+    def params(self, values: Dict[str, float]) -> Params:
+        return params_from_dict({**self.base_raw, **values}, verbose=False)
+
+    def _schedules(self, p: Params, n: int) -> Optional[pd.DataFrame]:
+        """Kolumny sched_* kandydata dla prefiksu n kroków (mnożniki liczone od jego wartości bazowych)."""
+        if not p.schedules:
+            return None
+        if self._ts_ns is None:
+            self._ts_ns = timestamps_ns(self._df["ts_utc"])
+        return pd.DataFrame({SCHED_PREFIX + k: schedule_values(v, self._ts_ns[:n]) for k, v in p.schedules.items()})
+
+    def _thresholds(self, p: Params, n: int, sched: Optional[pd.DataFrame] = None):
+        fixed_low, fixed_high = p.arbi_price_low, p.arbi_price_high
+        if sched is not None:
+            fixed_low = sched["sched_price_low"].to_numpy() if "sched_price_low" in sched else fixed_low
+            fixed_high = sched["sched_price_high"].to_numpy() if "sched_price_high" in sched else fixed_high
+        if p.arbi_threshold_mode != "rolling_quantile":
+            return fixed_low, fixed_high
+        if self._rolling is None:
+            # okno kroczące zależy tylko od cen i ustawień kwantyli — wspólne dla kandydatów;
+            # progi są przyczynowe, więc prefiks tablic = progi prefiksu danych.
+            # Warm-up (NaN) wypełniany progami stałymi kandydata.
+            bare = p.model_copy(update={"arbi_price_low": None, "arbi_price_high": None})
+            self._rolling = arbi_thresholds(self._df, bare)
+        lo, hi = self._rolling
+        lo = np.where(np.isnan(lo[:n]), fixed_low, lo[:n])
+        hi = np.where(np.isnan(hi[:n]), fixed_high, hi[:n])
+        return lo, hi
+
+    def evaluate(self, values: Dict[str, float], n: Optional[int] = None) -> Candidate:
+        n = self.n if n is None else n
+        cand = Candidate(values=dict(values), rows=n)
+        if values.get("arbi_price_low", -math.inf) >= values.get("arbi_price_high", math.inf):
+            cand.note = "low >= high"
+            return cand
+        try:
+            p = self.params(values)
+        except (ValueError, AssertionError) as e:
+            cand.note = f"params: {e}"
+            return cand
+        self.evaluations += 1
+        dt, need, price = self.dt[:n], self.need[:n], self.price[:n]
+        sched = self._schedules(p, n)
+
+        key = (float(values.get("emax", 0.0)), float(values.get("procent_arbitrazu", 0.0)), n)
+        if key not in self._oze:
+            r = self._oze_kernel(need, dt, K.track_steps(p.oze, sched))
+            self._oze[key] = (float(np.sum(r["spill"])), float(np.sum(r["unmet"])))
+        cand.spill_mwh, cand.unmet_mwh = self._oze[key]
+
+        lo, hi = self._thresholds(p, n, sched)
+        r = self._arbi_kernel(price, lo, hi, dt, K.track_steps(p.arbi, sched))
+        cand.net_pln = float(np.sum(r["revenue"]) - np.sum(r["cost"]))
+        return cand
+
+
+def _score(c: Candidate, objective: str, cons: Constraints) -> None:
+    if c.note:
+        return
+    c.feasible = not (
+        (cons.max_unmet_mwh is not None and c.unmet_mwh > cons.max_unmet_mwh)
+        or (cons.max_spill_mwh is not None and c.spill_mwh > cons.max_spill_mwh)
+        or (cons.min_net_pln is not None and c.net_pln < cons.min_net_pln)
+    )
+    c.score = c.net_pln if objective == "net" else -(c.spill_mwh + c.unmet_mwh)
+
+
+# ---------- przeszukiwanie ----------
+
+def _grid(bounds: Dict[str, Bound], points: int) -> List[Dict[str, float]]:
+    axes = [[b.lo] if b.fixed else list(np.linspace(b.lo, b.hi, points)) for b in bounds.values()]
+    return [dict(zip(bounds, map(float, combo))) for combo in itertools.product(*axes)]
+
+
+def _around(center: Dict[str, float], bounds: Dict[str, Bound], step: Dict[str, float]) -> List[Dict[str, float]]:
+    axes = []
+    for k, b in bounds.items():
+        if b.fixed:
+            axes.append([b.lo])
+        else:
+            axes.append(sorted({float(min(max(center[k] + d * step[k], b.lo), b.hi)) for d in (-1, 0, 1)}))
+    return [dict(zip(bounds, combo)) for combo in itertools.product(*axes)]
+
+
+def _key(values: Dict[str, float]) -> Tuple[float, ...]:
+    return tuple(round(values[k], 6) for k in sorted(values))
+
+
+def _mark_pareto(cands: List[Candidate]) -> None:
+    """Front Pareto (feasible): max net, min spill+unmet."""
+    pts = [(c, c.net_pln, c.spill_mwh + c.unmet_mwh) for c in cands if c.feasible]
+    pts.sort(key=lambda t: (-t[1], t[2]))
+    best_loss = math.inf
+    for c, _, loss in pts:
+        if loss < best_loss:
+            c.pareto = True
+            best_loss = loss
+
+
+def optimize(
+    ev: Evaluator,
+    bounds: Dict[str, Bound],
+    objective: str = "net",
+    constraints: Optional[Constraints] = None,
+    grid: int = 5,
+    rounds: int = 4,
+    top_k: int = 3,
+    prune_frac: float = 0.25,
+    budget_s: Optional[float] = None,
+) -> OptimizeResult:
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Nieznany cel {objective!r}; dozwolone: {', '.join(OBJECTIVES)}")
+    cons = constraints or Constraints()
+    if objective == "oze":
+        # progi cenowe nie wpływają na tor OZE — bez przeszukiwania
+        for k in ("arbi_price_low", "arbi_price_high"):
+            v = float(ev.base_raw[k])
+            bounds = {**bounds, k: Bound(v, v)}
+    t0 = time.perf_counter()
+    step = {k: (b.hi - b.lo) / max(1, grid - 1) for k, b in bounds.items()}
+    batch = _grid(bounds, grid)
+    seen: Dict[Tuple[float, ...], Candidate] = {}
+    pruned = 0
+    rounds_done = 0
+    n_prefix = int(ev.n * prune_frac) if 0.0 < prune_frac < 1.0 else ev.n
+
+    for rnd in range(rounds + 1):
+        todo = [v for v in batch if _key(v) not in seen]
+        # wczesne odrzucanie na prefiksie danych
+        if n_prefix < ev.n and len(todo) > 2 * top_k:
+            pre = [ev.evaluate(v, n_prefix) for v in todo]
+            for c in pre:
+                _score(c, objective, cons)
+            ok = sorted([c for c in pre if not c.note], key=lambda c: c.score, reverse=True)
+            keep = max(2 * top_k, len(ok) // 2)
+            pruned += len(todo) - min(keep, len(ok))
+            todo = [c.values for c in ok[:keep]]
+        for v in todo:
+            c = ev.evaluate(v)
+            c.round = rnd
+            _score(c, objective, cons)
+            seen[_key(v)] = c
+        rounds_done = rnd
+        ranked = sorted((c for c in seen.values() if c.feasible), key=lambda c: c.score, reverse=True)
+        log.info("Optimizer round %d | candidates=%d evaluated=%d pruned=%d | best score=%s",
+                 rnd, len(todo), ev.evaluations, pruned, f"{ranked[0].score:.2f}" if ranked else "-")
+        if budget_s is not None and time.perf_counter() - t0 > budget_s:
+            log.warning("Optimizer time budget %.0fs exhausted after round %d", budget_s, rnd)
+            break
+        if rnd == rounds or not ranked:
+            break
+        step = {k: s / 2.0 for k, s in step.items()}
+        batch = [v for c in ranked[:top_k] for v in _around(c.values, bounds, step)]
+
+    frontier = [c for c in seen.values() if not c.note]
+    _mark_pareto(frontier)
+    feasible = sorted((c for c in frontier if c.feasible), key=lambda c: c.score, reverse=True)
+    return OptimizeResult(
+        objective=objective, best=feasible[0] if feasible else None, frontier=frontier,
+        evaluations=ev.evaluations, pruned=pruned, elapsed_s=time.perf_counter() - t0, rounds_done=rounds_done,
+    )
+
+
+def default_bounds(df: pd.DataFrame, base_raw: Dict[str, object]) -> Dict[str, Bound]:
+    """Granice domyślne: progi z kwantyli cen (P5–P50 / P50–P95), udział 0–100 %, emax 0.5–2× bieżący."""
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    price = price[np.isfinite(price)]
+    p5, p50, p95 = (np.percentile(price, [5, 50, 95]) if len(price) else (0.0, 0.0, 0.0))
+    emax = float(base_raw["emax"])
+    return {
+        "arbi_price_low": Bound(float(p5), float(p50)),
+        "arbi_price_high": Bound(float(p50), float(p95)),
+        "procent_arbitrazu": Bound(0.0, 100.0),
+        "emax": Bound(0.5 * emax, 2.0 * emax),
+    }
+
+
+# ---------- zapis ----------
+
+def write_result(conn, res: OptimizeResult, schema: str = "output") -> None:
+    """Optimum i przeliczeni kandydaci → output.energy_optimizer_result (jeden run_id)."""
+    from .io_db import ensure_output_objects
+
+    ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+    cols = ["run_id", "candidate_no", "objective", "round", *DIMS,
+            "net_pln", "spill_mwh", "unmet_mwh", "score", "feasible", "pareto", "is_best"]
+    ranked = sorted(res.frontier, key=lambda c: c.score, reverse=True)
+    with conn.transaction(), conn.cursor() as cur:
+        with cur.copy(f"COPY {schema}.{TABLE} ({','.join(cols)}) FROM STDIN") as cp:
+            for i, c in enumerate(ranked):
+                cp.write_row((
+                    res.run_id, i, res.objective, c.round, *(c.values.get(k) for k in DIMS),
+                    c.net_pln, c.spill_mwh, c.unmet_mwh, c.score if math.isfinite(c.score) else None,
+                    c.feasible, c.pareto, c is res.best,
+                ))
+    log.info("Optimizer result %s written: %d candidates", res.run_id, len(ranked))
+
+
+def summary(res: OptimizeResult, backend: str) -> Dict[str, object]:
+    def cand(c: Optional[Candidate]):
+        if c is None:
+            return None
+        return {**{k: round(v, 4) for k, v in c.values.items()}, "net_pln": round(c.net_pln, 2),
+                "spill_mwh": round(c.spill_mwh, 3), "unmet_mwh": round(c.unmet_mwh, 3)}
+    return {
+        "run_id": res.run_id, "objective": res.objective, "backend": backend,
+        "best": cand(res.best), "evaluations": res.evaluations, "pruned": res.pruned,
+        "rounds": res.rounds_done, "pareto": sum(c.pareto for c in res.frontier),
+        "elapsed_s": round(res.elapsed_s, 3),
+    }
+
+
+# ---------- CLI ----------
+
+def _bound_arg(s: str) -> Bound:
+    lo, _, hi = s.partition(":")
+    return Bound(float(lo), float(hi or lo))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m energy_calc.optimizer", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--objective", choices=OBJECTIVES, default="net")
+    ap.add_argument("--low", type=_bound_arg, help="arbi_price_low: lo:hi albo wartość stała")
+    ap.add_argument("--high", type=_bound_arg, help="arbi_price_high: lo:hi")
+    ap.add_argument("--share", type=_bound_arg, help="procent_arbitrazu [%%]: lo:hi")
+    ap.add_argument("--emax", type=_bound_arg, help="emax [MWh]: lo:hi")
+    ap.add_argument("--max-unmet", type=float)
+    ap.add_argument("--max-spill", type=float)
+    ap.add_argument("--min-net", type=float)
+    ap.add_argument("--grid", type=int, default=5)
+    ap.add_argument("--rounds", type=int, default=4)
+    ap.add_argument("--top-k", type=int, default=3)
+    ap.add_argument("--prune-frac", type=float, default=0.25)
+    ap.add_argument("--budget-s", type=float, default=float(os.getenv("PERIODIC_TICK_SEC", "300")),
+                    help="budżet czasu (domyślnie PERIODIC_TICK_SEC)")
+    ap.add_argument("--backend", choices=("compiled", "numpy", "events"))
+    ap.add_argument("--input", help="delta_brutto z pliku (.parquet/.csv) zamiast z bazy")
+    ap.add_argument("--params", help="plik parametrów JSON/YAML zamiast params.*")
+    ap.add_argument("--no-write", action="store_true", help="nie zapisuj wyniku do bazy")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(
+        level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO),
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+        stream=sys.stderr,
+    )
+
+    # źródło parametrów i źródło wejścia wybierane niezależnie; baza tylko, gdy któreś z niej
+    conn = None
+    if not (args.input and args.params):
+        from .config import RunConfig
+        from .io_db import connect_db
+        from .main import _load_db_env
+
+        host, port, db, user, pwd = _load_db_env()
+        conn = connect_db(RunConfig(db_host=host, db_port=int(port), db_name=db, db_user=user, db_password=pwd))
+    if args.params:
+        from .params.loader import load_raw_params_file
+        raw = load_raw_params_file(args.params)
+    else:
+        from .params.loader import _merge_all_params
+        raw = _merge_all_params(conn)
+    if args.input:
+        from .batch import read_input
+        df = read_input(args.input)
+    else:
+        from .io_db import load_delta_brutto
+        df = load_delta_brutto(conn)
+    from .conditioning import prepare
+    df = prepare(df).df  # duplikaty / kolejność / luki jak w workerze (INPUT_*)
+
+    bounds = default_bounds(df, raw)
+    for k, b in (("arbi_price_low", args.low), ("arbi_price_high", args.high),
+                 ("procent_arbitrazu", args.share), ("emax", args.emax)):
+        if b is not None:
+            bounds[k] = b
+
+    ev = Evaluator(df, raw, backend=args.backend)
+    res = optimize(
+        ev, bounds, args.objective,
+        Constraints(args.max_unmet, args.max_spill, args.min_net),
+        grid=args.grid, rounds=args.rounds, top_k=args.top_k, prune_frac=args.prune_frac, budget_s=args.budget_s,
+    )
+    try:
+        if conn is not None and not args.no_write:
+            write_result(conn, res)
+    finally:
+        if conn is not None:
+            conn.close()
+    print(json.dumps(summary(res, ev.backend), ensure_ascii=False))
+    return 0 if res.best is not None else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
-from .loader import load_params
+from .loader import load_params, load_params_file, load_raw_params_file, params_from_dict
+from .schedules import expand_schedules
 from ..models import BessParams, TrackParams, Params
 
-__all__ = ["load_params", "BessParams", "TrackParams", "Params"]
+__all__ = ["load_params", "load_params_file", "load_raw_params_file", "params_from_dict", "expand_schedules",
+           "BessParams", "TrackParams", "Params"]
@@ -1,10 +1,12 @@
 # src/energy_calc/params/loader.py
 from __future__ import annotations
 
+import json
 import logging
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Tuple
 
-from ..models import Params, BessParams, TrackParams
+from ..models import Params, BessParams, TrackParams, TrackSpec
+from .schedules import SCHEDULABLE_KEYS, build_schedules
 
 log = logging.getLogger(__name__)
 
@@ -128,10 +130,121 @@ def _num(d: Dict[str, Any], key: str) -> float:
             raise ValueError(f"Wartość pod '{key}' nie jest liczbą: {val!r}")
 
 
+def _num_opt(d: Dict[str, Any], key: str, default: float) -> float:
+    """Jak `_num`, ale brak klucza (lub NULL) → `default`."""
+    if key not in d or d[key] is None:
+        return default
+    return _num(d, key)
+
+
+_THRESHOLD_MODES = ("fixed", "rolling_quantile")
+_TRACK_KINDS = ("oze", "arbi", "reserve")
+
+
+def _build_tracks(raw: Any, bess: BessParams, soc_start_pct: float) -> List[TrackSpec]:
+    """
+    Klucz `tracks` (lista obiektów albo tekst JSON) → tory modelu N-torowego.
+    Pola toru: id, kind (oze|arbi|reserve), share_pct [% emax], opcjonalnie priority
+    (domyślnie kolejność na liście), need_share_pct (oze, domyślnie 100), price_low/price_high
+    (arbi; brak → progi globalne), soc_start_pct (domyślnie bess_soc_start), charge_h/discharge_h
+    (czas pełnego ładowania toru [h]; brak → moc całego BESS, jak w torach OZE/ARBI).
+    """
+    if raw is None or raw == "":
+        return []
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"'tracks' nie jest poprawnym JSON: {e}") from e
+    if not isinstance(raw, list):
+        raise ValueError(f"'tracks': oczekiwano listy torów, jest {type(raw).__name__}")
+
+    specs: List[TrackSpec] = []
+    for i, t in enumerate(raw):
+        if not isinstance(t, dict):
+            raise ValueError(f"'tracks'[{i}]: oczekiwano obiektu, jest {type(t).__name__}")
+        tid = str(t.get("id") or "").strip()
+        kind = str(t.get("kind") or "").strip().lower()
+        if not tid:
+            raise ValueError(f"'tracks'[{i}]: brak 'id'")
+        if kind not in _TRACK_KINDS:
+            raise ValueError(f"Tor {tid!r}: nieznany kind {kind!r}. Dozwolone: {', '.join(_TRACK_KINDS)}")
+        share = _num(t, "share_pct") / 100.0
+        if not 0.0 <= share <= 1.0:
+            raise ValueError(f"Tor {tid!r}: share_pct poza [0, 100]")
+        emax_t = share * bess.emax_mwh
+        t_ch = _num_opt(t, "charge_h", 0.0)
+        t_dis = _num_opt(t, "discharge_h", 0.0)
+        if t_ch < 0.0 or t_dis < 0.0:
+            raise ValueError(f"Tor {tid!r}: charge_h/discharge_h nie mogą być ujemne")
+        tp = TrackParams(
+            emax_mwh=emax_t,
+            c_rate_ch_mw=emax_t / t_ch if t_ch > 0.0 else bess.c_rate_ch_mw,
+            c_rate_dis_mw=emax_t / t_dis if t_dis > 0.0 else bess.c_rate_dis_mw,
+            eta_ch=bess.eta_ch,
+            eta_dis=bess.eta_dis,
+            self_discharge_per_h=bess.self_discharge_per_h,
+            soc_min_mwh=0.0,
+            soc_max_mwh=emax_t,
+            soc_init_mwh=_num_opt(t, "soc_start_pct", soc_start_pct) / 100.0 * emax_t,
+        )
+        specs.append(TrackSpec(
+            id=tid,
+            kind=kind,
+            priority=int(_num_opt(t, "priority", float(i))),
+            tp=tp,
+            need_share=_num_opt(t, "need_share_pct", 100.0) / 100.0,
+            price_low=_num(t, "price_low") if t.get("price_low") is not None else None,
+            price_high=_num(t, "price_high") if t.get("price_high") is not None else None,
+            charge_h=t_ch if t_ch > 0.0 else None,
+            discharge_h=t_dis if t_dis > 0.0 else None,
+        ))
+
+    ids = [s.id for s in specs]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"'tracks': zduplikowane id torów: {ids}")
+    total = sum(s.tp.emax_mwh for s in specs)
+    if total > bess.emax_mwh * (1.0 + 1e-9):
+        raise ValueError(f"'tracks': suma share_pct > 100 % ({100.0 * total / bess.emax_mwh:.3f} %)")
+    return specs
+
+
 def load_params(conn) -> Params:
     # 1) Zbierz wartości ze wszystkich tabel params.*
-    p = _merge_all_params(conn, schema="params")
+    return params_from_dict(_merge_all_params(conn, schema="params"))
+
 
+def load_params_file(path: str) -> Params:
+    """
+    Parametry z pliku JSON/YAML (bez bazy): płaski słownik z tymi samymi kluczami co tabele
+    params.* (emax, bess_c_rate_charge, …), te same przeliczenia co `load_params`.
+    Dopuszczalne zagnieżdżenie pod kluczem `params`.
+    """
+    return params_from_dict(load_raw_params_file(path))
+
+
+def load_raw_params_file(path: str) -> Dict[str, Any]:
+    """Surowy słownik kluczy params.* z pliku JSON/YAML (odpowiednik `_merge_all_params`)."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith((".yaml", ".yml")):
+        import yaml
+        raw = yaml.safe_load(text)
+    else:
+        raw = json.loads(text)
+    if isinstance(raw, dict) and isinstance(raw.get("params"), dict):
+        raw = raw["params"]
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: oczekiwano słownika parametrów, jest {type(raw).__name__}")
+    log.info("Params file %s: %d kluczy", path, len(raw))
+    return raw
+
+
+def params_from_dict(p: Dict[str, Any], verbose: bool = True) -> Params:
+    """
+    Surowe klucze params.* (jak w bazie) → Params; przeliczenia jednostek i walidacja.
+    `verbose=False` — bez logu diagnostycznego (wiele kandydatów w optymalizatorze).
+    """
     # 2) WYMAGANE KLUCZE (dokładnie takie nazwy jak w bazie)
     #    UWAGA: czasy ładowania/rozładowania podawane są w GODZINACH [h],
     #           nie jako C-rate. Przeliczenia niżej.
@@ -149,8 +262,23 @@ def load_params(conn) -> Params:
     soc_min_pct        = _num(p, "bess_min_soc")             # [% całego BESS]
     soc_max_pct        = _num(p, "bess_max_soc")             # [% całego BESS]
 
+    # OPCJONALNE: adaptacyjne progi ARBI (kwantyle ceny z okna kroczącego)
+    threshold_mode     = str(p.get("arbi_threshold_mode") or "fixed").strip().lower()
+    q_low_pct          = _num_opt(p, "arbi_q_low", 20.0)           # [%] np. P20
+    q_high_pct         = _num_opt(p, "arbi_q_high", 80.0)          # [%] np. P80
+    q_window_h         = _num_opt(p, "arbi_q_window_h", 24.0)      # [h] okno kroczące
+    q_min_samples      = int(_num_opt(p, "arbi_q_min_samples", 1.0))
+
     if t_ch_h <= 0.0 or t_dis_h <= 0.0:
         raise ValueError("Czasy 'bess_c_rate_charge' i 'bess_c_rate_discharge' muszą być > 0 h.")
+    if threshold_mode not in _THRESHOLD_MODES:
+        raise ValueError(
+            f"Nieznany 'arbi_threshold_mode': {threshold_mode!r}. Dozwolone: {', '.join(_THRESHOLD_MODES)}"
+        )
+    if not (0.0 <= q_low_pct < q_high_pct <= 100.0):
+        raise ValueError(f"Wymagane 0 <= arbi_q_low < arbi_q_high <= 100, jest: {q_low_pct}, {q_high_pct}")
+    if q_window_h <= 0.0:
+        raise ValueError("'arbi_q_window_h' musi być > 0 h.")
 
     # 3) PRZELICZENIA (wyłącznie dozwolone konwersje jednostek)
     # sprawności w [0..1]
@@ -218,6 +346,9 @@ def load_params(conn) -> Params:
         soc_init_mwh=soc_init_arbi,
     )
 
+    tracks = _build_tracks(p.get("tracks"), bess, soc_start_pct)
+    schedules = build_schedules(p.get("schedules"), {k: _num(p, k) for k in SCHEDULABLE_KEYS})
+
     params = Params(
         bess=bess,
         share_oze=share_oze,
@@ -226,24 +357,42 @@ def load_params(conn) -> Params:
         moc_umowna_mw=moc_umowna,
         arbi_price_low=price_low,
         arbi_price_high=price_high,
+        arbi_threshold_mode=threshold_mode,
+        arbi_q_low_pct=q_low_pct,
+        arbi_q_high_pct=q_high_pct,
+        arbi_q_window_h=q_window_h,
+        arbi_q_min_samples=q_min_samples,
+        tracks=tracks,
+        schedules=schedules,
     )
 
     # 5) Log diagnostyczny (z podaniem czasu, c i mocy)
-    log.info(
+    (log.info if verbose else log.debug)(
         "Params ready: emax=%.3f, share_oze=%.3f | "
         "OZE[SOC min=%.3f,max=%.3f,init=%.3f] | "
         "ARBI[SOC min=%.3f,max=%.3f,init=%.3f] | "
         "czas[h](ch=%.3f,dis=%.3f) -> c[h^-1](ch=%.3f,dis=%.3f) -> P[MW](ch=%.3f,dis=%.3f) | "
         "eta[ch=%.3f,dis=%.3f] | self_dis/h=%.8f (z %.3f%%/mies.) | "
-        "price[low=%.2f,high=%.2f] | moc_umowna=%.3f MW",
+        "price[low=%.2f,high=%.2f,mode=%s] | moc_umowna=%.3f MW",
         params.emax, params.share_oze,
         params.oze.soc_min_mwh, params.oze.soc_max_mwh, params.oze.soc_init_mwh,
         params.arbi.soc_min_mwh, params.arbi.soc_max_mwh, params.arbi.soc_init_mwh,
         t_ch_h, t_dis_h, c_ch_h, c_dis_h, p_ch_mw, p_dis_mw,
         params.bess.eta_ch, params.bess.eta_dis,
         params.bess.self_discharge_per_h, lambda_month_pct,
-        price_low, price_high, moc_umowna
+        price_low, price_high, threshold_mode, moc_umowna
     )
+    if tracks:
+        (log.info if verbose else log.debug)(
+            "Tracks (N=%d): %s", len(tracks),
+            " | ".join(f"{t.id}[{t.kind},prio={t.priority},emax={t.tp.emax_mwh:.3f}]" for t in tracks),
+        )
+    if schedules:
+        (log.info if verbose else log.debug)(
+            "Schedules: %s", " | ".join(
+                f"{k}[base={v.base:.4g}; " + ", ".join(f"{t[:10]}→{x:.4g}" for t, x in zip(v.starts, v.values)) + "]"
+                for k, v in schedules.items()),
+        )
 
     # 6) Walidacja spójności
     assert params.bess.emax_mwh > 0.0
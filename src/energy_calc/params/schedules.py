@@ -0,0 +1,179 @@
+# src/energy_calc/params/schedules.py
+"""
+Harmonogramy parametrów (klucz `schedules` w params.*): wartości obowiązujące od daty.
+
+    {"emax": [{"from": "2027-01-01", "value": 9.5}, {"from": "2030-01-01", "value": 9.0}],
+     "klient_moc_umowna": [["2026-07-01T00:00:00+02:00", 4.5]]}
+
+Przed pierwszą datą obowiązuje wartość skalarna klucza (jak bez harmonogramu); data bez
+strefy = UTC. Obsługiwane klucze (te same jednostki co skalary): SCHEDULABLE_KEYS.
+
+Loader przelicza surowe klucze na wielkości silników (StepSchedule w Params.schedules):
+  emax_x, p_ch_x, p_dis_x — mnożniki pojemności i mocy względem wartości bazowych
+                            (tory skalują emax/soc_min/soc_max i C-rate),
+  eta_ch, eta_dis         — sprawności [0..1],
+  moc_umowna_mw, price_low, price_high — wartości bezwzględne.
+`expand_schedules` rozwija je raz (searchsorted po ts_utc) do kolumn `sched_*` ramki wejściowej;
+silniki czytają je jak `step_hours` — paczki trybu strumieniowego niosą swój wycinek.
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..models import StepSchedule
+
+SCHEDULABLE_KEYS = (
+    "emax", "bess_c_rate_charge", "bess_c_rate_discharge",
+    "bess_charge_eff", "bess_discharge_eff",
+    "klient_moc_umowna", "arbi_price_low", "arbi_price_high",
+)
+
+# wielkość silnika → (surowe klucze, z których wynika)
+DERIVED_INPUTS: Dict[str, Tuple[str, ...]] = {
+    "emax_x": ("emax",),
+    "p_ch_x": ("emax", "bess_c_rate_charge"),
+    "p_dis_x": ("emax", "bess_c_rate_discharge"),
+    "eta_ch": ("bess_charge_eff",),
+    "eta_dis": ("bess_discharge_eff",),
+    "moc_umowna_mw": ("klient_moc_umowna",),
+    "price_low": ("arbi_price_low",),
+    "price_high": ("arbi_price_high",),
+}
+
+SCHED_PREFIX = "sched_"
+
+Breakpoints = List[Tuple[datetime, float]]
+
+
+def _parse_from(v: Any, key: str) -> datetime:
+    try:
+        t = v if isinstance(v, datetime) else datetime.fromisoformat(str(v).strip())
+    except ValueError as e:
+        raise ValueError(f"schedules.{key}: niepoprawna data {v!r} (oczekiwano ISO 8601)") from e
+    return t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t.astimezone(timezone.utc)
+
+
+def _parse_value(v: Any, key: str) -> float:
+    try:
+        return float(str(v).replace(",", ".")) if isinstance(v, str) else float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"schedules.{key}: wartość nie jest liczbą: {v!r}")
+
+
+def _parse_entries(key: str, raw: Any) -> Breakpoints:
+    if not isinstance(raw, list) or not raw:
+        raise ValueError(f"schedules.{key}: oczekiwano niepustej listy {{from, value}}")
+    out: Breakpoints = []
+    for e in raw:
+        if isinstance(e, dict):
+            if "from" not in e or "value" not in e:
+                raise ValueError(f"schedules.{key}: wpis bez 'from'/'value': {e!r}")
+            t, v = e["from"], e["value"]
+        elif isinstance(e, (list, tuple)) and len(e) == 2:
+            t, v = e
+        else:
+            raise ValueError(f"schedules.{key}: niepoprawny wpis {e!r}")
+        out.append((_parse_from(t, key), _parse_value(v, key)))
+    starts = [t for t, _ in out]
+    if any(b <= a for a, b in zip(starts, starts[1:])):
+        raise ValueError(f"schedules.{key}: daty 'from' muszą być ściśle rosnące")
+    return out
+
+
+def _at(bp: Breakpoints, base: float) -> Callable[[datetime], float]:
+    """Funkcja schodkowa: wartość obowiązująca w chwili t (przed pierwszą datą → base)."""
+    def f(t: datetime) -> float:
+        v = base
+        for s, x in bp:
+            if s > t:
+                break
+            v = x
+        return v
+    return f
+
+
+def build_schedules(raw: Any, base: Dict[str, float]) -> Dict[str, StepSchedule]:
+    """
+    Klucz `schedules` (obiekt albo tekst JSON) → harmonogramy wielkości silników.
+    `base` — wartości skalarne surowych kluczy (SCHEDULABLE_KEYS) z params.*.
+    """
+    if raw is None or raw == "" or raw == {}:
+        return {}
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"'schedules' nie jest poprawnym JSON: {e}") from e
+    if not isinstance(raw, dict):
+        raise ValueError(f"'schedules': oczekiwano obiektu klucz → lista, jest {type(raw).__name__}")
+    unknown = sorted(set(raw) - set(SCHEDULABLE_KEYS))
+    if unknown:
+        raise ValueError(f"'schedules': nieobsługiwane klucze {unknown}. Dozwolone: {', '.join(SCHEDULABLE_KEYS)}")
+
+    bps = {k: _parse_entries(k, v) for k, v in raw.items()}
+    for k in ("emax", "bess_c_rate_charge", "bess_c_rate_discharge"):
+        if any(v <= 0.0 for _, v in bps.get(k, ())):
+            raise ValueError(f"schedules.{k}: wartości muszą być > 0")
+    for k in ("bess_charge_eff", "bess_discharge_eff"):
+        if any(not 0.0 < v <= 100.0 for _, v in bps.get(k, ())):
+            raise ValueError(f"schedules.{k}: sprawność poza (0, 100] %")
+
+    at = {k: _at(bps.get(k, []), base[k]) for k in SCHEDULABLE_KEYS}
+    derive: Dict[str, Callable[[datetime], float]] = {
+        "emax_x": lambda t: at["emax"](t) / base["emax"],
+        "p_ch_x": lambda t: (at["emax"](t) / at["bess_c_rate_charge"](t))
+                            / (base["emax"] / base["bess_c_rate_charge"]),
+        "p_dis_x": lambda t: (at["emax"](t) / at["bess_c_rate_discharge"](t))
+                             / (base["emax"] / base["bess_c_rate_discharge"]),
+        "eta_ch": lambda t: at["bess_charge_eff"](t) / 100.0,
+        "eta_dis": lambda t: at["bess_discharge_eff"](t) / 100.0,
+        "moc_umowna_mw": lambda t: at["klient_moc_umowna"](t),
+        "price_low": lambda t: at["arbi_price_low"](t),
+        "price_high": lambda t: at["arbi_price_high"](t),
+    }
+    before = datetime.min.replace(tzinfo=timezone.utc)
+    out: Dict[str, StepSchedule] = {}
+    for name, inputs in DERIVED_INPUTS.items():
+        if not any(k in bps for k in inputs):
+            continue
+        starts = sorted({t for k in inputs for t, _ in bps.get(k, ())})
+        out[name] = StepSchedule(
+            base=derive[name](before),
+            starts=[t.isoformat() for t in starts],
+            values=[derive[name](t) for t in starts],
+        )
+    return out
+
+
+def timestamps_ns(ts: pd.Series) -> np.ndarray:
+    """ts_utc → int64 ns UTC (kolumna bez strefy traktowana jako UTC)."""
+    ts = pd.to_datetime(ts)
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_convert("UTC").dt.tz_localize(None)
+    return ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def schedule_values(sched: StepSchedule, ts_ns: np.ndarray) -> np.ndarray:
+    """Wartości harmonogramu dla kroków o początkach `ts_ns` (wektorowo, searchsorted)."""
+    starts = pd.to_datetime(sched.starts, utc=True).tz_localize(None).to_numpy(dtype="datetime64[ns]")
+    vals = np.concatenate(([sched.base], np.asarray(sched.values, dtype=float)))
+    return vals[np.searchsorted(starts.astype(np.int64), ts_ns, side="right")]
+
+
+def expand_schedules(df: pd.DataFrame, params) -> pd.DataFrame:
+    """
+    Harmonogramy Params → kolumny `sched_<nazwa>` wyrównane z krokami `df` (kopia ramki).
+    Bez harmonogramów zwraca `df` bez zmian (silniki liczą na skalarach).
+    """
+    if not params.schedules or df.empty:
+        return df
+    ts_ns = timestamps_ns(df["ts_utc"])
+    out = df.copy()
+    for name, sched in params.schedules.items():
+        out[SCHED_PREFIX + name] = schedule_values(sched, ts_ns)
+    return out
@@ -1,44 +1,380 @@
 from __future__ import annotations
 import logging
+import os
+import time
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+import psycopg
 
 from .config import RunConfig
-from .io_db import connect_db as _open_conn, load_delta_brutto, truncate_details_v2, copy_details_v2
+from .detail_writer import write_details
+from .io_db import (
+    DETAIL_TABLES, connect_db as _open_conn, connect_read_db, ensure_output_objects, load_delta_brutto,
+    nonempty_details, primary_lsn, read_replica_configured, wait_for_replay,
+)
+from .models import Params
 from .params.loader import load_params
-from .engines import oze as oze_engine
-from .engines import arbi as arbi_engine
-from .engines import broker as broker_engine
+from .params.schedules import expand_schedules
+from .engines.broker import constraint_counts
+from .engines.registry import releases_gil, run_track
+from .engines.thresholds import arbi_thresholds
+from .util.dag import Task, run_dag, workers_from_env
+from .util.timing import StageTimer
+from . import conditioning
+from . import daymaps
+from . import resample
+from . import rollups
+from . import run_status
+from . import selective
 
 log = logging.getLogger(__name__)
 
 
-def full_rebuild(cfg: RunConfig) -> None:
-    with _open_conn(cfg) as conn:
-        log.info("Loading params…")
-        params = load_params(conn)
+@dataclass
+class RebuildResult:
+    """Wynik jednego przebiegu (to, co trafiło do output.energy_*_detail)."""
+    run_id: str
+    params: Params
+    df_broker: pd.DataFrame
+    df_oze: pd.DataFrame
+    df_arbi: pd.DataFrame
+    timings: Dict[str, float] = field(default_factory=dict)
+    input_fingerprint: Optional[str] = None
+    steps: Optional[conditioning.StepArrays] = None  # Δt i klucze kalendarza wejścia o tym odcisku
+    streamed: bool = False  # tryb strumieniowy: ramki puste, wynik tylko w DB
+    df_tracks: pd.DataFrame = field(default_factory=pd.DataFrame)  # model N-torowy (params.tracks)
+    resolution: str = resample.NATIVE  # krok symulacji (SIM_RESOLUTION / SIM_FINE_WINDOW_H)
+
+
+# Ostatni opublikowany przebieg (baza dla selektywnego przeliczenia w tym procesie)
+_LAST: Optional[RebuildResult] = None
+# Skrót ostatnio zapisanego raportu anomalii wejścia (conditioning.write_anomalies)
+_ANOMALY_KEY: Optional[str] = None
+
+
+def _report_anomalies(conn: psycopg.Connection, run_id: str, cond: conditioning.Conditioned) -> None:
+    """Raport anomalii do output.energy_input_anomalies — tylko przy zmianie; błąd nie przerywa przebiegu."""
+    global _ANOMALY_KEY
+    key = cond.key()
+    if key == _ANOMALY_KEY:
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (f"output.{conditioning.TABLE}",))
+            missing = cur.fetchone()[0] is None
+        if missing:
+            ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+        conditioning.write_anomalies(conn, run_id, cond.anomalies)
+        _ANOMALY_KEY = key
+    except psycopg.Error as e:
+        log.warning("Input anomaly report not written: %s", e)
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+
 
-        log.info("Loading delta_brutto…")
-        df = load_delta_brutto(conn)
+def detail_tasks(
+    df: pd.DataFrame,
+    params: Params,
+    stages: Iterable[str] = selective.STAGES,
+    prev: Optional[RebuildResult] = None,
+) -> List[Task]:
+    """
+    Etapy silników jako DAG: OZE i ARBI niezależne, broker po obu; model N-torowy (`tracks`)
+    niezależny od nich (pusta ramka, gdy params.tracks nie skonfigurowano).
+    OZE ∥ ARBI tylko przy backendach zwalniających GIL (registry.NOGIL_BACKENDS); przy `python`/`numpy`
+    wątki tylko by się przeplatały — ARBI czeka wtedy na OZE.
+    Etapy spoza `stages` biorą wynik z `prev` (selektywne przeliczenie).
+    Wiersze wyniku dostają kolumnę `sim_resolution` z wejścia (resample.py); tory OZE/ARBI
+    reużywają dni niezmienionych od poprzedniego przebiegu procesu (daymaps.py).
+    """
+    stages = set(stages)
+    if prev is None and stages != set(selective.STAGES):
+        raise ValueError("Częściowe przeliczenie wymaga poprzedniego wyniku (prev)")
+    df = expand_schedules(df, params)  # harmonogramy params.schedules → kolumny per krok (raz)
 
+    def oze() -> pd.DataFrame:
         log.info("Computing OZE…")
-        df_oze  = oze_engine.compute_oze_detail(df, params.oze)
+        return resample.tag(daymaps.run("oze", df, params.oze), df)
 
+    def arbi(**_) -> pd.DataFrame:
         log.info("Computing ARBI…")
-        df_arbi = arbi_engine.compute_arbi_detail(
-            df, params.arbi, params.arbi_price_low, params.arbi_price_high
-        )
+        price_low, price_high = arbi_thresholds(df, params)
+        return resample.tag(daymaps.run("arbi", df, params.arbi, price_low, price_high), df)
 
+    def broker(oze: pd.DataFrame, arbi: pd.DataFrame) -> pd.DataFrame:
         log.info("Broker merge…")
-        df_broker = broker_engine.compute_broker_detail(df, params, df_oze, df_arbi)
+        return resample.tag(run_track("broker", df, params, oze, arbi), df)
+
+    def tracks() -> pd.DataFrame:
+        if params.tracks:
+            log.info("Computing %d tracks…", len(params.tracks))
+        return resample.tag(run_track("tracks", df, params), df, repeat=len(params.tracks))
+
+    arbi_deps = () if releases_gil("oze", "arbi") else ("oze",)
+    fns = {"oze": (oze, ()), "arbi": (arbi, arbi_deps), "broker": (broker, ("oze", "arbi")), "tracks": (tracks, ())}
+    tasks = []
+    for name in selective.STAGES:
+        fn, deps = fns[name]
+        if name in stages:
+            tasks.append(Task(name, fn, deps))
+        else:
+            reused = getattr(prev, f"df_{name}")
+            tasks.append(Task(name, lambda reused=reused, **_: reused, deps, timed=False))
+    return tasks
+
+
+def compute_details(
+    df: pd.DataFrame,
+    params: Params,
+    timer: Optional[StageTimer] = None,
+    stages: Iterable[str] = selective.STAGES,
+    prev: Optional[RebuildResult] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Silniki OZE → ARBI → broker na danych w pamięci (bez DB). Zwraca (broker, oze, arbi).
+    Etapy spoza `stages` biorą wynik z `prev` (selektywne przeliczenie).
+    """
+    r = run_dag(detail_tasks(df, params, stages, prev), timer=timer)
+    return r["broker"], r["oze"], r["arbi"]
+
+
+def parallel_writes() -> bool:
+    """PIPELINE_PARALLEL_WRITES=1 — COPY każdej tabeli na osobnym połączeniu (patrz _write_tasks)."""
+    return os.getenv("PIPELINE_PARALLEL_WRITES", "0").strip().lower() in ("1", "true", "yes", "on")
 
-        log.info("Saving detail tables…")
-        truncate_details_v2(conn, schema="output")
-        copy_details_v2(conn, df_broker, df_oze, df_arbi, schema="output")
 
+def _write_tasks(cfg: RunConfig, conn: psycopg.Connection, stages: Set[str], rollup_tracks: List[str],
+                 stack: ExitStack,
+                 on_publish: Optional[Callable[[psycopg.Connection], None]] = None) -> List[Task]:
+    """
+    Etapy zapisu. Domyślnie jeden etap: detale + agregaty w jednej transakcji na `conn`.
+    Równolegle: każda tabela (i agregaty) na własnym połączeniu, z transakcją otwartą w `stack`
+    — zatwierdzane razem po sukcesie wszystkich zapisów, wycofywane razem przy błędzie
+    (commit kolejnych połączeń nie jest jednym atomowym commitem — okno rzędu milisekund).
+    `on_publish(conn)` — dodatkowe zapisy w transakcji publikacji (status przebiegu).
+    DDL obiektów output (CREATE OR REPLACE VIEW bierze ACCESS EXCLUSIVE na widoku do commitu)
+    idzie raz, w autocommit, przed transakcją zapisu — czytelnicy widoków nie czekają na zapis.
+    """
+    ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+    if not parallel_writes():
+        def write(broker, oze, arbi, tracks, rollups_df):
+            with conn.transaction():
+                # detale i agregaty publikowane w jednej transakcji
+                write_details(conn, {"broker": broker, "oze": oze, "arbi": arbi, "tracks": tracks},
+                              schema="output", tables=stages, ensure=False)
+                if rollup_tracks:
+                    rollups.write_rollups(conn, rollups_df, schema="output", tracks=rollup_tracks)
+                if on_publish is not None:
+                    on_publish(conn)
+        return [Task("write", write, ("broker", "oze", "arbi", "tracks", "rollups_df"))]
+
+    targets = [t for t in DETAIL_TABLES if t in stages] + (["rollups_df"] if rollup_tracks else [])
+    conns = {}
+    for t in targets:
+        c = stack.enter_context(_open_conn(cfg))
+        stack.enter_context(c.transaction())
+        conns[t] = c
+
+    def write_table(table: str):
+        def fn(**frames):
+            write_details(conns[table], {table: frames[table]}, schema="output", tables=[table], ensure=False)
+        return Task(f"write_{table}", fn, (table,))
+
+    tasks = [write_table(t) for t in DETAIL_TABLES if t in stages]
+    if rollup_tracks:
+        tasks.append(Task("write_rollups", lambda rollups_df: rollups.write_rollups(
+            conns["rollups_df"], rollups_df, schema="output", tracks=rollup_tracks), ("rollups_df",)))
+    if on_publish is not None:
+        # po wszystkich zapisach, na osobnym połączeniu zatwierdzanym razem z nimi
+        c = stack.enter_context(_open_conn(cfg))
+        stack.enter_context(c.transaction())
+        tasks.append(Task("write_status", lambda **_: on_publish(c), tuple(t.name for t in tasks), timed=False))
+    return tasks
+
+
+def _read_conns(cfg: RunConfig, conn: psycopg.Connection, stack: ExitStack, n: int,
+                read_lsn: Optional[str], timer: StageTimer) -> List[psycopg.Connection]:
+    """
+    `n` połączeń do ładowania wejść. Z repliką (DB_READ_HOST): połączenia do repliki, o ile
+    odtworzyła WAL do `read_lsn` (LSN primary z chwili NOTIFY; brak → bieżący) w ciągu
+    DB_READ_MAX_WAIT_SEC — inaczej primary. Pierwsze połączenie primary to `conn`.
+    """
+    def primary(i: int) -> psycopg.Connection:
+        return conn if i == 0 else stack.enter_context(_open_conn(cfg))
+
+    if not read_replica_configured(cfg):
+        return [primary(i) for i in range(n)]
+    lsn = read_lsn or primary_lsn(conn)
+    if lsn is None:
+        log.warning("Read replica skipped: primary WAL LSN unknown — loading inputs from primary")
+        return [primary(i) for i in range(n)]
+    out: List[psycopg.Connection] = []
+    try:
+        with timer.stage("replica_wait"):
+            for _ in range(n):
+                c = stack.enter_context(connect_read_db(cfg))
+                if not wait_for_replay(c, lsn, float(cfg.db_read_max_wait_sec)):
+                    break
+                out.append(c)
+    except psycopg.Error as e:
+        log.warning("Read replica unavailable (%s) — loading inputs from primary", e)
+    if len(out) < n:
+        log.info("Inputs loaded from primary (replica not caught up to %s)", lsn)
+        return [primary(i) for i in range(n)]
+    log.info("Inputs loaded from read replica (caught up to %s)", lsn)
+    return out
+
+
+def full_rebuild(cfg: RunConfig, read_lsn: Optional[str] = None) -> RebuildResult:
+    """
+    Przebieg: wejścia → silniki → publikacja. `read_lsn` — LSN primary z chwili triggera
+    (NOTIFY); replika odczytu musi go odtworzyć, zanim zostanie użyta (_read_conns).
+    """
+    global _LAST
+    run_id = new_run_id()
+    timer = StageTimer()
+    chunk_rows = 0
+    if os.getenv("STREAM_CHUNK_ROWS", "").strip():
+        from . import streaming  # tryb opcjonalny — import tylko, gdy włączony
+        chunk_rows = streaming.chunk_rows_from_env()
+    res = resample.resolution_from_env()
+    with _open_conn(cfg) as conn, ExitStack() as stack:
+        if chunk_rows:
+            # tryb strumieniowy czyta i zapisuje w jednej transakcji — całość na primary
+            log.info("Loading params…")
+            with timer.stage("load_params"):
+                params = load_params(conn)
+            log.info("Streaming rebuild (chunk=%d rows, resolution=%s)…", chunk_rows, res.rule or resample.NATIVE)
+            if params.tracks:
+                log.warning("Streaming rebuild does not compute the N-track model (params.tracks) — "
+                            "energy_tracks_detail left unchanged")
+            if res.fine_window_h > 0:
+                log.warning("Streaming rebuild ignores SIM_FINE_WINDOW_H — whole history at %s", res.rule)
+            run_id, stats = streaming.stream_rebuild(cfg, conn, params, chunk_rows, run_id, timer,
+                                                     resolution=res.rule)
+            if stats.conditioned is not None:
+                conditioning.log_report(stats.conditioned)
+                _report_anomalies(conn, run_id, stats.conditioned)
+            log.info(
+                "Done | run=%s | streamed chunks=%d rows=%d | OZE[e_ch=%.3f,e_dis=%.3f] "
+                "ARBI[e_ch=%.3f,e_dis=%.3f,net=%.2f PLN] | %s",
+                run_id, stats.chunks, stats.rows, stats.oze_e_ch, stats.oze_e_dis,
+                stats.arbi_e_ch, stats.arbi_e_dis, stats.arbi_net, timer.summary(),
+            )
+            # wynik nie jest w pamięci — kolejny przebieg w pamięci nie ma bazy do reużycia
+            _LAST = None
+            if os.getenv("ARCHIVE_DIR", "").strip():
+                log.info("Archive skipped: run %s was streamed (result only in the database)", run_id)
+            empty = pd.DataFrame()
+            return RebuildResult(
+                run_id=run_id, params=params, df_broker=empty, df_oze=empty, df_arbi=empty,
+                timings=dict(timer.timings), streamed=True, resolution=res.rule or resample.NATIVE,
+            )
+
+        if workers_from_env() == 1:
+            (src,) = _read_conns(cfg, conn, stack, 1, read_lsn, timer)
+            log.info("Loading params…")
+            with timer.stage("load_params"):
+                params = load_params(src)
+            log.info("Loading delta_brutto…")
+            with timer.stage("load_delta"):
+                df = load_delta_brutto(src)
+        else:
+            # params i delta_brutto równolegle (osobne połączenie dla delta)
+            conn_params, conn_delta = _read_conns(cfg, conn, stack, 2, read_lsn, timer)
+            log.info("Loading params and delta_brutto…")
+            loaded = run_dag([
+                Task("load_params", lambda: load_params(conn_params)),
+                Task("load_delta", lambda: load_delta_brutto(conn_delta)),
+            ], timer=timer)
+            params, df = loaded["load_params"], loaded["load_delta"]
+
+        raw_df = df  # capture: dokładnie to, co zwrócił load_delta_brutto
+        cond = conditioning.prepare(raw_df, res, timer)
+        df = cond.df
+        _report_anomalies(conn, run_id, cond)
+        fingerprint = selective.input_fingerprint(df)
+        steps = conditioning.step_arrays(df, fingerprint, _LAST.steps if _LAST is not None else None)
+        prev = _LAST if selective.enabled() else None
+        stages = selective.plan_stages(
+            prev.params if prev else None, prev.input_fingerprint if prev else None, params, fingerprint
+        )
+        if prev is not None and stages != set(selective.STAGES):
+            # reużywamy tabel z poprzedniego przebiegu — muszą nadal istnieć (np. po wipe DB)
+            reused = [t for t in selective.STAGES if t not in stages and len(getattr(prev, f"df_{t}"))]
+            lost = set(reused) - nonempty_details(conn, schema="output")
+            if lost:
+                log.info("Selective: output tables missing/empty (%s) → full recompute", ",".join(sorted(lost)))
+                stages = set(selective.STAGES)
+        if not stages:
+            log.info("Selective: params and input unchanged since run %s — nothing to recompute.", prev.run_id)
+            return prev
+        if prev is not None and stages != set(selective.STAGES):
+            log.info("Selective: recomputing %s (reusing %s from run %s)",
+                     ",".join(s for s in selective.STAGES if s in stages),
+                     ",".join(s for s in selective.STAGES if s not in stages), prev.run_id)
+
+        rollup_tracks = [t for t in rollups.TRACKS if t in stages]
+        run_status.start(conn, run_id, [s for s in selective.STAGES if s in stages], res.label)
+        try:
+            if run_status.enabled() and rollup_tracks:
+                with timer.stage("provisional"):
+                    run_status.publish_provisional(conn, run_id, df, params, rollup_tracks)
+            tasks = detail_tasks(conditioning.with_steps(df, steps), params, stages, prev) + [
+                Task("rollups_df", lambda oze, arbi: rollups.compute_rollups({"oze": oze, "arbi": arbi},
+                                                                             rollup_tracks, steps.calendar),
+                     ("oze", "arbi")),
+            ] + _write_tasks(cfg, conn, stages, rollup_tracks, stack,
+                             on_publish=lambda c: run_status.final(c, run_id, res.label))
+            log.info("Computing and saving detail tables (%s)…",
+                     "parallel writes" if parallel_writes() else "single transaction")
+            t0 = time.perf_counter()
+            r = run_dag(tasks, timer=timer)
+        except Exception as e:
+            run_status.failed(conn, run_id, e)
+            raise
+        df_broker, df_oze, df_arbi, df_tracks = r["broker"], r["oze"], r["arbi"], r["tracks"]
+        timer.timings["dag_wall"] = time.perf_counter() - t0
+
+        counts = constraint_counts(df_broker["constraint_mask"]) if len(df_broker) else {}
         log.info(
-            "Done | OZE[e_ch=%.3f,e_dis=%.3f] ARBI[e_ch=%.3f,e_dis=%.3f,net=%.2f PLN]",
+            "Done | run=%s | resolution=%s | OZE[e_ch=%.3f,e_dis=%.3f] ARBI[e_ch=%.3f,e_dis=%.3f,net=%.2f PLN] "
+            "| constraints[%s] | %s",
+            run_id, res.label,
             float(df_oze["e_ch_mwh"].sum()),
             float(df_oze["e_dis_mwh"].sum()),
             float(df_arbi["e_ch_mwh"].sum()),
             float(df_arbi["e_dis_mwh"].sum()),
             float(df_arbi["net_value_pln"].sum()),
+            ",".join(f"{k}={v}" for k, v in counts.items() if v),
+            timer.summary(),
         )
+
+    if os.getenv("CAPTURE_DIR", "").strip():
+        from . import capture
+        capture_dir = capture.capture_dir_from_env()
+        try:
+            capture.save_capture(capture.capture_path(capture_dir, run_id), params, raw_df, timer.timings, run_id,
+                                 resolution=res)
+        except Exception as e:
+            log.exception("Capture failed (rebuild results are intact): %s", e)
+
+    _LAST = RebuildResult(
+        run_id=run_id, params=params, df_broker=df_broker, df_oze=df_oze, df_arbi=df_arbi,
+        timings=dict(timer.timings), input_fingerprint=fingerprint, steps=steps, df_tracks=df_tracks,
+        resolution=res.label,
+    )
+    if os.getenv("ARCHIVE_DIR", "").strip():
+        from . import archive
+        archive_dir = archive.archive_dir_from_env()
+        try:
+            archive.save_run(archive_dir, _LAST)
+        except Exception as e:
+            log.exception("Archive failed (rebuild results are intact): %s", e)
+    return _LAST
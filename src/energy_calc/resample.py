@@ -0,0 +1,155 @@
+# src/energy_calc/resample.py
+"""
+Rozdzielczość symulacji: przepróbkowanie wejścia przed silnikami torów.
+
+  SIM_RESOLUTION=15min|1h|…   krok symulacji (stały alias pandas); puste/`native` = krok z delta_brutto,
+  SIM_FINE_WINDOW_H=48        ostatnie N godzin zostaje w rozdzielczości natywnej (planowanie zgrubnie,
+                              bieżące okno dokładnie) — jeden przebieg, SOC ciągły przez granicę.
+
+Kubełek = floor(ts_utc, krok) (w UTC); redukcje segmentowe (np.add.reduceat) na posortowanych tablicach:
+  delta_brutto  — suma energii w kubełku,
+  price_pln_mwh — średnia ważona energią |delta_brutto| (ceny NULL pomijane); kubełek bez energii →
+                  średnia ważona czasem kroków.
+Wiersze wyniku oznaczane kolumną `sim_resolution` (etykieta kroku: `15min`, `1h`, `native`).
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+log = logging.getLogger(__name__)
+
+NATIVE = "native"
+TAG_COL = "sim_resolution"
+
+
+@dataclass(frozen=True)
+class Resolution:
+    rule: Optional[str] = None     # alias pandas (np. "15min"); None = natywna
+    fine_window_h: float = 0.0     # ostatnie N godzin natywnie (0 = całość w `rule`)
+
+    @property
+    def label(self) -> str:
+        if self.rule is None:
+            return NATIVE
+        return self.rule if self.fine_window_h <= 0 else f"{self.rule}+{NATIVE}@{self.fine_window_h:g}h"
+
+
+def parse_rule(rule: Optional[str]) -> Optional[str]:
+    """Alias kroku → postać kanoniczna; tylko kroki stałej długości (min, h, D…)."""
+    rule = (rule or "").strip()
+    if not rule or rule.lower() == NATIVE:
+        return None
+    try:
+        off = pd.tseries.frequencies.to_offset(rule)
+    except ValueError as e:
+        raise ValueError(f"Nieznana rozdzielczość {rule!r} (np. 15min, 1h)") from e
+    if not isinstance(off, pd.offsets.Tick):
+        raise ValueError(f"Rozdzielczość {rule!r} nie ma stałej długości (dozwolone np. 15min, 1h, 1D)")
+    return rule
+
+
+def resolution_from_env() -> Resolution:
+    return Resolution(
+        rule=parse_rule(os.getenv("SIM_RESOLUTION")),
+        fine_window_h=max(0.0, float(os.getenv("SIM_FINE_WINDOW_H", "0") or 0)),
+    )
+
+
+def _buckets(ts: pd.Series, rule: str) -> pd.Series:
+    """floor(ts, rule) liczony w UTC (kolumna bez strefy traktowana jako UTC), strefa zachowana."""
+    if ts.dt.tz is None:
+        return ts.dt.floor(rule)
+    return ts.dt.tz_convert("UTC").dt.floor(rule).dt.tz_convert(ts.dt.tz)
+
+
+def resample_input(df: pd.DataFrame, rule: str) -> pd.DataFrame:
+    """Wejście (ts_utc, delta_brutto, price_pln_mwh; posortowane) → kroki `rule`, oznaczone `sim_resolution`."""
+    if df.empty:
+        out = df[["ts_utc", "delta_brutto", "price_pln_mwh"]].copy()
+        out[TAG_COL] = pd.Series(dtype=object)
+        return out
+    from .engines.kernels import step_hours
+
+    ts = pd.to_datetime(df["ts_utc"]).reset_index(drop=True)
+    bucket = _buckets(ts, rule)
+    b = bucket.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+
+    delta = df["delta_brutto"].to_numpy(dtype=float, na_value=np.nan)
+    price = df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)
+    has_price = ~np.isnan(price)
+    p0 = np.where(has_price, price, 0.0)
+    w_e = np.where(has_price, np.abs(np.nan_to_num(delta)), 0.0)
+    w_t = np.where(has_price, step_hours(ts), 0.0)
+
+    seg = lambda x: np.add.reduceat(x, starts)  # noqa: E731
+    e_w, t_w = seg(w_e), seg(w_t)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_out = np.where(e_w > 0, seg(w_e * p0) / e_w, seg(w_t * p0) / t_w)
+    p_out[seg(has_price.astype(float)) == 0] = np.nan
+
+    return pd.DataFrame({
+        "ts_utc": bucket.take(starts).reset_index(drop=True),
+        "delta_brutto": seg(np.nan_to_num(delta)),
+        "price_pln_mwh": p_out,
+        TAG_COL: rule,
+    })
+
+
+def apply_resolution(df: pd.DataFrame, res: Resolution) -> pd.DataFrame:
+    """
+    Wejście w rozdzielczości `res`: całość w `res.rule` albo — przy oknie dokładnym — wiersze od
+    granicy kubełka przed (koniec − fine_window_h) natywnie. Bez `rule` — `df` bez zmian.
+    """
+    if res.rule is None or df.empty:
+        return df
+    n0 = len(df)
+    if res.fine_window_h > 0:
+        ts = pd.to_datetime(df["ts_utc"])
+        cut = _buckets(pd.Series([ts.iloc[-1] - pd.Timedelta(hours=res.fine_window_h)]), res.rule).iloc[0]
+        fine = (ts >= cut).to_numpy()
+        coarse = resample_input(df[~fine], res.rule)
+        native = df.loc[fine, ["ts_utc", "delta_brutto", "price_pln_mwh"]].assign(**{TAG_COL: NATIVE})
+        out = pd.concat([coarse, native], ignore_index=True)
+    else:
+        out = resample_input(df, res.rule)
+    log.info("Resolution %s: rows %d → %d (×%.1f)", res.label, n0, len(out), n0 / max(len(out), 1))
+    return out
+
+
+def resample_chunks(chunks: Iterable[pd.DataFrame], rule: Optional[str]) -> Iterator[pd.DataFrame]:
+    """Paczki trybu strumieniowego w kroku `rule`; ostatni (być może niepełny) kubełek czeka na kolejną paczkę."""
+    if rule is None:
+        yield from chunks
+        return
+    carry: Optional[pd.DataFrame] = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        buf = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+        bucket = _buckets(pd.to_datetime(buf["ts_utc"]), rule)
+        last = (bucket == bucket.iloc[-1]).to_numpy()
+        carry = buf[last].reset_index(drop=True)
+        if (~last).any():
+            yield resample_input(buf[~last].reset_index(drop=True), rule)
+    if carry is not None and len(carry):
+        yield resample_input(carry, rule)
+
+
+def tag(out: pd.DataFrame, inp: pd.DataFrame, repeat: int = 1) -> pd.DataFrame:
+    """Kolumna `sim_resolution` wyniku silnika z wejścia (wiersz = krok; model N-torowy: `repeat` torów na krok)."""
+    if out.empty:
+        return out
+    labels = inp[TAG_COL].to_numpy() if TAG_COL in inp.columns else np.full(len(inp), NATIVE, dtype=object)
+    if repeat != 1:
+        labels = np.repeat(labels, repeat)
+    if len(labels) != len(out):
+        return out
+    out[TAG_COL] = labels
+    return out
@@ -0,0 +1,170 @@
+# src/energy_calc/rollups.py
+"""
+Agregaty torów liczone razem z wynikiem (output.energy_rollup): godzina / dzień / miesiąc.
+
+Kubełki po czasie ściennym ts_start (jak w kolumnach `timestamp without time zone`).
+Redukcje segmentowe na tablicach wyniku (np.add/minimum/maximum.reduceat) — bez groupby.
+Agregaty są łączne: sumy się dodają, min/max przez least/greatest, SOC końcowy z późniejszej
+części — dzięki temu tryb strumieniowy dopisuje paczki przez upsert, a kubełek przecięty
+granicą paczki składa się w bazie.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import psycopg
+
+log = logging.getLogger(__name__)
+
+TABLE = "energy_rollup"
+RESOLUTIONS = ("hour", "day", "month")
+TRACKS = ("oze", "arbi")
+
+SUM_COLS = [
+    "hours", "e_ch_mwh", "e_dis_mwh", "loss_conv_mwh", "loss_idle_mwh", "loss_total_mwh",
+    "spill_surplus_mwh", "unmet_deficit_mwh", "cost_pln", "revenue_pln", "net_value_pln",
+    "time_below_min_h",
+]
+COUNT_COLS = ["n_steps", "hit_cap_max_n", "hit_cap_min_n"]
+ROLLUP_COLS = (
+    ["resolution", "track", "bucket_start", "n_steps"] + SUM_COLS
+    + ["soc_start_mwh", "soc_min_mwh", "soc_max_mwh", "soc_end_mwh", "hit_cap_max_n", "hit_cap_min_n"]
+)
+
+# kolumna wyniku → kolumna agregatu (sumy); brak w torze → NULL
+_SUM_SRC = {
+    "hours": "step_hours", "e_ch_mwh": "e_ch_mwh", "e_dis_mwh": "e_dis_mwh",
+    "loss_conv_mwh": "loss_conv_mwh", "loss_idle_mwh": "loss_idle_mwh", "loss_total_mwh": "loss_total_mwh",
+    "spill_surplus_mwh": "spill_surplus_mwh", "unmet_deficit_mwh": "unmet_deficit_mwh",
+    "cost_pln": "cost_pln", "revenue_pln": "revenue_pln", "net_value_pln": "net_value_pln",
+    "time_below_min_h": "time_below_min_h",
+}
+
+
+def _bucket(ts: pd.Series, resolution: str) -> np.ndarray:
+    if resolution == "hour":
+        b = ts.dt.floor("h")
+    elif resolution == "day":
+        b = ts.dt.floor("D")
+    else:
+        b = ts.dt.to_period("M").dt.to_timestamp()
+    return b.to_numpy(dtype="datetime64[us]")
+
+
+def _wall_time(s: pd.Series) -> pd.Series:
+    ts = pd.to_datetime(s)
+    return ts.dt.tz_localize(None) if ts.dt.tz is not None else ts
+
+
+def calendar_keys(ts: pd.Series, resolutions: Iterable[str] = RESOLUTIONS) -> Dict[str, np.ndarray]:
+    """Kubełek (czas ścienny) każdego kroku w każdej rozdzielczości — klucze agregatów."""
+    wall = _wall_time(ts)
+    return {res: _bucket(wall, res) for res in resolutions}
+
+
+def track_rollups(df: pd.DataFrame, track: str, resolutions: Iterable[str] = RESOLUTIONS,
+                  calendar: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Agregaty jednego toru (wynik engines.* w kolejności czasu). `calendar` — klucze z
+    calendar_keys(ts wejścia) (conditioning.StepArrays), gdy wiersze wyniku odpowiadają krokom
+    posortowanego wejścia; inaczej liczone z ts_start.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=ROLLUP_COLS)
+    if calendar is not None and all(len(calendar.get(r, ())) == len(df) for r in resolutions):
+        keys = calendar
+    else:
+        ts = _wall_time(df["ts_start"])
+        if not ts.is_monotonic_increasing:
+            order = np.argsort(ts.to_numpy(), kind="stable")
+            df, ts = df.iloc[order].reset_index(drop=True), ts.iloc[order].reset_index(drop=True)
+        keys = calendar_keys(ts, resolutions)
+
+    soc_start = df["soc_start_mwh"].to_numpy(dtype=float)
+    soc_end = df["soc_end_mwh"].to_numpy(dtype=float)
+    soc_lo = np.minimum(soc_start, soc_end)
+    soc_hi = np.maximum(soc_start, soc_end)
+    hit_max = df["hit_part_cap_max"].to_numpy(dtype=bool).astype(np.int64)
+    hit_min = df["hit_part_cap_min"].to_numpy(dtype=bool).astype(np.int64)
+    sums = {c: df[src].to_numpy(dtype=float, na_value=np.nan) if src in df.columns else None
+            for c, src in _SUM_SRC.items()}
+
+    parts: List[pd.DataFrame] = []
+    for res in resolutions:
+        key = keys[res]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        ends = np.r_[starts[1:], len(key)] - 1
+        cols: Dict[str, object] = {
+            "resolution": res, "track": track, "bucket_start": key[starts],
+            "n_steps": ends - starts + 1,
+        }
+        for c, arr in sums.items():
+            digits = 2 if c.endswith("_pln") else 6
+            cols[c] = None if arr is None else np.round(np.add.reduceat(np.nan_to_num(arr), starts), digits)
+        cols["soc_start_mwh"] = soc_start[starts]
+        cols["soc_min_mwh"] = np.minimum.reduceat(soc_lo, starts)
+        cols["soc_max_mwh"] = np.maximum.reduceat(soc_hi, starts)
+        cols["soc_end_mwh"] = soc_end[ends]
+        cols["hit_cap_max_n"] = np.add.reduceat(hit_max, starts)
+        cols["hit_cap_min_n"] = np.add.reduceat(hit_min, starts)
+        parts.append(pd.DataFrame(cols))
+    return pd.concat(parts, ignore_index=True)[ROLLUP_COLS]
+
+
+def compute_rollups(frames: Dict[str, pd.DataFrame], tracks: Iterable[str] = TRACKS,
+                    calendar: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+    """Agregaty wskazanych torów: {"oze": df_oze, "arbi": df_arbi} → ramka w układzie energy_rollup."""
+    parts = [track_rollups(frames[t], t, calendar=calendar) for t in TRACKS if t in set(tracks)]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ROLLUP_COLS)
+
+
+def _merge_set() -> str:
+    rules = [f"{c} = r.{c} + EXCLUDED.{c}" for c in COUNT_COLS + SUM_COLS]
+    rules += [
+        "soc_min_mwh = LEAST(r.soc_min_mwh, EXCLUDED.soc_min_mwh)",
+        "soc_max_mwh = GREATEST(r.soc_max_mwh, EXCLUDED.soc_max_mwh)",
+        # paczki dopisywane w kolejności czasu: start z pierwszej, koniec z ostatniej
+        "soc_end_mwh = EXCLUDED.soc_end_mwh",
+    ]
+    return ", ".join(rules)
+
+
+def write_rollups(
+    conn: psycopg.Connection,
+    df: pd.DataFrame,
+    schema: str = "output",
+    tracks: Iterable[str] = TRACKS,
+    replace: bool = True,
+) -> None:
+    """
+    Zapis agregatów. `replace=True` — najpierw usuwa agregaty wskazanych torów (pełny przebieg);
+    `replace=False` — dopisuje/łączy z istniejącymi kubełkami (kolejne paczki trybu strumieniowego).
+    Wołane wewnątrz transakcji zapisu detali (tu tylko savepoint) — publikacja razem z detalami.
+    """
+    tracks = [t for t in TRACKS if t in set(tracks)]
+    fq = f"{schema}.{TABLE}"
+    cols = ",".join(ROLLUP_COLS)
+    with conn.transaction(), conn.cursor() as cur:
+        if replace:
+            cur.execute(f"DELETE FROM {fq} WHERE track = ANY(%s)", (tracks,))
+        if df.empty:
+            return
+        cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS _stage_rollup (LIKE {fq}) ON COMMIT DELETE ROWS")
+        with cur.copy(f"COPY _stage_rollup ({cols}) FROM STDIN WITH (FORMAT CSV)") as cp:
+            df[ROLLUP_COLS].to_csv(cp, index=False, header=False)
+        cur.execute(
+            f"INSERT INTO {fq} AS r ({cols}) SELECT {cols} FROM _stage_rollup "
+            f"ON CONFLICT (resolution, track, bucket_start) DO UPDATE SET {_merge_set()}"
+        )
+        cur.execute("TRUNCATE _stage_rollup")
+    log.info("Rollups written | tracks=%s rows=%d (%s)", ",".join(tracks), len(df),
+             ", ".join(f"{r}={int((df['resolution'] == r).sum())}" for r in RESOLUTIONS))
+
+
+def clear_rollups(conn: psycopg.Connection, schema: str = "output", delete: bool = False) -> None:
+    """`delete=True` — DELETE zamiast TRUNCATE (długa transakcja: czytelnicy widzą stare agregaty)."""
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {schema}.{TABLE}" if delete else f"TRUNCATE {schema}.{TABLE}")
@@ -0,0 +1,197 @@
+# src/energy_calc/run_status.py
+"""
+Status przebiegów w pamięci (output.energy_run_status) i publikacja dwufazowa.
+
+Fazy przebiegu:
+  running     — start przeliczenia,
+  provisional — energy_rollup zawiera wynik zgrubny (PROGRESSIVE_RESOLUTION), detale jeszcze stare,
+  final       — detale i agregaty dokładne; ustawiane w transakcji zapisu (razem z danymi),
+  failed      — przebieg przerwany błędem; agregaty sprzed fazy `provisional` przywrócone.
+
+Publikacja dwufazowa (PROGRESSIVE_PUBLISH=1): przed pełnym przeliczeniem tory OZE i ARBI są
+liczone na wejściu przepróbkowanym do PROGRESSIVE_RESOLUTION (domyślnie 1h) i ich agregaty
+(KPI dzienne, trajektoria SOC) trafiają do energy_rollup w jednej transakcji ze statusem
+`provisional`. Wynik dokładny zastępuje je atomowo w transakcji zapisu detali.
+Nadpisywane agregaty dokładne trafiają w tej samej transakcji do energy_rollup_prev — przy
+błędzie przebiegu `failed()` przywraca je razem ze statusem.
+
+Retencja tabeli statusu jak archiwum: ARCHIVE_KEEP_RUNS najnowszych (domyślnie 30, 0 = bez
+limitu), opcjonalnie ARCHIVE_KEEP_DAYS; bieżący przebieg zostaje zawsze.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import List, Optional
+
+import pandas as pd
+import psycopg
+
+from .io_db import ensure_output_objects
+from .models import Params
+from .params.schedules import expand_schedules
+from .engines.registry import releases_gil, run_track
+from .engines.thresholds import arbi_thresholds
+from .util.dag import Task, run_dag
+from . import resample
+from . import rollups
+
+log = logging.getLogger(__name__)
+
+TABLE = "energy_run_status"
+PREV_TABLE = "energy_rollup_prev"
+
+
+def enabled() -> bool:
+    """PROGRESSIVE_PUBLISH (domyślnie wyłączone)."""
+    return os.getenv("PROGRESSIVE_PUBLISH", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def provisional_rule() -> str:
+    return resample.parse_rule(os.getenv("PROGRESSIVE_RESOLUTION", "1h")) or "1h"
+
+
+def _ensure(conn: psycopg.Connection, schema: str, table: str) -> None:
+    """Obiekty output tworzone przy pierwszym użyciu tabeli (po wipe DB / starsza baza)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (f"{schema}.{table}",))
+        missing = cur.fetchone()[0] is None
+    if missing:
+        ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+
+
+def start(conn: psycopg.Connection, run_id: str, stages: List[str], resolution: str,
+          schema: str = "output") -> None:
+    """Nowy przebieg (`running`) + retencja starszych wierszy statusu."""
+    _ensure(conn, schema, TABLE)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"INSERT INTO {schema}.{TABLE} (run_id, phase, resolution, stages) VALUES (%s, 'running', %s, %s)",
+            (run_id, resolution, ",".join(stages)),
+        )
+    prune(conn, run_id, schema=schema)
+
+
+def prune(conn: psycopg.Connection, run_id: str, keep_runs: Optional[int] = None,
+          keep_days: Optional[float] = None, schema: str = "output") -> int:
+    """Retencja wierszy statusu (ARCHIVE_KEEP_RUNS / ARCHIVE_KEEP_DAYS); `run_id` zostaje. Zwraca liczbę usuniętych."""
+    keep_runs = int(os.getenv("ARCHIVE_KEEP_RUNS", "30") or 0) if keep_runs is None else keep_runs
+    keep_days = float(os.getenv("ARCHIVE_KEEP_DAYS", "0") or 0) if keep_days is None else keep_days
+    conds, args = [], []
+    if keep_runs > 0:
+        conds.append(f"run_id NOT IN (SELECT run_id FROM {schema}.{TABLE} ORDER BY started_at DESC LIMIT %s)")
+        args.append(keep_runs)
+    if keep_days > 0:
+        conds.append("started_at < now() - make_interval(secs => %s)")
+        args.append(keep_days * 86400.0)
+    if not conds:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {schema}.{TABLE} WHERE run_id <> %s AND ({' OR '.join(conds)})",
+                    [run_id] + args)
+        n = cur.rowcount
+    if n:
+        log.info("Run status retention: removed %d row(s)", n)
+    return n
+
+
+def _set_phase(conn: psycopg.Connection, run_id: str, phase: str, column: Optional[str] = None,
+               resolution: Optional[str] = None, error: Optional[str] = None, schema: str = "output") -> None:
+    stamp = f"{column} = now(), " if column else ""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE {schema}.{TABLE} SET phase = %s, {stamp}updated_at = now(), "
+            "resolution = COALESCE(%s, resolution), error = COALESCE(%s, error) WHERE run_id = %s",
+            (phase, resolution, error, run_id),
+        )
+
+
+def provisional(conn: psycopg.Connection, run_id: str, resolution: str, schema: str = "output") -> None:
+    _set_phase(conn, run_id, "provisional", "provisional_at", resolution=resolution, schema=schema)
+
+
+def final(conn: psycopg.Connection, run_id: str, resolution: str, schema: str = "output") -> None:
+    """Status `final` w transakcji zapisu; kopia agregatów sprzed fazy zgrubnej przestaje być potrzebna."""
+    _set_phase(conn, run_id, "final", "final_at", resolution=resolution, schema=schema)
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {schema}.{PREV_TABLE} WHERE run_id = %s", (run_id,))
+
+
+def _restore_rollups(conn: psycopg.Connection, run_id: str, schema: str) -> int:
+    """Agregaty sprzed `provisional` tego przebiegu z powrotem w energy_rollup (0, gdy fazy nie było)."""
+    fq, prev = f"{schema}.{rollups.TABLE}", f"{schema}.{PREV_TABLE}"
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT stages FROM {schema}.{TABLE} WHERE run_id = %s AND provisional_at IS NOT NULL",
+                    (run_id,))
+        row = cur.fetchone()
+        if row is None:
+            return 0
+        # tory fazy zgrubnej = przeliczane tory agregatów (jak rollup_tracks w pipeline)
+        tracks = [t for t in rollups.TRACKS if t in (row[0] or "").split(",")]
+        cur.execute(f"DELETE FROM {fq} WHERE track = ANY(%s)", (tracks,))
+        cols = ", ".join(rollups.ROLLUP_COLS)
+        cur.execute(f"INSERT INTO {fq} ({cols}) SELECT {cols} FROM {prev} WHERE run_id = %s AND track = ANY(%s)",
+                    (run_id, tracks))
+        n = cur.rowcount
+        cur.execute(f"DELETE FROM {prev} WHERE run_id = %s", (run_id,))
+    return n
+
+
+def failed(conn: psycopg.Connection, run_id: str, error: BaseException, schema: str = "output") -> None:
+    """
+    Oznaczenie błędu i przywrócenie agregatów nadpisanych wynikiem zgrubnym (jedna transakcja)
+    — nie maskuje pierwotnego wyjątku (np. przy zerwanym połączeniu).
+    """
+    try:
+        with conn.transaction():
+            restored = _restore_rollups(conn, run_id, schema)
+            _set_phase(conn, run_id, "failed", error=f"{type(error).__name__}: {error}"[:2000],
+                       schema=schema)
+        if restored:
+            log.info("Run status: run %s failed — %d rollup rows restored from before provisional publish",
+                     run_id, restored)
+    except Exception as e:
+        log.warning("Run status: cannot mark run %s as failed: %s", run_id, e)
+
+
+def provisional_rollups(df: pd.DataFrame, params: Params, rule: str, tracks: List[str]) -> Optional[pd.DataFrame]:
+    """
+    Agregaty torów `tracks` (oze/arbi) z wejścia w kroku `rule`. None, gdy przepróbkowanie
+    nie skraca wejścia co najmniej dwukrotnie (wynik zgrubny nie byłby wyraźnie szybszy).
+    """
+    coarse = resample.resample_input(df, rule)
+    if df.empty or len(coarse) * 2 > len(df):
+        log.info("Provisional: skipped (rows %d → %d at %s)", len(df), len(coarse), rule)
+        return None
+    coarse = expand_schedules(coarse, params)
+    tasks = []
+    if "oze" in tracks:
+        tasks.append(Task("oze", lambda: run_track("oze", coarse, params.oze)))
+    if "arbi" in tracks:
+        tasks.append(Task("arbi", lambda: run_track("arbi", coarse, params.arbi, *arbi_thresholds(coarse, params))))
+    # tory w wątkach tylko przy backendach bez GIL (jak pipeline.detail_tasks)
+    return rollups.compute_rollups(run_dag(tasks, max_workers=None if releases_gil(*tracks) else 1), tracks)
+
+
+def publish_provisional(conn: psycopg.Connection, run_id: str, df: pd.DataFrame, params: Params,
+                        tracks: List[str], schema: str = "output") -> bool:
+    """Faza 1: agregaty zgrubne + status `provisional` w jednej transakcji. False, gdy pominięta."""
+    rule = provisional_rule()
+    t0 = time.perf_counter()
+    roll = provisional_rollups(df, params, rule, tracks)
+    if roll is None:
+        return False
+    _ensure(conn, schema, PREV_TABLE)
+    with conn.transaction():
+        # kopia nadpisywanych agregatów dokładnych — failed() przywraca ją przy błędzie przebiegu
+        with conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {schema}.{PREV_TABLE}")
+            cols = ", ".join(rollups.ROLLUP_COLS)
+            cur.execute(f"INSERT INTO {schema}.{PREV_TABLE} (run_id, {cols}) "
+                        f"SELECT %s, {cols} FROM {schema}.{rollups.TABLE} WHERE track = ANY(%s)", (run_id, tracks))
+        rollups.write_rollups(conn, roll, schema=schema, tracks=tracks)
+        provisional(conn, run_id, rule, schema=schema)
+    log.info("Provisional published | run=%s | resolution=%s | %d rollup rows in %.0f ms",
+             run_id, rule, len(roll), (time.perf_counter() - t0) * 1000.0)
+    return True
@@ -0,0 +1,91 @@
+# src/energy_calc/selective.py
+"""
+Selektywne przeliczenie: które etapy (i tabele) trzeba policzyć ponownie,
+gdy względem poprzedniego przebiegu zmieniła się tylko część Params.
+
+Zależności etapów od pól Params (top-level; zmiana dowolnego pola zagnieżdżonego
+modelu, np. `oze.eta_ch`, liczy się jako zmiana `oze`):
+  oze    ← oze
+  arbi   ← arbi + progi cenowe (stałe i rolling_quantile)
+  broker ← oze, arbi (C-rate), moc_umowna_mw + wyniki oze/arbi
+  tracks ← tracks (model N-torowy), moc_umowna_mw, progi globalne (tory arbi bez własnych progów)
+  schedules (harmonogramy parametrów) → wszystkie etapy
+Zmiana wejścia (odcisk delta_brutto) → wszystkie etapy.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .models import Params
+
+log = logging.getLogger(__name__)
+
+STAGES: Tuple[str, ...] = ("oze", "arbi", "broker", "tracks")
+
+STAGE_PARAM_DEPS: Dict[str, FrozenSet[str]] = {
+    "oze": frozenset({"oze", "schedules"}),
+    "arbi": frozenset({
+        "arbi", "arbi_price_low", "arbi_price_high", "arbi_threshold_mode",
+        "arbi_q_low_pct", "arbi_q_high_pct", "arbi_q_window_h", "arbi_q_min_samples", "schedules",
+    }),
+    "broker": frozenset({"oze", "arbi", "moc_umowna_mw", "schedules"}),
+    "tracks": frozenset({
+        "tracks", "schedules", "moc_umowna_mw", "arbi_price_low", "arbi_price_high", "arbi_threshold_mode",
+        "arbi_q_low_pct", "arbi_q_high_pct", "arbi_q_window_h", "arbi_q_min_samples",
+    }),
+}
+
+# etap → etapy, których wyniki konsumuje
+STAGE_UPSTREAM: Dict[str, Tuple[str, ...]] = {"broker": ("oze", "arbi")}
+
+
+def enabled() -> bool:
+    return os.getenv("SELECTIVE_RECOMPUTE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def input_fingerprint(df: pd.DataFrame) -> str:
+    """Odcisk wejścia (ts, delta, cena[, sim_resolution]) — zmiana dowolnej wartości zmienia odcisk."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(len(df)).encode())
+    if len(df):
+        ts = pd.to_datetime(df["ts_utc"])
+        h.update(str(ts.dt.tz).encode())
+        h.update(ts.to_numpy(dtype="datetime64[ns]").astype(np.int64).tobytes())
+        h.update(np.ascontiguousarray(df["delta_brutto"].to_numpy(dtype=float, na_value=np.nan)).tobytes())
+        h.update(np.ascontiguousarray(df["price_pln_mwh"].to_numpy(dtype=float, na_value=np.nan)).tobytes())
+        if "sim_resolution" in df.columns:  # etykiety rozdzielczości (resample.py) trafiają do wyniku
+            h.update(pd.util.hash_array(df["sim_resolution"].to_numpy(dtype=object)).tobytes())
+    return h.hexdigest()
+
+
+def params_diff(old: Params, new: Params) -> Set[str]:
+    """Nazwy pól top-level Params, które różnią się między przebiegami."""
+    a, b = old.model_dump(), new.model_dump()
+    return {k for k in set(a) | set(b) if a.get(k) != b.get(k)}
+
+
+def plan_stages(
+    prev_params: Optional[Params],
+    prev_fingerprint: Optional[str],
+    params: Params,
+    fingerprint: str,
+) -> Set[str]:
+    """Zbiór etapów do przeliczenia (pusty = nic się nie zmieniło)."""
+    if prev_params is None or prev_fingerprint != fingerprint:
+        return set(STAGES)
+    changed = params_diff(prev_params, params)
+    todo = {s for s in STAGES if STAGE_PARAM_DEPS[s] & changed}
+    # propagacja w dół: etap konsumujący zmieniony wynik też musi się przeliczyć
+    for s in STAGES:
+        if any(u in todo for u in STAGE_UPSTREAM.get(s, ())):
+            todo.add(s)
+    unknown = changed - set().union(*STAGE_PARAM_DEPS.values())
+    if unknown:
+        log.info("Selective: params changed without stage dependency (ignored): %s", ", ".join(sorted(unknown)))
+    return todo
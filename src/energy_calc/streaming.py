@@ -0,0 +1,304 @@
+# src/energy_calc/streaming.py
+"""
+Tryb strumieniowy przebiegu (STREAM_CHUNK_ROWS > 0): pamięć stała niezależnie od długości historii.
+
+  - wejście czytane kursorem po stronie serwera w paczkach po STREAM_CHUNK_ROWS wierszy,
+  - SOC obu torów przechodzi między paczkami (dokładny, niezaokrąglony — attrs["soc_end_exact"]),
+  - okno kwantyli progów ARBI (rolling_quantile) przechodzi między paczkami,
+  - ostatni wiersz paczki czeka na następną (Δt = ts następnego kroku − ts),
+    a Δt ostatniego kroku historii to mediana wszystkich Δt — jak w przebiegu w pamięci,
+  - broker liczony per paczka, wynik paczki od razu idzie COPY do output.energy_*_detail,
+  - wejście kondycjonowane paczkami (conditioning.ChunkConditioner — duplikaty i luki na granicy
+    paczek jak w całości; mediana Δt luk z pierwszej paczki, przy wznowieniu — z punktu kontrolnego,
+    a kotwicą luk jest ostatni wiersz wejścia przed punktem odczytu). Po wznowieniu raport anomalii
+    obejmuje część przeliczoną od wznowienia.
+
+Z punktami kontrolnymi (STREAM_CHECKPOINT=1, domyślnie) każda paczka jest zatwierdzana
+razem ze stanem w output.energy_rebuild_checkpoint — po awarii przebieg jest wznawiany
+od ostatniej paczki (checkpoint.py), o ile wejście do tej paczki się nie zmieniło
+(znacznik wejścia w punkcie kontrolnym); tabele detail są w trakcie przebiegu częściowe.
+Bez punktów kontrolnych zapis odbywa się w jednej transakcji (DELETE + COPY paczek; DDL
+przed nią): DELETE nie bierze ACCESS EXCLUSIVE, więc czytelnicy nie czekają i do COMMIT
+widzą stary komplet, po nim — nowy. Martwe wiersze sprząta autovacuum. Wynik nie jest trzymany w pamięci — eksport
+Arrow i selektywne przeliczenie dla takiego przebiegu są pomijane.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+import psycopg
+
+from . import checkpoint
+from . import conditioning
+from . import resample
+from . import rollups
+from .detail_writer import clear_blocks
+from .engines.registry import run_track
+from .engines.thresholds import arbi_thresholds, new_threshold_state
+from .io_db import (
+    connect_db, copy_details_v2, delete_details_v2, ensure_output_objects, iter_delta_brutto,
+    last_delta_before, truncate_details_v2,
+)
+from .models import Params
+from .params.schedules import expand_schedules
+from .util.rolling import TrailingQuantiles
+from .util.timing import StageTimer
+
+log = logging.getLogger(__name__)
+
+# tabele zapisywane strumieniowo (model N-torowy — energy_tracks_detail — tylko w przebiegu w pamięci)
+STREAMED_TABLES = ("broker", "oze", "arbi")
+
+Sink = Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame, "StreamState"], None]
+
+
+def chunk_rows_from_env() -> int:
+    """STREAM_CHUNK_ROWS: 0/puste = przebieg w pamięci (domyślnie)."""
+    v = os.getenv("STREAM_CHUNK_ROWS", "").strip()
+    return max(0, int(v)) if v else 0
+
+
+@dataclass
+class StreamState:
+    """Stan przechodzący między paczkami (zapisywany w punkcie kontrolnym) + sumy KPI."""
+    soc_oze: Optional[float] = None       # None = soc_init_mwh z params
+    soc_arbi: Optional[float] = None
+    last_ts: Optional[pd.Timestamp] = None  # ts ostatniego policzonego kroku
+    steps: Counter = field(default_factory=Counter)  # histogram Δt (mediana dla ostatniego kroku)
+    chunks: int = 0
+    rows: int = 0
+    oze_e_ch: float = 0.0
+    oze_e_dis: float = 0.0
+    arbi_e_ch: float = 0.0
+    arbi_e_dis: float = 0.0
+    arbi_net: float = 0.0
+    conditioned: Optional[conditioning.Conditioned] = None  # raport kondycjonowania paczek (poza punktem kontrolnym)
+
+    def add(self, df_oze: pd.DataFrame, df_arbi: pd.DataFrame) -> None:
+        self.chunks += 1
+        self.rows += len(df_oze)
+        self.oze_e_ch += float(df_oze["e_ch_mwh"].sum())
+        self.oze_e_dis += float(df_oze["e_dis_mwh"].sum())
+        self.arbi_e_ch += float(df_arbi["e_ch_mwh"].sum())
+        self.arbi_e_dis += float(df_arbi["e_dis_mwh"].sum())
+        self.arbi_net += float(df_arbi["net_value_pln"].sum())
+
+    _KPI = ("oze_e_ch", "oze_e_dis", "arbi_e_ch", "arbi_e_dis", "arbi_net")
+
+    def to_json(self) -> dict:
+        return {"steps": [[v, c] for v, c in sorted(self.steps.items())],
+                "kpi": {k: getattr(self, k) for k in self._KPI}}
+
+    @classmethod
+    def from_checkpoint(cls, ck: checkpoint.Checkpoint) -> "StreamState":
+        st = cls(soc_oze=ck.soc_oze_mwh, soc_arbi=ck.soc_arbi_mwh,
+                 last_ts=None if ck.last_ts is None else pd.Timestamp(ck.last_ts),
+                 steps=Counter({float(v): int(c) for v, c in ck.state.get("steps", [])}),
+                 chunks=ck.chunks_done, rows=ck.rows_done)
+        for k, v in ck.state.get("kpi", {}).items():
+            if k in cls._KPI:
+                setattr(st, k, float(v))
+        return st
+
+
+def _median(counts: Counter) -> float:
+    """Mediana wielozbioru (jak pandas.Series.median) — Δt mają zwykle kilka różnych wartości."""
+    n = sum(counts.values())
+    if n == 0:
+        return 1.0
+    lo_k, hi_k = (n - 1) // 2, n // 2
+    seen, lo_v = 0, None
+    for v in sorted(counts):
+        seen += counts[v]
+        if lo_v is None and seen > lo_k:
+            lo_v = v
+        if seen > hi_k:
+            return (lo_v + v) / 2.0
+    raise AssertionError("unreachable")
+
+
+def stream_details(
+    chunks: Iterable[pd.DataFrame],
+    params: Params,
+    sink: Sink,
+    timer: Optional[StageTimer] = None,
+    state: Optional[StreamState] = None,
+    q_state: Optional[TrailingQuantiles] = None,
+) -> StreamState:
+    """
+    Silniki OZE → ARBI → broker na kolejnych paczkach wejścia (ts_utc, delta_brutto, price_pln_mwh);
+    wynik każdej paczki trafia do `sink(broker, oze, arbi, stan po paczce)`. Bez DB — wejście
+    i wyjście dowolne. `state`/`q_state` pozwalają kontynuować przerwany przebieg.
+    """
+    timer = timer or StageTimer()
+    stats = state or StreamState()
+    tp_oze, tp_arbi = params.oze, params.arbi
+    if stats.soc_oze is not None:
+        tp_oze = tp_oze.model_copy(update={"soc_init_mwh": stats.soc_oze})
+    if stats.soc_arbi is not None:
+        tp_arbi = tp_arbi.model_copy(update={"soc_init_mwh": stats.soc_arbi})
+    q_state = q_state or new_threshold_state(params)
+    steps = stats.steps
+    carry: Optional[pd.DataFrame] = None
+
+    def run(part: pd.DataFrame) -> None:
+        nonlocal tp_oze, tp_arbi
+        part = expand_schedules(part, params)
+        with timer.stage("oze"):
+            df_oze = run_track("oze", part, tp_oze)
+        with timer.stage("arbi"):
+            price_low, price_high = arbi_thresholds(part, params, q_state)
+            df_arbi = run_track("arbi", part, tp_arbi, price_low, price_high)
+        with timer.stage("broker"):
+            df_broker = run_track("broker", part, params, df_oze, df_arbi)
+        for df in (df_broker, df_oze, df_arbi):
+            resample.tag(df, part)
+        stats.soc_oze = df_oze.attrs["soc_end_exact"]
+        stats.soc_arbi = df_arbi.attrs["soc_end_exact"]
+        stats.last_ts = pd.Timestamp(part["ts_utc"].iloc[-1])
+        stats.add(df_oze, df_arbi)
+        with timer.stage("write"):
+            sink(df_broker, df_oze, df_arbi, stats)
+        tp_oze = tp_oze.model_copy(update={"soc_init_mwh": stats.soc_oze})
+        tp_arbi = tp_arbi.model_copy(update={"soc_init_mwh": stats.soc_arbi})
+        log.info("Stream chunk %d | rows=%d (total %d) | soc[oze=%.3f, arbi=%.3f]",
+                 stats.chunks, len(part), stats.rows, tp_oze.soc_init_mwh, tp_arbi.soc_init_mwh)
+
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        buf = chunk if carry is None else pd.concat([carry, chunk], ignore_index=True)
+        buf = buf.reset_index(drop=True)
+        if len(buf) < 2:
+            carry = buf
+            continue
+        ts = pd.to_datetime(buf["ts_utc"])
+        step = (ts.shift(-1) - ts).dt.total_seconds().div(3600.0).iloc[:-1]
+        steps.update(step.dropna().tolist())
+        part = buf.iloc[:-1].copy()
+        part["step_hours"] = step.fillna(1e-9).clip(lower=1e-9).to_numpy()
+        carry = buf.iloc[-1:].reset_index(drop=True)
+        run(part)
+
+    if carry is not None:
+        part = carry.copy()
+        part["step_hours"] = max(_median(steps), 1e-9)
+        run(part)
+    return stats
+
+
+def _warm_thresholds(chunks: Iterable[pd.DataFrame], last_ts: pd.Timestamp, params: Params,
+                     q_state: Optional[TrailingQuantiles]) -> Iterator[pd.DataFrame]:
+    """
+    Wiersze do `last_ts` (już zapisane) tylko zasilają okno kwantyli; dalsze idą do silników.
+    Bez `q_state` — same pominięcie (po przepróbkowaniu wraca kubełek `last_ts` z niepełnej paczki).
+    """
+    for chunk in chunks:
+        ts = pd.to_datetime(chunk["ts_utc"])
+        done = (ts <= last_ts).to_numpy()
+        if done.any() and q_state is not None:
+            arbi_thresholds(chunk[done].reset_index(drop=True), params, q_state)
+        if not done.all():
+            yield chunk[~done].reset_index(drop=True)
+
+
+def _write_chunk_rollups(conn: psycopg.Connection, df_oze: pd.DataFrame, df_arbi: pd.DataFrame,
+                         schema: str) -> None:
+    """Agregaty paczki dołączane do kubełków z poprzednich paczek (upsert, patrz rollups.py)."""
+    rollups.write_rollups(conn, rollups.compute_rollups({"oze": df_oze, "arbi": df_arbi}),
+                          schema=schema, replace=False)
+
+
+def stream_rebuild(cfg, conn: psycopg.Connection, params: Params, chunk_rows: int, run_id: str,
+                   timer: Optional[StageTimer] = None, schema: str = "output",
+                   resolution: Optional[str] = None) -> Tuple[str, StreamState]:
+    """
+    Pełny przebieg strumieniowy: czyta output.delta_brutto osobnym połączeniem (kursor serwerowy),
+    zapisuje paczki przez `conn`. Zwraca (run_id — wznowionego przebiegu albo `run_id`, stan końcowy).
+    `resolution` — krok symulacji (resample.resample_chunks); wchodzi do skrótu punktu kontrolnego.
+    """
+    if not checkpoint.enabled():
+        def sink(df_broker, df_oze, df_arbi, state):
+            copy_details_v2(conn, df_broker, df_oze, df_arbi, schema=schema)
+            _write_chunk_rollups(conn, df_oze, df_arbi, schema)
+
+        # TRUNCATE trzymałby ACCESS EXCLUSIVE przez cały przebieg — DELETE (MVCC)
+        ensure_output_objects(conn, sql_dir=os.getenv("SQL_DIR", "/app/sql"))
+        cond = conditioning.ChunkConditioner()
+        with connect_db(cfg) as rconn, conn.transaction():
+            delete_details_v2(conn, schema=schema, tables=STREAMED_TABLES)
+            clear_blocks(conn, schema=schema, tables=STREAMED_TABLES)
+            rollups.clear_rollups(conn, schema=schema, delete=True)
+            chunks = resample.resample_chunks(cond(iter_delta_brutto(rconn, chunk_rows)), resolution)
+            state = stream_details(chunks, params, sink, timer)
+        state.conditioned = cond.report()
+        return run_id, state
+
+    p_hash = checkpoint.params_hash(params)
+    if resolution is not None:
+        p_hash += "@" + resolution
+    ck = checkpoint.load_running(conn, schema)
+    state: Optional[StreamState] = None
+    wm: Optional[dict] = None           # znacznik wejścia do state.last_ts
+    why = "params changed or no chunk committed"
+    if ck is not None and ck.params_hash == p_hash and ck.last_ts is not None:
+        wm = ck.state.get("input")
+        if wm is not None and checkpoint.input_watermark(conn, ck.last_ts) == wm:
+            run_id, state = ck.run_id, StreamState.from_checkpoint(ck)
+            log.info("Resuming streamed run %s after %s (chunks=%d rows=%d)",
+                     run_id, state.last_ts, state.chunks, state.rows)
+        else:
+            wm, why = None, "input up to the checkpoint changed"
+    if state is None:
+        if ck is not None:
+            log.info("Unfinished run %s not resumable (%s) → restart", ck.run_id, why)
+        with conn.transaction():
+            truncate_details_v2(conn, schema=schema, tables=STREAMED_TABLES)
+            clear_blocks(conn, schema=schema, tables=STREAMED_TABLES)
+            rollups.clear_rollups(conn, schema=schema)
+            checkpoint.start(conn, run_id, p_hash, schema)
+
+    wm_ts = None if state is None else state.last_ts.to_pydatetime()
+    q_state = new_threshold_state(params)
+    since = None
+    if state is not None:
+        # odczyt od last_ts (okno kwantyli ARBI — wcześniej); wiersze do last_ts tylko rozgrzewają
+        since = state.last_ts
+        if q_state is not None:
+            since -= pd.Timedelta(hours=params.arbi_q_window_h)
+    # mediana Δt luk stała w przebiegu, kotwica = ostatni wiersz wejścia przed odczytem (luka na granicy)
+    cond = conditioning.ChunkConditioner(
+        ck.state.get("input_median_ns") if state is not None else None,
+        anchor=last_delta_before(conn, since.to_pydatetime()) if since is not None else None,
+    )
+
+    def sink(df_broker, df_oze, df_arbi, st: StreamState) -> None:
+        nonlocal wm, wm_ts
+        last_ts = st.last_ts.to_pydatetime()
+        # paczka i jej punkt kontrolny zatwierdzane razem
+        with conn.transaction():
+            copy_details_v2(conn, df_broker, df_oze, df_arbi, schema=schema)
+            _write_chunk_rollups(conn, df_oze, df_arbi, schema)
+            wm = checkpoint.input_watermark(conn, last_ts, since=wm_ts, prev=wm)
+            checkpoint.save(conn, run_id, last_ts, st.chunks, st.rows,
+                            st.soc_oze, st.soc_arbi,
+                            {**st.to_json(), "input": wm, "input_median_ns": cond.median_ns}, schema)
+        wm_ts = last_ts
+
+    with connect_db(cfg) as rconn:
+        if state is None:
+            chunks = resample.resample_chunks(cond(iter_delta_brutto(rconn, chunk_rows)), resolution)
+        else:
+            # kroki do last_ts (też uzupełnione od kotwicy) już zapisane — tylko okno kwantyli
+            raw = cond(iter_delta_brutto(rconn, chunk_rows, since=since.to_pydatetime()))
+            chunks = _warm_thresholds(resample.resample_chunks(raw, resolution),
+                                      state.last_ts, params, q_state)
+        state = stream_details(chunks, params, sink, timer, state=state, q_state=q_state)
+    checkpoint.finish(conn, run_id, schema)
+    state.conditioned = cond.report()
+    return run_id, state
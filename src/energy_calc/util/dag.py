@@ -0,0 +1,100 @@
+"""
+Mały wykonawca DAG etapów na puli wątków.
+
+Etap startuje, gdy gotowe są wszystkie jego zależności; dostaje ich wyniki jako argumenty
+nazwane (nazwa zależności → wynik). Pierwszy błąd przerywa przebieg: etapy jeszcze
+nieuruchomione są anulowane, wyjątek jest rzucany dalej (po zakończeniu już działających).
+Równoległość daje się tam, gdzie etapy zwalniają GIL: I/O do bazy, kernele numby (nogil), numpy.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from .timing import StageTimer
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    timed: bool = True  # czas etapu trafia do StageTimer pod `name`
+
+
+def workers_from_env() -> int:
+    """PIPELINE_WORKERS: liczba wątków wykonawcy (1 = sekwencyjnie, w kolejności zależności)."""
+    return max(1, int(os.getenv("PIPELINE_WORKERS", "4")))
+
+
+def _check(tasks: Dict[str, Task], done: Iterable[str]) -> None:
+    known = set(tasks) | set(done)
+    for t in tasks.values():
+        missing = [d for d in t.deps if d not in known]
+        if missing:
+            raise ValueError(f"Etap {t.name!r}: nieznane zależności {missing}")
+    # cykl: sortowanie topologiczne musi objąć wszystkie etapy
+    ready, left = set(done), dict(tasks)
+    while left:
+        batch = [n for n, t in left.items() if all(d in ready for d in t.deps)]
+        if not batch:
+            raise ValueError(f"Cykl w DAG etapów: {sorted(left)}")
+        ready.update(batch)
+        for n in batch:
+            del left[n]
+
+
+def run_dag(
+    tasks: Iterable[Task],
+    max_workers: Optional[int] = None,
+    timer: Optional[StageTimer] = None,
+    results: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Wykonuje etapy; `results` — wyniki już dostępne (zależności spoza DAG). Zwraca wszystkie wyniki."""
+    by_name = {t.name: t for t in tasks}
+    results = dict(results or {})
+    _check(by_name, results)
+    timer = timer or StageTimer()
+    max_workers = max_workers or workers_from_env()
+
+    def call(t: Task) -> Any:
+        kwargs = {d: results[d] for d in t.deps}
+        if not t.timed:
+            return t.fn(**kwargs)
+        with timer.stage(t.name):
+            return t.fn(**kwargs)
+
+    pending = dict(by_name)
+    running: Dict[Future, Task] = {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        error: Optional[BaseException] = None
+        while pending or running:
+            if error is None:
+                for name in [n for n, t in pending.items() if all(d in results for d in t.deps)]:
+                    running[pool.submit(call, pending.pop(name))] = by_name[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                t = running.pop(fut)
+                try:
+                    results[t.name] = fut.result()
+                except BaseException as e:  # noqa: BLE001 — przekazujemy dalej pierwszy błąd
+                    if error is None:
+                        error = e
+                        log.error("Stage %s failed: %s — cancelling %d pending stage(s)",
+                                  t.name, e, len(pending))
+            if error is not None:
+                pending.clear()
+        if error is not None:
+            raise error
+    log.debug("DAG done in %.1f ms (%d stages, workers=%d)",
+              (time.perf_counter() - t0) * 1000, len(by_name), max_workers)
+    return results
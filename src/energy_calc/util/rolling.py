@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import heapq
+import math
+from collections import deque
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class RollingQuantile:
+    """
+    Kwantyl w przesuwanym oknie (dwa kopce + leniwe usuwanie).
+
+    `lo` (max-kopiec, wartości zanegowane) trzyma k+1 najmniejszych elementów,
+    `hi` (min-kopiec) resztę, gdzie k = floor(q * (n - 1)). add/remove kosztują
+    O(log w), odczyt wartości O(1) — bez sortowania okna przy każdym kroku.
+    Kwantyl liczony jak numpy.quantile(method="linear").
+    """
+
+    def __init__(self, q: float):
+        if not 0.0 <= q <= 1.0:
+            raise ValueError(f"Kwantyl musi być w [0, 1], jest: {q!r}")
+        self.q = float(q)
+        self._lo: List[float] = []
+        self._hi: List[float] = []
+        self._n_lo = 0
+        self._n_hi = 0
+        self._delayed: Dict[float, int] = {}
+        self._n_delayed = 0
+
+    def __len__(self) -> int:
+        return self._n_lo + self._n_hi
+
+    def add(self, x: float) -> None:
+        if not self._lo or x <= -self._lo[0]:
+            heapq.heappush(self._lo, -x)
+            self._n_lo += 1
+        else:
+            heapq.heappush(self._hi, x)
+            self._n_hi += 1
+        self._balance()
+
+    def remove(self, x: float) -> None:
+        """Usuwa wartość obecną w oknie (fizycznie dopiero, gdy wypłynie na szczyt kopca)."""
+        self._delayed[x] = self._delayed.get(x, 0) + 1
+        self._n_delayed += 1
+        if self._lo and x <= -self._lo[0]:
+            self._n_lo -= 1
+            if x == -self._lo[0]:
+                self._prune(self._lo, sign=-1.0)
+        else:
+            self._n_hi -= 1
+            if self._hi and x == self._hi[0]:
+                self._prune(self._hi, sign=1.0)
+        self._balance()
+        if self._n_delayed > 2 * len(self) + 64:
+            self._compact()
+
+    def value(self) -> float:
+        n = len(self)
+        if n == 0:
+            return math.nan
+        pos = self.q * (n - 1)
+        frac = pos - math.floor(pos)
+        v_lo = -self._lo[0]
+        if frac <= 0.0 or not self._n_hi:
+            return v_lo
+        return v_lo + frac * (self._hi[0] - v_lo)
+
+    # --- wewnętrzne ---
+
+    def _target_lo(self) -> int:
+        n = len(self)
+        return int(math.floor(self.q * (n - 1))) + 1 if n else 0
+
+    def _prune(self, heap: List[float], sign: float) -> None:
+        while heap:
+            v = sign * heap[0]
+            cnt = self._delayed.get(v, 0)
+            if not cnt:
+                break
+            if cnt == 1:
+                del self._delayed[v]
+            else:
+                self._delayed[v] = cnt - 1
+            self._n_delayed -= 1
+            heapq.heappop(heap)
+
+    def _balance(self) -> None:
+        target = self._target_lo()
+        while self._n_lo > target:
+            heapq.heappush(self._hi, -heapq.heappop(self._lo))
+            self._n_lo -= 1
+            self._n_hi += 1
+            self._prune(self._lo, sign=-1.0)
+        while self._n_lo < target:
+            heapq.heappush(self._lo, -heapq.heappop(self._hi))
+            self._n_lo += 1
+            self._n_hi -= 1
+            self._prune(self._hi, sign=1.0)
+
+    def _compact(self) -> None:
+        """Fizycznie usuwa zaległe (leniwie skasowane) elementy, gdy jest ich za dużo."""
+        pending = self._delayed
+
+        def _keep(heap: List[float], sign: float) -> List[float]:
+            # Dla równych wartości nie ma znaczenia, którą kopię wyrzucimy.
+            kept = []
+            for hv in heap:
+                v = sign * hv
+                if pending.get(v, 0):
+                    pending[v] -= 1
+                    continue
+                kept.append(hv)
+            return kept
+
+        self._lo = _keep(self._lo, -1.0)
+        self._hi = _keep(self._hi, 1.0)
+        heapq.heapify(self._lo)
+        heapq.heapify(self._hi)
+        self._n_lo = len(self._lo)
+        self._n_hi = len(self._hi)
+        self._delayed = {}
+        self._n_delayed = 0
+        self._balance()
+
+
+class TrailingQuantiles:
+    """
+    Kwantyle `qs` z wartości w oknie czasowym (t - window, t) — bez bieżącego kroku.
+
+    Stan (okno + kopce) przeżywa między wywołaniami `update`, więc szereg
+    można podawać w kawałkach (tryb strumieniowy) z tym samym wynikiem co całość.
+    NaN są pomijane; gdy w oknie jest < `min_samples` wartości, zwraca NaN.
+    """
+
+    def __init__(self, window_h: float, qs: Tuple[float, ...], min_samples: int = 1):
+        if window_h <= 0.0:
+            raise ValueError(f"Okno kwantyli musi być > 0 h, jest: {window_h!r}")
+        self.window_ns = int(round(window_h * 3600.0 * 1e9))
+        self.min_samples = max(1, int(min_samples))
+        self._qs = [RollingQuantile(q) for q in qs]
+        self._window: deque = deque()
+
+    def update(self, ts_ns: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, ...]:
+        ts_ns = np.asarray(ts_ns, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        n = len(values)
+        out = [np.full(n, np.nan) for _ in self._qs]
+        window = self._window
+        qs = self._qs
+        for i in range(n):
+            t = int(ts_ns[i])
+            horizon = t - self.window_ns
+            while window and window[0][0] <= horizon:
+                _, old = window.popleft()
+                for rq in qs:
+                    rq.remove(old)
+            if len(window) >= self.min_samples:
+                for j, rq in enumerate(qs):
+                    out[j][i] = rq.value()
+            v = float(values[i])
+            if v == v:  # pomijamy NaN
+                window.append((t, v))
+                for rq in qs:
+                    rq.add(v)
+        return tuple(out)
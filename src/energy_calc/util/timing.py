@@ -0,0 +1,22 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class StageTimer:
+    """Zbiera czasy etapów przebiegu [s] w kolejności wykonania."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - t0)
+
+    def summary(self) -> str:
+        return " ".join(f"{k}={v * 1000:.0f}ms" for k, v in self.timings.items())